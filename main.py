@@ -2,11 +2,18 @@
 Main entry point for training data generation
 """
 import os
+import asyncio
 import argparse
+import functools
 from pathlib import Path
 from dotenv import load_dotenv
 import yaml
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 from src.analyzer import RepositoryAnalyzer
 from src.llm_service import LLMService
 from src.qa_generator import QAGenerator
@@ -15,10 +22,45 @@ from src.data_processor import DataProcessor, DataValidator
 from src.schema import TrainingDataset
 
 
+@functools.lru_cache(maxsize=8)
 def load_config(config_path: str = "config/config.yaml"):
-    """Load configuration"""
-    with open(config_path, 'r') as f:
-        return yaml.safe_load(f)
+    """Load configuration (parsed once per path, with the libyaml loader when available)"""
+    with open(config_path, 'rb') as f:
+        return yaml.load(f, Loader=SafeLoader)
+
+
+async def generate_samples(args, config, analyzer, llm_service):
+    """Run the selected generation scenarios concurrently"""
+    qa_generator = None
+    scenarios = []
+    
+    if args.scenario in ['qa', 'both']:
+        qa_generator = QAGenerator(analyzer, llm_service)
+        scenarios.append(qa_generator.generate_qa_pairs_async(
+            num_samples=args.num_qa,
+            question_types=config['scenario1_qa']['question_types'],
+            batch_size=config['scenario1_qa'].get('batch_size', 1)
+        ))
+    
+    if args.scenario in ['design', 'both']:
+        design_generator = DesignSolutionGenerator(
+            analyzer, llm_service,
+            max_prompt_tokens=config['scenario2_design'].get('max_prompt_tokens', 4000)
+        )
+        scenarios.append(design_generator.generate_design_solutions_async(
+            num_samples=args.num_design,
+            requirement_types=config['scenario2_design']['requirement_types'],
+            batch_size=config['scenario2_design'].get('batch_size', 1)
+        ))
+    
+    try:
+        results = await asyncio.gather(*scenarios)
+    finally:
+        await llm_service.aclose()
+    
+    qa_pairs = results.pop(0) if qa_generator else []
+    design_solutions = results.pop(0) if results else []
+    return qa_generator, qa_pairs, design_solutions
 
 
 def main():
@@ -52,7 +94,11 @@ def main():
     print("STEP 1: Repository Analysis")
     print("="*70)
     
-    analyzer = RepositoryAnalyzer(args.repo_path)
+    analyzer = RepositoryAnalyzer(
+        args.repo_path,
+        cache_path=config['code_analysis'].get('cache_path'),
+        max_file_size=config['code_analysis'].get('max_file_size', 1024 * 1024)
+    )
     analyzer.analyze(languages=config['code_analysis']['languages'])
     
     summary = analyzer.export_summary()
@@ -74,7 +120,12 @@ def main():
         llm_service = LLMService(
             provider=llm_config['provider'],
             model=llm_config['model'],
-            temperature=llm_config['temperature']
+            temperature=llm_config['temperature'],
+            cache_path=llm_config.get('cache_path'),
+            max_concurrency=llm_config.get('max_concurrency', 4),
+            cache_seed=llm_config.get('cache_seed'),
+            requests_per_minute=llm_config.get('requests_per_minute'),
+            tokens_per_minute=llm_config.get('tokens_per_minute')
         )
         print(f"✅ LLM service initialized: {llm_config['provider']} - {llm_config['model']}")
         
@@ -83,7 +134,8 @@ def main():
         try:
             test_response = llm_service.generate_completion(
                 prompt="Return only the word 'OK'",
-                max_tokens=10
+                max_tokens=10,
+                use_cache=False
             )
             if test_response and len(test_response.strip()) > 0:
                 print(f"✅ API test successful: {test_response.strip()[:50]}")
@@ -113,18 +165,16 @@ def main():
         }
     )
     
-    # Step 3: Generate Q&A pairs (Scenario 1)
-    if args.scenario in ['qa', 'both']:
-        print("\n" + "="*70)
-        print("STEP 3: Scenario 1 - Q&A Generation")
-        print("="*70)
-        
-        qa_generator = QAGenerator(analyzer, llm_service)
-        qa_pairs = qa_generator.generate_qa_pairs(
-            num_samples=args.num_qa,
-            question_types=config['scenario1_qa']['question_types']
-        )
-        
+    # Step 3/4: Generate Q&A pairs (Scenario 1) and design solutions (Scenario 2) concurrently
+    print("\n" + "="*70)
+    print("STEP 3/4: Scenario Generation (Q&A + Design Solutions)")
+    print("="*70)
+    
+    qa_generator, qa_pairs, design_solutions = asyncio.run(
+        generate_samples(args, config, analyzer, llm_service)
+    )
+    
+    if qa_generator is not None:
         # Enhance with multi-context if enabled
         if config['scenario1_qa'].get('include_reasoning', True):
             qa_pairs = qa_generator.enhance_with_multi_context(qa_pairs)
@@ -134,18 +184,7 @@ def main():
         
         print(f"\n✅ Generated {len(qa_pairs)} Q&A pairs")
     
-    # Step 4: Generate design solutions (Scenario 2)
     if args.scenario in ['design', 'both']:
-        print("\n" + "="*70)
-        print("STEP 4: Scenario 2 - Design Solution Generation")
-        print("="*70)
-        
-        design_generator = DesignSolutionGenerator(analyzer, llm_service)
-        design_solutions = design_generator.generate_design_solutions(
-            num_samples=args.num_design,
-            requirement_types=config['scenario2_design']['requirement_types']
-        )
-        
         for solution in design_solutions:
             dataset.add_design_solution(solution)
         
@@ -175,6 +214,15 @@ def main():
         processor.export_to_jsonl(dataset.scenario2_data, "design_solutions.jsonl")
         processor.export_to_json(dataset.scenario2_data, "design_solutions.json")
     
+    # Parquet copies are for analytics only; a failure here must not stop the pipeline
+    for data, filename in ((dataset.scenario1_data, "qa_pairs.parquet"),
+                           (dataset.scenario2_data, "design_solutions.parquet")):
+        if data:
+            try:
+                processor.export_to_parquet(data, filename)
+            except Exception as e:
+                print(f"   ⚠️  Parquet export failed for {filename}: {e}")
+    
     # Export for fine-tuning
     if dataset.scenario1_data or dataset.scenario2_data:
         processor.export_for_finetuning(
@@ -198,11 +246,7 @@ def main():
         processor.export_to_jsonl(splits['test'], "test.jsonl")
     
     # Export report
-    import json
-    report_path = Path(args.output_dir) / "quality_report.json"
-    with open(report_path, 'w') as f:
-        json.dump(report, f, indent=2)
-    print(f"   💾 Quality report saved to {report_path}")
+    processor.export_report(report)
     
     # Final summary
     print("\n" + "="*70)
@@ -3,30 +3,108 @@ Code Repository Analyzer
 Analyzes code structure, patterns, and business logic
 """
 import os
+import re
 import ast
 import json
+import hashlib
+from functools import cached_property
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
-import git
+from typing import List, Dict, Any, Optional, Tuple, Callable
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
 from collections import defaultdict
 
+from src.analyzer_cache import AnalysisCache
+from src.file_walker import iter_code_files
 
-@dataclass
+# Bump when FunctionInfo/ClassInfo change shape so stale cache entries are ignored
+ANALYSIS_CACHE_VERSION = 3
+
+# Below this many files, pool start-up costs more than it saves
+PARALLEL_THRESHOLD = 50
+
+# Source file extensions for each supported language
+LANGUAGE_EXTENSIONS = {
+    'python': ['.py'],
+    'javascript': ['.js', '.jsx'],
+    'typescript': ['.ts', '.tsx'],
+    'java': ['.java']
+}
+
+# Files larger than this are usually vendored or minified and are skipped
+DEFAULT_MAX_FILE_SIZE = 1024 * 1024
+
+# Tech stack markers; within a category, earlier entries take priority
+_TECH_MARKERS = [
+    ('web_framework', 'Flask', ['from flask import', 'import flask']),
+    ('web_framework', 'Django', ['from django', 'import django']),
+    ('web_framework', 'FastAPI', ['from fastapi', 'import fastapi']),
+    ('frontend_framework', 'React', ['from react', 'import react']),
+    ('frontend_framework', 'Vue', ['from vue', 'import vue']),
+    ('database', 'MongoDB', ['pymongo']),
+    ('database', 'PostgreSQL', ['psycopg', 'postgresql']),
+    ('database', 'MySQL', ['mysql']),
+]
+
+# Class-name fragments that indicate a design pattern
+_CLASS_NAME_PATTERNS = [
+    ('factory', 'Factory Pattern'),
+    ('singleton', 'Singleton Pattern'),
+    ('observer', 'Observer Pattern'),
+    ('strategy', 'Strategy Pattern'),
+]
+
+# One case-insensitive pass per file; the lookahead lets overlapping markers all match
+_TECH_RE = re.compile(
+    '(?=' + '|'.join(
+        f'(?P<m{i}>' + '|'.join(re.escape(needle) for needle in needles) + ')'
+        for i, (_, _, needles) in enumerate(_TECH_MARKERS)
+    ) + ')',
+    re.IGNORECASE
+)
+
+
+# Lines taken from the top of a file when it is used as a whole-file example
+HEAD_SNIPPET_LINES = 50
+
+
+@dataclass(slots=True)
 class CodeFile:
     """Represents a code file"""
     path: str
     language: str
     content: str
     lines: int
+    sha256: str = field(default='', repr=False)
+    _lines: Optional[List[str]] = field(default=None, init=False, repr=False, compare=False)
+    _head: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    
+    @property
+    def lines_list(self) -> List[str]:
+        """Content split into lines (computed once per file)"""
+        if self._lines is None:
+            self._lines = self.content.split('\n')
+        return self._lines
+    
+    @property
+    def head_lines(self) -> int:
+        """Number of lines in head_snippet"""
+        return min(HEAD_SNIPPET_LINES, self.lines)
+    
+    @property
+    def head_snippet(self) -> str:
+        """First HEAD_SNIPPET_LINES lines (computed once per file, without splitting the rest)"""
+        if self._head is None:
+            self._head = '\n'.join(self.content.split('\n', HEAD_SNIPPET_LINES)[:HEAD_SNIPPET_LINES])
+        return self._head
     
     def get_snippet(self, start_line: int, end_line: int) -> str:
         """Get a code snippet"""
-        lines = self.content.split('\n')
-        return '\n'.join(lines[start_line-1:end_line])
+        return '\n'.join(self.lines_list[start_line-1:end_line])
 
 
-@dataclass
+@dataclass(slots=True)
 class FunctionInfo:
     """Represents a function/method"""
     name: str
@@ -35,11 +113,19 @@ class FunctionInfo:
     end_line: int
     docstring: Optional[str]
     parameters: List[str]
-    code: str
     complexity: int
+    # File the function came from; attached after parsing and never cached
+    source: Optional[CodeFile] = field(default=None, repr=False, compare=False)
+    
+    @property
+    def code(self) -> str:
+        """Function source, sliced from the parent file on demand"""
+        if self.source is None:
+            return ''
+        return self.source.get_snippet(self.start_line, self.end_line)
 
 
-@dataclass
+@dataclass(slots=True)
 class ClassInfo:
     """Represents a class"""
     name: str
@@ -51,21 +137,126 @@ class ClassInfo:
     base_classes: List[str]
 
 
+class _PythonCollector(ast.NodeVisitor):
+    """Collects functions and classes from a module in a single traversal"""
+    
+    def __init__(self, code_file: CodeFile):
+        self.code_file = code_file
+        self.functions: List[FunctionInfo] = []
+        self.classes: List[ClassInfo] = []
+        self._branches = 0
+        self._function_nodes: Dict[int, FunctionInfo] = {}
+    
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        info = self._function_info(node)
+        self.functions.append(info)
+        self._function_nodes[id(node)] = info
+        
+        # Complexity counts every branch node in the subtree (nested defs included)
+        branches_before = self._branches
+        self.generic_visit(node)
+        info.complexity = self._branches - branches_before
+    
+    def visit_ClassDef(self, node: ast.ClassDef):
+        info = ClassInfo(
+            name=node.name,
+            file_path=self.code_file.path,
+            start_line=node.lineno,
+            end_line=node.end_lineno if hasattr(node, 'end_lineno') else node.lineno + 10,
+            docstring=ast.get_docstring(node),
+            methods=[],
+            base_classes=[base.id for base in node.bases if isinstance(base, ast.Name)]
+        )
+        self.classes.append(info)
+        self.generic_visit(node)
+        
+        # Methods share the FunctionInfo already recorded for the module
+        info.methods.extend(
+            self._function_nodes[id(item)]
+            for item in node.body if isinstance(item, ast.FunctionDef)
+        )
+    
+    def _count_branch(self, node: ast.AST):
+        self._branches += 1
+        self.generic_visit(node)
+    
+    visit_If = visit_For = visit_While = visit_ExceptHandler = _count_branch
+    
+    def _function_info(self, node: ast.FunctionDef) -> FunctionInfo:
+        """Extract function information (complexity is filled in after the visit)"""
+        docstring = ast.get_docstring(node)
+        parameters = [arg.arg for arg in node.args.args]
+        
+        start_line = node.lineno
+        end_line = node.end_lineno if hasattr(node, 'end_lineno') else start_line + 10
+        
+        return FunctionInfo(
+            name=node.name,
+            file_path=self.code_file.path,
+            start_line=start_line,
+            end_line=end_line,
+            docstring=docstring,
+            parameters=parameters,
+            complexity=0
+        )
+
+
+def _parse_python(code_file: CodeFile) -> Tuple[List[FunctionInfo], List[ClassInfo]]:
+    """Parse one Python file (module-level so it can run in worker processes)"""
+    collector = _PythonCollector(code_file)
+    try:
+        collector.visit(ast.parse(code_file.content))
+    except SyntaxError:
+        pass
+    return collector.functions, collector.classes
+
+
 class RepositoryAnalyzer:
     """Analyzes a code repository"""
     
-    def __init__(self, repo_path: str):
+    def __init__(self, repo_path: str, cache_path: Optional[str] = None,
+                 max_file_size: int = DEFAULT_MAX_FILE_SIZE):
         self.repo_path = Path(repo_path)
-        self.repo = None
-        try:
-            self.repo = git.Repo(repo_path)
-        except:
-            pass
+        self.max_file_size = max_file_size
         
         self.code_files: List[CodeFile] = []
         self.functions: List[FunctionInfo] = []
         self.classes: List[ClassInfo] = []
         self.architecture: Dict[str, Any] = {}
+        
+        # Summary statistics, maintained while files are scanned
+        self._total_lines = 0
+        self._files_by_language: Dict[str, List[CodeFile]] = defaultdict(list)
+        self._files_by_path: Dict[str, CodeFile] = {}
+        self._directory_files: Dict[str, List[str]] = defaultdict(list)
+        
+        # Per-entry attributes of self.functions / self.classes, for vectorized filtering
+        self._function_complexities = np.zeros(0, dtype=np.int32)
+        self._class_has_docstring = np.zeros(0, dtype=bool)
+        
+        # search_many results per lowercased query (generators repeat the same keywords)
+        self._search_results: Dict[str, List[CodeFile]] = {}
+        
+        # Optional persistent cache of per-file parse results
+        self.cache = AnalysisCache(cache_path, version=ANALYSIS_CACHE_VERSION) if cache_path else None
+        
+        # Structure analyzers per language; each receives that language's files in one batch
+        self.language_analyzers: Dict[str, Callable[[List[CodeFile]], None]] = {
+            'python': self._analyze_python_files
+        }
+    
+    @cached_property
+    def repo(self):
+        """Git repository handle, or None if GitPython is missing or this is not a repository"""
+        try:
+            import git
+        except ImportError:
+            return None
+        
+        try:
+            return git.Repo(self.repo_path)
+        except (git.InvalidGitRepositoryError, git.NoSuchPathError):
+            return None
     
     def analyze(self, languages: List[str] = None):
         """Perform full repository analysis"""
@@ -73,15 +264,24 @@ class RepositoryAnalyzer:
             languages = ['python', 'javascript', 'java']
         
         print(f"📊 Analyzing repository: {self.repo_path}")
+        self._search_results.clear()
         
         # Scan files
         self._scan_files(languages)
         print(f"   Found {len(self.code_files)} code files")
         
         # Analyze code structure
-        for code_file in self.code_files:
-            if code_file.language == 'python':
-                self._analyze_python_file(code_file)
+        for language, files in self._files_by_language.items():
+            handler = self.language_analyzers.get(language)
+            if handler is not None:
+                handler(files)
+        
+        self._function_complexities = np.fromiter(
+            (f.complexity for f in self.functions), dtype=np.int32, count=len(self.functions)
+        )
+        self._class_has_docstring = np.fromiter(
+            (bool(c.docstring) for c in self.classes), dtype=bool, count=len(self.classes)
+        )
         
         print(f"   Found {len(self.functions)} functions")
         print(f"   Found {len(self.classes)} classes")
@@ -93,213 +293,195 @@ class RepositoryAnalyzer:
     
     def _scan_files(self, languages: List[str]):
         """Scan repository for code files"""
-        extensions = {
-            'python': ['.py'],
-            'javascript': ['.js', '.jsx'],
-            'typescript': ['.ts', '.tsx'],
-            'java': ['.java']
+        # Map each wanted extension to its language
+        extension_languages = {
+            ext: lang
+            for lang in languages
+            for ext in LANGUAGE_EXTENSIONS.get(lang, [])
         }
         
-        valid_extensions = []
-        for lang in languages:
-            valid_extensions.extend(extensions.get(lang, []))
-        
-        exclude_dirs = {
+        exclude_dirs = frozenset({
             'node_modules', 'venv', 'env', '__pycache__', 
             'dist', 'build', '.git', 'test', 'tests'
-        }
+        })
         
-        for root, dirs, files in os.walk(self.repo_path):
-            # Filter out excluded directories
-            dirs[:] = [d for d in dirs if d not in exclude_dirs]
-            
-            for file in files:
-                if any(file.endswith(ext) for ext in valid_extensions):
-                    file_path = Path(root) / file
-                    relative_path = file_path.relative_to(self.repo_path)
-                    
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            content = f.read()
-                        
-                        # Determine language
-                        ext = file_path.suffix
-                        language = next((lang for lang, exts in extensions.items() if ext in exts), 'unknown')
-                        
-                        code_file = CodeFile(
-                            path=str(relative_path),
-                            language=language,
-                            content=content,
-                            lines=len(content.split('\n'))
-                        )
-                        self.code_files.append(code_file)
-                    except Exception as e:
-                        print(f"   ⚠️  Error reading {relative_path}: {e}")
+        file_paths = []
+        file_languages = []
+        for path in iter_code_files(self.repo_path, frozenset(extension_languages), exclude_dirs):
+            file_path = Path(path)
+            file_paths.append(file_path)
+            file_languages.append(extension_languages[file_path.suffix])
+        
+        # Reads are I/O-bound, so overlap them with threads on larger repos
+        if len(file_paths) > PARALLEL_THRESHOLD:
+            with ThreadPoolExecutor() as executor:
+                code_files = list(executor.map(self._read_code_file, file_paths, file_languages))
+        else:
+            code_files = [self._read_code_file(p, lang) for p, lang in zip(file_paths, file_languages)]
+        
+        for code_file in code_files:
+            if code_file is None:
+                continue
+            self.code_files.append(code_file)
+            self._total_lines += code_file.lines
+            self._files_by_language[code_file.language].append(code_file)
+            self._files_by_path[code_file.path] = code_file
+            self._directory_files[os.path.dirname(code_file.path) or '.'].append(code_file.path)
     
-    def _analyze_python_file(self, code_file: CodeFile):
-        """Analyze a Python file"""
+    def _read_code_file(self, file_path: Path, language: str) -> Optional[CodeFile]:
+        """Read a single code file"""
+        relative_path = file_path.relative_to(self.repo_path)
+        
         try:
-            tree = ast.parse(code_file.content)
+            # Skip oversized files before reading them
+            if file_path.stat().st_size > self.max_file_size:
+                return None
+            
+            raw = file_path.read_bytes()
+            if b'\x00' in raw[:4096]:
+                # Binary file with a code extension
+                return None
+            
+            content = raw.decode('utf-8')
+            if '\r' in content:
+                # Match text-mode universal newline handling
+                content = content.replace('\r\n', '\n').replace('\r', '\n')
             
-            for node in ast.walk(tree):
-                if isinstance(node, ast.FunctionDef):
-                    func_info = self._extract_function_info(node, code_file)
-                    self.functions.append(func_info)
-                
-                elif isinstance(node, ast.ClassDef):
-                    class_info = self._extract_class_info(node, code_file)
-                    self.classes.append(class_info)
-        
-        except SyntaxError:
-            pass
+            return CodeFile(
+                path=str(relative_path),
+                language=language,
+                content=content,
+                lines=content.count('\n') + 1,
+                sha256=hashlib.sha256(raw).hexdigest()
+            )
+        except Exception as e:
+            print(f"   ⚠️  Error reading {relative_path}: {e}")
+            return None
     
-    def _extract_function_info(self, node: ast.FunctionDef, code_file: CodeFile) -> FunctionInfo:
-        """Extract function information"""
-        docstring = ast.get_docstring(node)
-        parameters = [arg.arg for arg in node.args.args]
+    def _analyze_python_files(self, code_files: List[CodeFile]):
+        """Analyze Python files, reusing cached results and parsing misses in parallel"""
+        results = [
+            self.cache.get(f.path, f.sha256) if self.cache is not None else None
+            for f in code_files
+        ]
+        misses = [i for i, result in enumerate(results) if result is None]
         
-        # Get function code
-        lines = code_file.content.split('\n')
-        start_line = node.lineno
-        end_line = node.end_lineno if hasattr(node, 'end_lineno') else start_line + 10
-        code = '\n'.join(lines[start_line-1:end_line])
-        
-        # Calculate complexity (simplified)
-        complexity = sum(1 for n in ast.walk(node) if isinstance(n, (ast.If, ast.For, ast.While, ast.ExceptHandler)))
-        
-        return FunctionInfo(
-            name=node.name,
-            file_path=code_file.path,
-            start_line=start_line,
-            end_line=end_line,
-            docstring=docstring,
-            parameters=parameters,
-            code=code,
-            complexity=complexity
-        )
-    
-    def _extract_class_info(self, node: ast.ClassDef, code_file: CodeFile) -> ClassInfo:
-        """Extract class information"""
-        docstring = ast.get_docstring(node)
-        base_classes = [base.id for base in node.bases if isinstance(base, ast.Name)]
+        # ast.parse is CPU-bound, so spread large batches across processes
+        if len(misses) > PARALLEL_THRESHOLD:
+            with ProcessPoolExecutor() as executor:
+                parsed = executor.map(_parse_python, [code_files[i] for i in misses], chunksize=16)
+                for i, result in zip(misses, parsed):
+                    results[i] = result
+        else:
+            for i in misses:
+                results[i] = _parse_python(code_files[i])
         
-        methods = []
-        for item in node.body:
-            if isinstance(item, ast.FunctionDef):
-                method_info = self._extract_function_info(item, code_file)
-                methods.append(method_info)
+        # Cache detached records, before they are linked to their file contents
+        if self.cache is not None:
+            for i in misses:
+                self.cache.put(code_files[i].path, code_files[i].sha256, results[i])
+            self.cache.commit()
         
-        return ClassInfo(
-            name=node.name,
-            file_path=code_file.path,
-            start_line=node.lineno,
-            end_line=node.end_lineno if hasattr(node, 'end_lineno') else node.lineno + 10,
-            docstring=docstring,
-            methods=methods,
-            base_classes=base_classes
-        )
+        for code_file, (functions, classes) in zip(code_files, results):
+            # Methods are the same objects as module functions, so this covers them too
+            for function in functions:
+                function.source = code_file
+            self.functions.extend(functions)
+            self.classes.extend(classes)
     
     def _analyze_architecture(self):
         """Analyze repository architecture"""
-        # Group by directories
-        directory_structure = defaultdict(list)
+        # Directory grouping is collected during the scan (file paths only, so it stays serializable)
+        directory_structure = dict(self._directory_files)
+        
+        # Build tech stack
+        tech_stack = {}
         for code_file in self.code_files:
-            dir_name = str(Path(code_file.path).parent)
-            directory_structure[dir_name].append(code_file)
+            self._update_tech_stack(tech_stack, code_file)
         
         # Identify patterns
-        patterns = self._identify_patterns()
-        
-        # Build tech stack
-        tech_stack = self._identify_tech_stack()
+        patterns = self._identify_patterns(directory_structure)
         
         self.architecture = {
-            'directory_structure': dict(directory_structure),
+            'directory_structure': directory_structure,
             'design_patterns': patterns,
             'tech_stack': tech_stack,
             'total_files': len(self.code_files),
-            'total_lines': sum(f.lines for f in self.code_files),
-            'languages': list(set(f.language for f in self.code_files))
+            'total_lines': self._total_lines,
+            'languages': list(self._files_by_language)
         }
     
-    def _identify_patterns(self) -> List[str]:
+    def _identify_patterns(self, directory_structure: Dict[str, List[str]]) -> List[str]:
         """Identify design patterns"""
         patterns = []
         
-        # Check for common patterns
-        class_names = [c.name.lower() for c in self.classes]
-        
-        if any('factory' in name for name in class_names):
-            patterns.append('Factory Pattern')
-        if any('singleton' in name for name in class_names):
-            patterns.append('Singleton Pattern')
-        if any('observer' in name for name in class_names):
-            patterns.append('Observer Pattern')
-        if any('strategy' in name for name in class_names):
-            patterns.append('Strategy Pattern')
+        # Check for common patterns (class names never contain newlines, so one joined scan is exact)
+        class_names = '\n'.join(c.name for c in self.classes).lower()
+        for fragment, pattern in _CLASS_NAME_PATTERNS:
+            if fragment in class_names:
+                patterns.append(pattern)
         
         # Check for MVC
-        dirs = set(Path(f.path).parent.name.lower() for f in self.code_files)
+        dirs = set(Path(d).name.lower() for d in directory_structure)
         if 'models' in dirs and 'views' in dirs and 'controllers' in dirs:
             patterns.append('MVC Architecture')
         
         return patterns
     
-    def _identify_tech_stack(self) -> Dict[str, str]:
-        """Identify technology stack"""
-        tech_stack = {}
+    def _update_tech_stack(self, tech_stack: Dict[str, str], code_file: CodeFile):
+        """Record the technologies a file uses (later files override earlier ones)"""
+        hits = {m.lastgroup for m in _TECH_RE.finditer(code_file.content)}
+        if not hits:
+            return
         
-        # Check for framework files
-        for code_file in self.code_files:
-            content_lower = code_file.content.lower()
-            
-            # Python frameworks
-            if 'from flask import' in content_lower or 'import flask' in content_lower:
-                tech_stack['web_framework'] = 'Flask'
-            elif 'from django' in content_lower or 'import django' in content_lower:
-                tech_stack['web_framework'] = 'Django'
-            elif 'from fastapi' in content_lower or 'import fastapi' in content_lower:
-                tech_stack['web_framework'] = 'FastAPI'
-            
-            # JavaScript frameworks
-            if 'from react' in content_lower or 'import react' in content_lower:
-                tech_stack['frontend_framework'] = 'React'
-            elif 'from vue' in content_lower or 'import vue' in content_lower:
-                tech_stack['frontend_framework'] = 'Vue'
-            
-            # Databases
-            if 'pymongo' in content_lower:
-                tech_stack['database'] = 'MongoDB'
-            elif 'psycopg' in content_lower or 'postgresql' in content_lower:
-                tech_stack['database'] = 'PostgreSQL'
-            elif 'mysql' in content_lower:
-                tech_stack['database'] = 'MySQL'
-        
-        return tech_stack
+        matched_categories = set()
+        for i, (category, name, _) in enumerate(_TECH_MARKERS):
+            if f'm{i}' in hits and category not in matched_categories:
+                tech_stack[category] = name
+                matched_categories.add(category)
     
     def get_functions_by_complexity(self, min_complexity: int = 3) -> List[FunctionInfo]:
         """Get functions with complexity >= threshold"""
-        return [f for f in self.functions if f.complexity >= min_complexity]
+        indices = np.flatnonzero(self._function_complexities >= min_complexity)
+        return [self.functions[i] for i in indices]
     
     def get_classes_with_docstrings(self) -> List[ClassInfo]:
         """Get classes that have docstrings"""
-        return [c for c in self.classes if c.docstring]
+        return [self.classes[i] for i in np.flatnonzero(self._class_has_docstring)]
+    
+    def get_file(self, path: str) -> Optional[CodeFile]:
+        """Look up a scanned file by its repository-relative path"""
+        return self._files_by_path.get(path)
     
     def search_code(self, query: str) -> List[CodeFile]:
         """Search for code containing query"""
-        results = []
-        for code_file in self.code_files:
-            if query.lower() in code_file.content.lower():
-                results.append(code_file)
-        return results
+        return self.search_many([query])[query]
+    
+    def search_many(self, queries: List[str]) -> Dict[str, List[CodeFile]]:
+        """Search for several queries with (at most) one pass over the files"""
+        # Only queries not seen before need a scan
+        pending = [
+            needle for needle in dict.fromkeys(query.lower() for query in queries)
+            if needle not in self._search_results
+        ]
+        if pending:
+            found = {needle: [] for needle in pending}
+            for code_file in self.code_files:
+                content_lower = code_file.content.lower()
+                for needle in pending:
+                    if needle in content_lower:
+                        found[needle].append(code_file)
+            self._search_results.update(found)
+        
+        return {query: list(self._search_results[query.lower()]) for query in queries}
     
     def export_summary(self) -> Dict[str, Any]:
         """Export analysis summary"""
         return {
             'repository_path': str(self.repo_path),
             'total_files': len(self.code_files),
-            'total_lines': sum(f.lines for f in self.code_files),
-            'languages': list(set(f.language for f in self.code_files)),
+            'total_lines': self._total_lines,
+            'languages': list(self._files_by_language),
             'total_functions': len(self.functions),
             'total_classes': len(self.classes),
             'architecture': self.architecture
@@ -0,0 +1,59 @@
+"""
+Persistent Analysis Cache
+Stores per-file analysis results keyed by (relative path, content SHA-256)
+"""
+import pickle
+import sqlite3
+from pathlib import Path
+from typing import Any, Optional
+
+
+class AnalysisCache:
+    """SQLite-backed cache of parsed file structure"""
+
+    def __init__(self, db_path: str, version: int = 1):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.version = version
+
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "path TEXT NOT NULL, "
+            "sha TEXT NOT NULL, "
+            "version INTEGER NOT NULL, "
+            "blob BLOB NOT NULL, "
+            "PRIMARY KEY (path, sha))"
+        )
+
+    def get(self, path: str, sha: str) -> Optional[Any]:
+        """Return the cached value for a file, or None on miss"""
+        row = self.conn.execute(
+            "SELECT blob FROM cache WHERE path = ? AND sha = ? AND version = ?",
+            (path, sha, self.version)
+        ).fetchone()
+        if row is None:
+            return None
+
+        try:
+            return pickle.loads(row[0])
+        except (pickle.UnpicklingError, AttributeError, EOFError, TypeError):
+            # Entry written by an incompatible analyzer version
+            return None
+
+    def put(self, path: str, sha: str, value: Any):
+        """Store a value for a file (committed by commit())"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO cache (path, sha, version, blob) VALUES (?, ?, ?, ?)",
+            (path, sha, self.version, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        )
+
+    def commit(self):
+        """Commit pending writes"""
+        self.conn.commit()
+
+    def close(self):
+        """Commit and close the underlying connection"""
+        self.conn.commit()
+        self.conn.close()
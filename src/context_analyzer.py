@@ -1,9 +1,43 @@
 """项目上下文分析器"""
+import ast
+import os
 import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 from collections import defaultdict
 
+from src.file_walker import iter_code_files
+
+# 扫描时直接跳过（不进入）的目录
+EXCLUDED_DIRS = frozenset({'__pycache__', '.venv', '.git', 'node_modules'})
+
+# 超过该大小（字节）的文件几乎都不是手写源码，直接跳过扫描
+MAX_SCAN_FILE_SIZE = 2 * 1024 * 1024
+
+# 导入依赖只看文件开头的行数
+IMPORT_SCAN_LINES = 50
+
+# 预编译的正则：导入语句与函数定义（语法错误时的降级方案）
+_IMPORT_RE = re.compile(r'^\s*(?:import\s+(?P<imp>[\w.]+)|from\s+(?P<frm>[\w.]+))')
+_DEF_RE = re.compile(r'def\s+(\w+)\s*\([^)]*\):')
+
+# 文件角色规则（按优先级排列，路径中包含任一关键词即命中）
+_ROLE_RULES = [
+    (('test',), "测试文件"),
+    (('api', 'endpoint'), "API接口层"),
+    (('service', 'business'), "业务逻辑层"),
+    (('model', 'schema'), "数据模型层"),
+    (('util', 'helper'), "工具函数模块"),
+    (('config', 'setting'), "配置模块"),
+    (('main', 'app'), "应用入口"),
+    (('core', 'engine'), "核心逻辑"),
+]
+_ROLE_RANK = {keyword: rank for rank, (keywords, _) in enumerate(_ROLE_RULES) for keyword in keywords}
+# 前瞻匹配：一次扫描即可找出所有（可能重叠的）关键词
+_ROLE_RE = re.compile('(?=(' + '|'.join(_ROLE_RANK) + '))')
+
 
 class ProjectContextAnalyzer:
     """项目上下文分析器"""
@@ -12,6 +46,11 @@ class ProjectContextAnalyzer:
         self.project_path = Path(project_path)
         self.project_name = self.project_path.name
         self._structure_cache = None
+        # 按文件路径缓存的分析结果（同一文件的多个片段复用）
+        self._role_cache: Dict[str, str] = {}
+        self._parse_cache: Dict[str, Tuple[List[str], List[str]]] = {}
+        # 上下文文本只取决于文件与级别（与代码片段无关），按 (文件路径, 级别) 缓存
+        self._context_cache: Dict[Tuple[str, str], str] = {}
         
     def analyze_project_structure(self) -> Dict:
         """分析项目结构"""
@@ -23,30 +62,32 @@ class ProjectContextAnalyzer:
             'total_files': 0,
             'python_files': [],
             'core_modules': [],
-            'readme_summary': '',
-            'common_imports': set()
+            'readme_summary': ''
         }
         
-        # 统计文件
-        for py_file in self.project_path.rglob('*.py'):
-            if '__pycache__' not in str(py_file) and '.venv' not in str(py_file):
-                rel_path = py_file.relative_to(self.project_path)
-                structure['python_files'].append(str(rel_path))
-                structure['total_files'] += 1
-                
-                # 识别核心模块（根目录或src下的主要文件）
-                if len(rel_path.parts) <= 2 and py_file.stem not in ['__init__', 'setup']:
-                    structure['core_modules'].append(py_file.stem)
+        # 统计文件（排除目录在遍历时剪枝，不会进入）
+        root = str(self.project_path)
+        for py_file in iter_code_files(root, frozenset({'.py'}), EXCLUDED_DIRS):
+            rel_path = os.path.relpath(py_file, root)
+            structure['python_files'].append(rel_path)
+            structure['total_files'] += 1
+            
+            # 识别核心模块（根目录或src下的主要文件）
+            stem = os.path.splitext(os.path.basename(py_file))[0]
+            if rel_path.count(os.sep) <= 1 and stem not in ['__init__', 'setup']:
+                structure['core_modules'].append(stem)
         
         # 读取 README 摘要
         readme_file = self.project_path / 'README.md'
         if readme_file.exists():
             try:
-                content = readme_file.read_text(encoding='utf-8')
+                # 只需要第一段的前200字符，读取开头 4K 即可
+                with readme_file.open(encoding='utf-8', errors='replace') as f:
+                    content = f.read(4096)
                 # 提取第一段或前200字符
-                first_paragraph = content.split('\n\n')[0]
+                first_paragraph = content.split('\n\n', 1)[0]
                 structure['readme_summary'] = first_paragraph[:200]
-            except:
+            except OSError:
                 pass
         
         self._structure_cache = structure
@@ -62,47 +103,25 @@ class ProjectContextAnalyzer:
         Returns:
             文件角色描述
         """
+        role = self._role_cache.get(file_path)
+        if role is None:
+            role = self._role_cache[file_path] = self._infer_file_role(file_path)
+        return role
+    
+    @staticmethod
+    def _infer_file_role(file_path: str) -> str:
+        """基于路径规则推断文件角色"""
         path_lower = file_path.lower()
         
-        # 基于路径和文件名的规则推断
-        if 'test' in path_lower:
-            return "测试文件"
-        elif 'api' in path_lower or 'endpoint' in path_lower:
-            return "API接口层"
-        elif 'service' in path_lower or 'business' in path_lower:
-            return "业务逻辑层"
-        elif 'model' in path_lower or 'schema' in path_lower:
-            return "数据模型层"
-        elif 'util' in path_lower or 'helper' in path_lower:
-            return "工具函数模块"
-        elif 'config' in path_lower or 'setting' in path_lower:
-            return "配置模块"
-        elif 'main' in path_lower or 'app' in path_lower:
-            return "应用入口"
-        elif 'core' in path_lower or 'engine' in path_lower:
-            return "核心逻辑"
-        else:
-            return "业务模块"
+        # 基于路径和文件名的规则推断（取优先级最高的命中规则）
+        ranks = [_ROLE_RANK[match.group(1)] for match in _ROLE_RE.finditer(path_lower)]
+        if ranks:
+            return _ROLE_RULES[min(ranks)][1]
+        return "业务模块"
     
     def extract_imports(self, file_path: str) -> List[str]:
         """提取文件导入依赖"""
-        try:
-            full_path = self.project_path / file_path
-            content = full_path.read_text(encoding='utf-8')
-            lines = content.split('\n')[:50]
-            imports = []
-            for line in lines:
-                if line.strip().startswith('import '):
-                    match = re.search(r'import\s+([\w.]+)', line)
-                    if match:
-                        imports.append(match.group(1).split('.')[0])
-                elif line.strip().startswith('from '):
-                    match = re.search(r'from\s+([\w.]+)', line)
-                    if match:
-                        imports.append(match.group(1).split('.')[0])
-            return list(set(imports))
-        except:
-            return []
+        return self._parse_file(file_path)[0]
     
     def extract_function_signatures(self, file_path: str) -> List[str]:
         """
@@ -114,26 +133,95 @@ class ProjectContextAnalyzer:
         Returns:
             函数签名列表
         """
+        return self._parse_file(file_path)[1]
+    
+    def _parse_file(self, file_path: str) -> Tuple[List[str], List[str]]:
+        """获取文件的 (导入依赖, 主要函数) ，按路径缓存"""
+        parsed = self._parse_cache.get(file_path)
+        if parsed is None:
+            parsed = self._parse_cache[file_path] = self._read_file_info(file_path)
+        return parsed
+    
+    def _read_file_info(self, file_path: str) -> Tuple[List[str], List[str]]:
+        """读取一次文件，同时提取导入依赖（前50行）与公开函数名"""
         try:
             full_path = self.project_path / file_path
+            if full_path.stat().st_size > MAX_SCAN_FILE_SIZE:
+                return [], []
             content = full_path.read_text(encoding='utf-8')
-            
-            # 使用正则提取函数定义
-            pattern = r'def\s+(\w+)\s*\([^)]*\):'
-            functions = re.findall(pattern, content)
-            
-            # 过滤私有函数和特殊方法
-            public_functions = [
-                f for f in functions 
-                if not f.startswith('_') or f.startswith('__init__')
-            ]
-            
-            return public_functions[:10]  # 最多返回10个
-        except:
-            return []
+        except (OSError, UnicodeDecodeError):
+            return [], []
+        
+        try:
+            tree = ast.parse(content)
+        except (SyntaxError, ValueError):
+            return self._scan_file_info(content)
+        
+        imports = set()
+        functions = []
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                functions.append((node.lineno, node.name))
+            elif isinstance(node, (ast.Import, ast.ImportFrom)) and node.lineno <= IMPORT_SCAN_LINES:
+                if isinstance(node, ast.Import):
+                    names = [alias.name for alias in node.names]
+                else:
+                    names = [node.module] if node.module else []
+                for name in names:
+                    # 模块名在各文件间大量重复，驻留后共享同一个字符串对象
+                    imports.add(sys.intern(name.split('.', 1)[0]))
+        
+        # ast.walk 为广度优先，按行号恢复源码顺序；过滤私有函数和特殊方法
+        functions.sort()
+        public_functions = [
+            name for _, name in functions
+            if not name.startswith('_') or name.startswith('__init__')
+        ]
+        
+        return list(imports), public_functions[:10]  # 最多返回10个函数
+    
+    @staticmethod
+    def _scan_file_info(content: str) -> Tuple[List[str], List[str]]:
+        """无法解析为 AST 时，用正则逐行提取导入依赖与公开函数名"""
+        imports = set()
+        for line in content.split('\n', IMPORT_SCAN_LINES)[:IMPORT_SCAN_LINES]:
+            match = _IMPORT_RE.match(line)
+            if match:
+                imports.add(sys.intern((match.group('imp') or match.group('frm')).split('.', 1)[0]))
+        
+        public_functions = [
+            f for f in _DEF_RE.findall(content)
+            if not f.startswith('_') or f.startswith('__init__')
+        ]
+        
+        return list(imports), public_functions[:10]
+    
+    def prewarm(self, file_paths: List[str], workers: int = 8):
+        """
+        并发读取一批文件的导入与函数信息并写入缓存
+        
+        Args:
+            file_paths: 文件路径列表（与 build_context 使用的路径一致）
+            workers: 线程数（文件读取为 I/O 密集型）
+        """
+        pending = [p for p in dict.fromkeys(file_paths) if p not in self._parse_cache]
+        if not pending:
+            return
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for path, parsed in zip(pending, executor.map(self._read_file_info, pending)):
+                self._parse_cache[path] = parsed
+    
+    def build_context(self, file_path: str, context_level: str = 'standard') -> str:
+        """构建项目上下文（只取决于文件与级别，与代码片段无关，因此按二者缓存）"""
+        key = (file_path, context_level)
+        context = self._context_cache.get(key)
+        if context is None:
+            context = self._context_cache[key] = self._build_context(file_path, context_level)
+        return context
     
-    def build_context(self, code_snippet: str, file_path: str, context_level: str = 'standard') -> str:
-        """构建项目上下文"""
+    def _build_context(self, file_path: str, context_level: str) -> str:
+        """按级别拼接文件与项目信息"""
         structure = self.analyze_project_structure()
         file_role = self.analyze_file_role(file_path)
         
@@ -182,7 +270,7 @@ class ProjectContextAnalyzer:
         Returns:
             提示词前缀
         """
-        context = self.build_context(code_snippet, file_path, context_level)
+        context = self.build_context(file_path, context_level)
         
         prefix = f"""
 ## 项目上下文信息
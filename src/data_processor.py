@@ -3,9 +3,21 @@ Data Processing and Validation Utilities
 """
 import json
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Tuple
+import numpy as np
 import pandas as pd
 from collections import Counter
+from pydantic import TypeAdapter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
 from src.schema import QAPair, DesignSolution, TrainingDataset
 
@@ -13,64 +25,151 @@ from src.schema import QAPair, DesignSolution, TrainingDataset
 class DataProcessor:
     """Process and export training data"""
     
+    # Items per serializer call when streaming JSONL
+    DUMP_CHUNK_SIZE = 1024
+    
+    # Low-cardinality string columns stored dictionary-encoded in Parquet
+    CATEGORY_COLUMNS = ('question_type', 'difficulty', 'requirement_type', 'complexity')
+    
+    # Free-form dict fields stored as JSON strings in Parquet: their keys vary per
+    # record, and an empty dict would infer a struct with no children (unwritable)
+    JSON_ENCODED_FIELDS = frozenset({'tech_stack', 'metadata'})
+    
     def __init__(self, output_dir: str = "./data/processed"):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._adapters: Dict[type, TypeAdapter] = {}
+    
+    def _to_plain(self, data: List[Any]) -> List[Any]:
+        """Convert items to JSON-compatible objects, dumping same-type models in one pydantic call
+
+        JSON mode renders datetimes as ISO strings up front, so the output does not
+        depend on which JSON writer (orjson or json) ends up serializing it.
+        """
+        if data and hasattr(data[0], 'model_dump'):
+            model_type = type(data[0])
+            if all(type(item) is model_type for item in data):
+                adapter = self._adapters.get(model_type)
+                if adapter is None:
+                    adapter = self._adapters[model_type] = TypeAdapter(List[model_type])
+                return adapter.dump_python(data, mode='json')
+        
+        return [item.model_dump(mode='json') if hasattr(item, 'model_dump') else item for item in data]
     
     def export_to_jsonl(self, data: List[Any], filename: str):
         """Export data to JSONL format"""
         output_path = self.output_dir / filename
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            for item in data:
-                if hasattr(item, 'model_dump'):
-                    json_str = json.dumps(item.model_dump(), ensure_ascii=False, default=str)
-                else:
-                    json_str = json.dumps(item, ensure_ascii=False, default=str)
-                f.write(json_str + '\n')
+        records = (
+            record
+            for start in range(0, len(data), self.DUMP_CHUNK_SIZE)
+            for record in self._to_plain(data[start:start + self.DUMP_CHUNK_SIZE])
+        )
+        count = self._write_jsonl(output_path, records)
         
-        print(f"   💾 Exported {len(data)} items to {output_path}")
+        print(f"   💾 Exported {count} items to {output_path}")
         return output_path
     
+    def _write_jsonl(self, output_path: Path, records: Iterable[Any]) -> int:
+        """Stream plain records to a JSONL file and return how many were written"""
+        count = 0
+        
+        if orjson is not None:
+            # Serialize line by line straight into a large write buffer
+            with open(output_path, 'wb', buffering=1 << 20) as f:
+                for record in records:
+                    f.write(orjson.dumps(
+                        record,
+                        default=str,
+                        option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_SERIALIZE_NUMPY
+                    ))
+                    count += 1
+            return count
+        
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+                count += 1
+        return count
+    
     def export_to_json(self, data: List[Any], filename: str):
         """Export data to JSON format"""
         output_path = self.output_dir / filename
         
-        json_data = []
-        for item in data:
-            if hasattr(item, 'model_dump'):
-                json_data.append(item.model_dump())
-            else:
-                json_data.append(item)
+        json_data = self._to_plain(data)
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, ensure_ascii=False, indent=2, default=str)
+        if orjson is not None:
+            output_path.write_bytes(orjson.dumps(json_data, option=orjson.OPT_INDENT_2, default=str))
+        else:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(json_data, f, ensure_ascii=False, indent=2, default=str)
         
         print(f"   💾 Exported {len(data)} items to {output_path}")
         return output_path
     
+    def export_to_parquet(self, data: List[Any], filename: str):
+        """Export data to Parquet format for columnar analytics (requires pyarrow)"""
+        if pyarrow is None:
+            print(f"   ⚠️  pyarrow not installed, skipping {filename}")
+            return None
+        
+        output_path = self.output_dir / filename
+        
+        # Nested fields (code_contexts, reasoning_trace, ...) become list/struct columns
+        df = pd.DataFrame([self._encode_free_form(record) for record in self._to_plain(data)])
+        for column in self.CATEGORY_COLUMNS:
+            if column in df.columns:
+                df[column] = df[column].astype('category')
+        
+        df.to_parquet(output_path, engine='pyarrow', compression='zstd', index=False)
+        
+        print(f"   💾 Exported {len(df)} items to {output_path}")
+        return output_path
+    
+    def _encode_free_form(self, value: Any) -> Any:
+        """Recursively replace JSON_ENCODED_FIELDS values with JSON strings"""
+        if isinstance(value, dict):
+            return {
+                key: (json.dumps(item, ensure_ascii=False, sort_keys=True, default=str)
+                      if key in self.JSON_ENCODED_FIELDS and isinstance(item, dict)
+                      else self._encode_free_form(item))
+                for key, item in value.items()
+            }
+        if isinstance(value, list):
+            return [self._encode_free_form(item) for item in value]
+        return value
+    
+    def export_report(self, report: Dict[str, Any], filename: str = "quality_report.json"):
+        """Export the quality report as indented JSON"""
+        output_path = self.output_dir / filename
+        
+        if orjson is not None:
+            output_path.write_bytes(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+        else:
+            with open(output_path, 'w') as f:
+                json.dump(report, f, indent=2)
+        
+        print(f"   💾 Quality report saved to {output_path}")
+        return output_path
+    
     def split_dataset(self, data: List[Any], 
                      train_ratio: float = 0.8,
                      val_ratio: float = 0.1,
                      test_ratio: float = 0.1) -> Dict[str, List[Any]]:
         """Split dataset into train/val/test"""
-        import random
-        
         assert abs(train_ratio + val_ratio + test_ratio - 1.0) < 0.01, \
             "Split ratios must sum to 1.0"
         
-        # Shuffle data
-        data_copy = data.copy()
-        random.shuffle(data_copy)
-        
-        total = len(data_copy)
+        # Shuffle indices only (no copy of the data list)
+        total = len(data)
+        order = np.random.permutation(total)
         train_end = int(total * train_ratio)
         val_end = train_end + int(total * val_ratio)
         
         splits = {
-            'train': data_copy[:train_end],
-            'validation': data_copy[train_end:val_end],
-            'test': data_copy[val_end:]
+            'train': [data[i] for i in order[:train_end]],
+            'validation': [data[i] for i in order[train_end:val_end]],
+            'test': [data[i] for i in order[val_end:]]
         }
         
         print(f"\n📊 Dataset split:")
@@ -86,48 +185,54 @@ class DataProcessor:
         """Export data in format suitable for fine-tuning"""
         
         if format == "openai":
-            # OpenAI fine-tuning format
-            training_data = []
-            
-            # Process Q&A pairs
-            for qa in qa_pairs:
-                training_data.append({
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": "You are an expert software engineer helping with code understanding and design."
-                        },
-                        {
-                            "role": "user",
-                            "content": self._format_qa_input(qa)
-                        },
-                        {
-                            "role": "assistant",
-                            "content": self._format_qa_output(qa)
-                        }
-                    ]
-                })
+            # OpenAI fine-tuning format, streamed record by record
+            output_path = self.output_dir / "finetuning_data.jsonl"
+            count = self._write_jsonl(output_path, self._iter_finetune_records(qa_pairs, design_solutions))
             
-            # Process design solutions
-            for solution in design_solutions:
-                training_data.append({
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": "You are a senior software architect providing design solutions."
-                        },
-                        {
-                            "role": "user",
-                            "content": self._format_design_input(solution)
-                        },
-                        {
-                            "role": "assistant",
-                            "content": self._format_design_output(solution)
-                        }
-                    ]
-                })
-            
-            return self.export_to_jsonl(training_data, "finetuning_data.jsonl")
+            print(f"   💾 Exported {count} items to {output_path}")
+            return output_path
+    
+    def _iter_finetune_records(self, qa_pairs: List[QAPair],
+                               design_solutions: List[DesignSolution]) -> Iterator[Dict[str, Any]]:
+        """Yield OpenAI chat-format training records"""
+        
+        # Process Q&A pairs
+        for qa in qa_pairs:
+            yield {
+                "messages": [
+                    {
+                        "role": "system",
+                        "content": "You are an expert software engineer helping with code understanding and design."
+                    },
+                    {
+                        "role": "user",
+                        "content": self._format_qa_input(qa)
+                    },
+                    {
+                        "role": "assistant",
+                        "content": self._format_qa_output(qa)
+                    }
+                ]
+            }
+        
+        # Process design solutions
+        for solution in design_solutions:
+            yield {
+                "messages": [
+                    {
+                        "role": "system",
+                        "content": "You are a senior software architect providing design solutions."
+                    },
+                    {
+                        "role": "user",
+                        "content": self._format_design_input(solution)
+                    },
+                    {
+                        "role": "assistant",
+                        "content": self._format_design_output(solution)
+                    }
+                ]
+            }
     
     def _format_qa_input(self, qa: QAPair) -> str:
         """Format Q&A input for fine-tuning"""
@@ -181,167 +286,244 @@ class DataProcessor:
         return output
 
 
+def _count_words(text: str, limit: int) -> int:
+    """Count whitespace-separated words, stopping once the count exceeds limit"""
+    return len(text.split(None, limit))
+
+
 class DataValidator:
     """Validate training data quality"""
     
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        """Clear the running statistics collected by add_qa / add_design"""
+        self._qa_total = 0
+        self._qa_valid = 0
+        self._qa_total_quality = 0.0
+        self._question_types = Counter()
+        self._languages = Counter()
+        
+        self._design_total = 0
+        self._design_valid = 0
+        self._design_total_quality = 0.0
+        self._requirement_types = Counter()
+        self._complexities = Counter()
+    
+    def add_qa(self, qa: QAPair) -> Dict[str, Any]:
+        """Validate a Q&A pair and fold it into the running statistics"""
+        validation = self.validate_qa_pair(qa)
+        self._qa_total += 1
+        self._qa_valid += validation['valid']
+        self._qa_total_quality += validation['quality_score']
+        self._question_types[qa.question_type] += 1
+        self._languages.update(ctx.language for ctx in qa.code_contexts)
+        return validation
+    
+    def add_design(self, solution: DesignSolution) -> Dict[str, Any]:
+        """Validate a design solution and fold it into the running statistics"""
+        validation = self.validate_design_solution(solution)
+        self._design_total += 1
+        self._design_valid += validation['valid']
+        self._design_total_quality += validation['quality_score']
+        self._requirement_types[solution.requirement_type] += 1
+        self._complexities[solution.complexity] += 1
+        return validation
+    
     def validate_qa_pair(self, qa: QAPair) -> Dict[str, Any]:
         """Validate a Q&A pair"""
+        issues, quality_score = self._inspect_qa(qa)
+        return {
+            'valid': len(issues) == 0,
+            'issues': issues,
+            'quality_score': quality_score
+        }
+    
+    def validate_design_solution(self, solution: DesignSolution) -> Dict[str, Any]:
+        """Validate a design solution"""
+        issues, quality_score = self._inspect_design(solution)
+        return {
+            'valid': len(issues) == 0,
+            'issues': issues,
+            'quality_score': quality_score
+        }
+    
+    def _calculate_quality_score(self, qa: QAPair) -> float:
+        """Calculate quality score for Q&A"""
+        return self._inspect_qa(qa)[1]
+    
+    def _calculate_design_quality_score(self, solution: DesignSolution) -> float:
+        """Calculate quality score for design solution"""
+        return self._inspect_design(solution)[1]
+    
+    def _inspect_qa(self, qa: QAPair) -> Tuple[List[str], float]:
+        """Collect validation issues and the quality score for a Q&A pair in one pass"""
+        question_words = _count_words(qa.question, 50)
+        answer_words = _count_words(qa.answer, 100)
+        num_contexts = len(qa.code_contexts)
+        trace = qa.reasoning_trace
+        num_steps = len(trace.steps) if trace else 0
+        
         issues = []
         
         # Check question length
-        if len(qa.question.split()) < 5:
+        if question_words < 5:
             issues.append("Question too short")
         
         # Check answer length
-        if len(qa.answer.split()) < 20:
+        if answer_words < 20:
             issues.append("Answer too short")
         
         # Check code context
-        if not qa.code_contexts:
+        if not num_contexts:
             issues.append("No code context provided")
         
         # Check reasoning trace
-        if not qa.reasoning_trace or len(qa.reasoning_trace.steps) < 2:
+        if num_steps < 2:
             issues.append("Insufficient reasoning steps")
         
         # Check confidence
-        if qa.reasoning_trace and qa.reasoning_trace.overall_confidence < 0.5:
+        if trace and trace.overall_confidence < 0.5:
             issues.append("Low reasoning confidence")
         
-        return {
-            'valid': len(issues) == 0,
-            'issues': issues,
-            'quality_score': self._calculate_quality_score(qa)
-        }
+        score = 0.0
+        
+        # Question quality (0-0.2)
+        score += min(0.2, question_words / 50 * 0.2)
+        
+        # Answer quality (0-0.3)
+        score += min(0.3, answer_words / 100 * 0.3)
+        
+        # Code context (0-0.2)
+        score += min(0.2, num_contexts / 3 * 0.2)
+        
+        # Reasoning quality (0-0.3)
+        if trace:
+            score += min(0.3, num_steps / 5 * 0.15)
+            score += trace.overall_confidence * 0.15
+        
+        return issues, min(1.0, score)
     
-    def validate_design_solution(self, solution: DesignSolution) -> Dict[str, Any]:
-        """Validate a design solution"""
+    def _inspect_design(self, solution: DesignSolution) -> Tuple[List[str], float]:
+        """Collect validation issues and the quality score for a design solution in one pass"""
+        design_words = _count_words(solution.detailed_design, 150)
+        num_impl_steps = len(solution.implementation_steps)
+        trace = solution.reasoning_trace
+        num_steps = len(trace.steps) if trace else 0
+        
         issues = []
         
         # Check requirement clarity
-        if len(solution.requirement.split()) < 5:
+        if _count_words(solution.requirement, 5) < 5:
             issues.append("Requirement too vague")
         
         # Check solution completeness
-        if len(solution.detailed_design.split()) < 50:
+        if design_words < 50:
             issues.append("Design description too brief")
         
         # Check implementation steps
-        if len(solution.implementation_steps) < 3:
+        if num_impl_steps < 3:
             issues.append("Too few implementation steps")
         
         # Check reasoning trace
-        if not solution.reasoning_trace or len(solution.reasoning_trace.steps) < 3:
+        if num_steps < 3:
             issues.append("Insufficient design reasoning")
         
-        return {
-            'valid': len(issues) == 0,
-            'issues': issues,
-            'quality_score': self._calculate_design_quality_score(solution)
-        }
-    
-    def _calculate_quality_score(self, qa: QAPair) -> float:
-        """Calculate quality score for Q&A"""
-        score = 0.0
-        
-        # Question quality (0-0.2)
-        score += min(0.2, len(qa.question.split()) / 50 * 0.2)
-        
-        # Answer quality (0-0.3)
-        score += min(0.3, len(qa.answer.split()) / 100 * 0.3)
-        
-        # Code context (0-0.2)
-        score += min(0.2, len(qa.code_contexts) / 3 * 0.2)
-        
-        # Reasoning quality (0-0.3)
-        if qa.reasoning_trace:
-            score += min(0.3, len(qa.reasoning_trace.steps) / 5 * 0.15)
-            score += qa.reasoning_trace.overall_confidence * 0.15
-        
-        return min(1.0, score)
-    
-    def _calculate_design_quality_score(self, solution: DesignSolution) -> float:
-        """Calculate quality score for design solution"""
         score = 0.0
         
         # Solution overview (0-0.2)
-        score += min(0.2, len(solution.solution_overview.split()) / 50 * 0.2)
+        score += min(0.2, _count_words(solution.solution_overview, 50) / 50 * 0.2)
         
         # Detailed design (0-0.3)
-        score += min(0.3, len(solution.detailed_design.split()) / 150 * 0.3)
+        score += min(0.3, design_words / 150 * 0.3)
         
         # Implementation steps (0-0.2)
-        score += min(0.2, len(solution.implementation_steps) / 7 * 0.2)
+        score += min(0.2, num_impl_steps / 7 * 0.2)
         
         # Reasoning quality (0-0.3)
-        if solution.reasoning_trace:
-            score += min(0.3, len(solution.reasoning_trace.steps) / 6 * 0.15)
-            score += solution.reasoning_trace.overall_confidence * 0.15
+        if trace:
+            score += min(0.3, num_steps / 6 * 0.15)
+            score += trace.overall_confidence * 0.15
         
-        return min(1.0, score)
+        return issues, min(1.0, score)
     
     def generate_report(self, qa_pairs: List[QAPair], 
                        design_solutions: List[DesignSolution]) -> Dict[str, Any]:
         """Generate quality report"""
         print("\n📈 Generating quality report...")
         
-        # Validate Q&A pairs
-        qa_validations = [self.validate_qa_pair(qa) for qa in qa_pairs]
-        qa_valid_count = sum(1 for v in qa_validations if v['valid'])
-        qa_avg_quality = sum(v['quality_score'] for v in qa_validations) / len(qa_validations) if qa_validations else 0
+        self.reset()
+        for qa in qa_pairs:
+            self.add_qa(qa)
+        for sol in design_solutions:
+            self.add_design(sol)
         
-        # Validate design solutions
-        design_validations = [self.validate_design_solution(sol) for sol in design_solutions]
-        design_valid_count = sum(1 for v in design_validations if v['valid'])
-        design_avg_quality = sum(v['quality_score'] for v in design_validations) / len(design_validations) if design_validations else 0
+        report = self.build_report()
         
-        # Collect statistics
-        report = {
+        self._print_report(report)
+        return report
+    
+    def build_report(self) -> Dict[str, Any]:
+        """Assemble the quality report from the running statistics"""
+        qa_total = self._qa_total
+        design_total = self._design_total
+        qa_avg_quality = self._qa_total_quality / qa_total if qa_total else 0
+        design_avg_quality = self._design_total_quality / design_total if design_total else 0
+        
+        return {
             'qa_pairs': {
-                'total': len(qa_pairs),
-                'valid': qa_valid_count,
-                'invalid': len(qa_pairs) - qa_valid_count,
+                'total': qa_total,
+                'valid': self._qa_valid,
+                'invalid': qa_total - self._qa_valid,
                 'avg_quality_score': round(qa_avg_quality, 3),
-                'question_types': dict(Counter([qa.question_type for qa in qa_pairs])),
-                'languages': dict(Counter([ctx.language for qa in qa_pairs for ctx in qa.code_contexts]))
+                'question_types': dict(self._question_types),
+                'languages': dict(self._languages)
             },
             'design_solutions': {
-                'total': len(design_solutions),
-                'valid': design_valid_count,
-                'invalid': len(design_solutions) - design_valid_count,
+                'total': design_total,
+                'valid': self._design_valid,
+                'invalid': design_total - self._design_valid,
                 'avg_quality_score': round(design_avg_quality, 3),
-                'requirement_types': dict(Counter([sol.requirement_type for sol in design_solutions])),
-                'complexity': dict(Counter([sol.complexity for sol in design_solutions]))
+                'requirement_types': dict(self._requirement_types),
+                'complexity': dict(self._complexities)
             },
             'overall': {
-                'total_samples': len(qa_pairs) + len(design_solutions),
-                'overall_quality': round((qa_avg_quality * len(qa_pairs) + design_avg_quality * len(design_solutions)) / 
-                                       (len(qa_pairs) + len(design_solutions)), 3) if (qa_pairs or design_solutions) else 0
+                'total_samples': qa_total + design_total,
+                'overall_quality': round((qa_avg_quality * qa_total + design_avg_quality * design_total) / 
+                                       (qa_total + design_total), 3) if (qa_total or design_total) else 0
             }
         }
-        
-        self._print_report(report)
-        return report
     
     def _print_report(self, report: Dict[str, Any]):
         """Print quality report"""
-        print("\n" + "="*60)
-        print("📊 QUALITY REPORT")
-        print("="*60)
-        
-        print("\n🎯 Q&A Pairs:")
-        print(f"   Total: {report['qa_pairs']['total']}")
-        print(f"   Valid: {report['qa_pairs']['valid']} ({report['qa_pairs']['valid']/max(1,report['qa_pairs']['total'])*100:.1f}%)")
-        print(f"   Avg Quality Score: {report['qa_pairs']['avg_quality_score']:.3f}")
-        print(f"   Question Types: {report['qa_pairs']['question_types']}")
-        
-        print("\n🏗️  Design Solutions:")
-        print(f"   Total: {report['design_solutions']['total']}")
-        print(f"   Valid: {report['design_solutions']['valid']} ({report['design_solutions']['valid']/max(1,report['design_solutions']['total'])*100:.1f}%)")
-        print(f"   Avg Quality Score: {report['design_solutions']['avg_quality_score']:.3f}")
-        print(f"   Requirement Types: {report['design_solutions']['requirement_types']}")
-        
-        print("\n📈 Overall:")
-        print(f"   Total Samples: {report['overall']['total_samples']}")
-        print(f"   Overall Quality: {report['overall']['overall_quality']:.3f}")
-        print("="*60)
+        qa = report['qa_pairs']
+        design = report['design_solutions']
+        overall = report['overall']
+        separator = "=" * 60
+        
+        lines = [
+            "\n" + separator,
+            "📊 QUALITY REPORT",
+            separator,
+            
+            "\n🎯 Q&A Pairs:",
+            f"   Total: {qa['total']}",
+            f"   Valid: {qa['valid']} ({qa['valid']/max(1, qa['total'])*100:.1f}%)",
+            f"   Avg Quality Score: {qa['avg_quality_score']:.3f}",
+            f"   Question Types: {qa['question_types']}",
+            
+            "\n🏗️  Design Solutions:",
+            f"   Total: {design['total']}",
+            f"   Valid: {design['valid']} ({design['valid']/max(1, design['total'])*100:.1f}%)",
+            f"   Avg Quality Score: {design['avg_quality_score']:.3f}",
+            f"   Requirement Types: {design['requirement_types']}",
+            
+            "\n📈 Overall:",
+            f"   Total Samples: {overall['total_samples']}",
+            f"   Overall Quality: {overall['overall_quality']:.3f}",
+            separator
+        ]
+        
+        # Emit the whole report with a single write
+        print("\n".join(lines))
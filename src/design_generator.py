@@ -3,30 +3,91 @@ Scenario 2: Design Solution Generator
 Generates design solutions based on requirements and architecture
 """
 import random
-import uuid
-from typing import List, Dict, Any
+import asyncio
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 
+from tqdm import tqdm
+
 from src.schema import (
     DesignSolution, ArchitectureContext, ArchitectureComponent,
     CodeContext, ReasoningTrace, ReasoningStep,
-    RequirementType, LanguageType
+    RequirementType, LanguageType, new_sample_id
 )
 from src.analyzer import RepositoryAnalyzer
-from src.llm_service import LLMService
+from src.llm_service import LLMService, compact_json
+from src.semantic_dedup import SemanticDeduplicator
+from src.token_budget import estimate_tokens, trim_to_tokens
+
+
+# Requirement templates per requirement type
+_REQUIREMENT_TEMPLATES = {
+    RequirementType.NEW_FEATURE.value: (
+        "Add user authentication with JWT tokens",
+        "Implement caching layer for frequently accessed data",
+        "Add rate limiting to API endpoints",
+        "Implement real-time notifications using WebSockets",
+        "Add file upload functionality with S3 integration",
+        "Implement search functionality with Elasticsearch",
+        "Add analytics and logging for user actions"
+    ),
+    RequirementType.REFACTORING.value: (
+        "Refactor the data access layer to use repository pattern",
+        "Extract common validation logic into reusable validators",
+        "Improve error handling and add custom exception classes",
+        "Refactor configuration management to use environment variables",
+        "Split large service class into smaller, focused services",
+        "Improve code modularity by applying dependency injection"
+    ),
+    RequirementType.INTEGRATION.value: (
+        "Integrate with third-party payment gateway (Stripe)",
+        "Add integration with email service (SendGrid)",
+        "Implement OAuth2 integration with Google/GitHub",
+        "Integrate with message queue (RabbitMQ/Redis)",
+        "Add monitoring integration with Prometheus",
+        "Integrate with external API for data enrichment"
+    ),
+    RequirementType.OPTIMIZATION.value: (
+        "Optimize database queries to reduce response time",
+        "Implement connection pooling for database connections",
+        "Add caching strategy to reduce API calls",
+        "Optimize image processing pipeline",
+        "Implement lazy loading for heavy resources",
+        "Add background job processing for long-running tasks"
+    )
+}
+_DEFAULT_REQUIREMENTS = ("Implement a new feature",)
+
+# Prompt token budget: fixed instructions, then up to MAX_CODE_EXAMPLES snippets,
+# and the architecture context fills what is left
+MAX_PROMPT_TOKENS = 4000
+PROMPT_OVERHEAD_TOKENS = 800
+MAX_CODE_EXAMPLES = 3
+CODE_EXAMPLE_TOKENS = 150
 
 
 class DesignSolutionGenerator:
     """Generates design solutions from repository analysis"""
     
-    def __init__(self, analyzer: RepositoryAnalyzer, llm_service: LLMService):
+    def __init__(self, analyzer: RepositoryAnalyzer, llm_service: LLMService,
+                 max_prompt_tokens: int = MAX_PROMPT_TOKENS):
         self.analyzer = analyzer
         self.llm = llm_service
+        self.max_prompt_tokens = max_prompt_tokens
         self.generated_requirements = set()
+        # Catches paraphrases of covered requirements that exact matching misses
+        self.requirement_index = SemanticDeduplicator(threshold=0.92)
+        # (arch_context, arch_dict, compact JSON) for the current architecture context
+        self._arch_render = None
+        # Fallback code examples, computed on first use
+        self._complex_funcs = None
+        # Selected code examples per keyword tuple (requirements often share keywords)
+        self._examples_cache: Dict[Tuple[str, ...], List[CodeContext]] = {}
     
     def generate_design_solutions(self, num_samples: int = 20,
-                                 requirement_types: List[str] = None) -> List[DesignSolution]:
-        """Generate design solutions"""
+                                 requirement_types: List[str] = None,
+                                 batch_size: int = 1) -> List[DesignSolution]:
+        """Generate design solutions (batch_size requirements per LLM call)"""
         
         if requirement_types is None:
             requirement_types = [rt.value for rt in RequirementType]
@@ -37,38 +98,103 @@ class DesignSolutionGenerator:
         arch_context = self._build_architecture_context()
         
         solutions = []
-        attempts = 0
-        max_attempts = num_samples * 3
+        pool = self._requirement_pool(requirement_types)
         
-        while len(solutions) < num_samples and attempts < max_attempts:
-            attempts += 1
-            
-            # Select random requirement type
-            req_type = random.choice(requirement_types)
-            
-            # Generate requirement
-            requirement = self._generate_requirement(req_type)
-            
-            if requirement and requirement.lower() not in self.generated_requirements:
-                solution = self._generate_solution(requirement, req_type, arch_context)
+        with tqdm(total=num_samples, desc="   ✅ Generated", mininterval=0.5) as progress:
+            while len(solutions) < num_samples and pool:
+                batch = self._take_requirements(pool, min(max(1, batch_size), num_samples - len(solutions)))
+                
+                results = self._generate_solutions(list(batch.values()), arch_context)
+                self._collect_solutions(batch, results, solutions, progress)
+        
+        print(f"   📊 Successfully generated {len(solutions)} design solutions")
+        return solutions
+    
+    async def generate_design_solutions_async(self, num_samples: int = 20,
+                                              requirement_types: List[str] = None,
+                                              batch_size: int = 1) -> List[DesignSolution]:
+        """Generate design solutions with concurrent LLM calls (bounded by the LLM service)"""
+        
+        if requirement_types is None:
+            requirement_types = [rt.value for rt in RequirementType]
+        
+        print(f"\n🏗️  Generating {num_samples} design solutions (concurrent)...")
+        
+        # Build architecture context first
+        arch_context = self._build_architecture_context()
+        batch_size = max(1, batch_size)
+        
+        solutions = []
+        pool = self._requirement_pool(requirement_types)
+        
+        with tqdm(total=num_samples, desc="   ✅ Generated", mininterval=0.5) as progress:
+            while len(solutions) < num_samples and pool:
+                # Take the requirements still needed for this wave
+                wave = self._take_requirements(pool, num_samples - len(solutions))
                 
-                if solution:
-                    solutions.append(solution)
-                    self.generated_requirements.add(requirement.lower())
-                    print(f"   ✅ Generated {len(solutions)}/{num_samples}", end='\r')
+                # One LLM call per batch, all batches in flight together
+                items = list(wave.values())
+                batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+                batch_results = await self.llm.abatch_generate(
+                    lambda batch: self._agenerate_solutions(batch, arch_context),
+                    batches,
+                    show_progress=False
+                )
+                results = [
+                    solution
+                    for batch, batch_result in zip(batches, batch_results)
+                    for solution in (batch_result or [None] * len(batch))
+                ]
+                self._collect_solutions(wave, results, solutions, progress)
         
-        print(f"\n   📊 Successfully generated {len(solutions)} design solutions")
+        print(f"   📊 Successfully generated {len(solutions)} design solutions")
         return solutions
     
+    def _requirement_pool(self, requirement_types: List[str]) -> List[Tuple[str, str]]:
+        """All not-yet-covered (requirement, type) templates for the given types, shuffled"""
+        pool = [
+            (requirement, req_type)
+            for req_type in dict.fromkeys(requirement_types)
+            for requirement in _REQUIREMENT_TEMPLATES.get(req_type, _DEFAULT_REQUIREMENTS)
+            if requirement.lower() not in self.generated_requirements
+        ]
+        random.shuffle(pool)
+        return pool
+    
+    def _take_requirements(self, pool: List[Tuple[str, str]], count: int) -> Dict[str, Tuple[str, str]]:
+        """
+        Pop up to count requirements from the pool, skipping paraphrases of covered ones.
+        
+        Returns the requirements keyed by their lowercased text.
+        """
+        taken = {}
+        while pool and len(taken) < count:
+            requirement, req_type = pool.pop()
+            key = requirement.lower()
+            if key not in taken and not self.requirement_index.is_duplicate(requirement):
+                taken[key] = (requirement, req_type)
+        return taken
+    
+    def _collect_solutions(self, drawn: Dict[str, Tuple[str, str]], results: List[DesignSolution],
+                           solutions: List[DesignSolution], progress: tqdm):
+        """Append successful results and mark their requirements as covered"""
+        for key, solution in zip(drawn, results):
+            if solution:
+                solutions.append(solution)
+                self.generated_requirements.add(key)
+                self.requirement_index.add(drawn[key][0])
+                progress.update(1)
+    
     def _build_architecture_context(self) -> ArchitectureContext:
         """Build architecture context from repository analysis"""
         
         # Extract components from directory structure
+        # (fields come straight from the analyzer with the right types, so skip validation)
         components = []
         
         for dir_name, files in self.analyzer.architecture.get('directory_structure', {}).items():
             if dir_name != '.':
-                component = ArchitectureComponent(
+                component = ArchitectureComponent.model_construct(
                     name=dir_name.split('/')[-1] or 'root',
                     type='module',
                     description=f"Module containing {len(files)} files",
@@ -79,7 +205,7 @@ class DesignSolutionGenerator:
         
         # Add classes as components
         for cls in self.analyzer.classes[:10]:  # Limit to top 10 classes
-            component = ArchitectureComponent(
+            component = ArchitectureComponent.model_construct(
                 name=cls.name,
                 type='class',
                 description=cls.docstring or f"Class with {len(cls.methods)} methods",
@@ -112,143 +238,197 @@ class DesignSolutionGenerator:
         else:
             return 'Modular Monolith'
     
-    def _generate_requirement(self, requirement_type: str) -> str:
-        """Generate a realistic requirement"""
-        
-        templates = {
-            RequirementType.NEW_FEATURE.value: [
-                "Add user authentication with JWT tokens",
-                "Implement caching layer for frequently accessed data",
-                "Add rate limiting to API endpoints",
-                "Implement real-time notifications using WebSockets",
-                "Add file upload functionality with S3 integration",
-                "Implement search functionality with Elasticsearch",
-                "Add analytics and logging for user actions"
-            ],
-            RequirementType.REFACTORING.value: [
-                "Refactor the data access layer to use repository pattern",
-                "Extract common validation logic into reusable validators",
-                "Improve error handling and add custom exception classes",
-                "Refactor configuration management to use environment variables",
-                "Split large service class into smaller, focused services",
-                "Improve code modularity by applying dependency injection"
-            ],
-            RequirementType.INTEGRATION.value: [
-                "Integrate with third-party payment gateway (Stripe)",
-                "Add integration with email service (SendGrid)",
-                "Implement OAuth2 integration with Google/GitHub",
-                "Integrate with message queue (RabbitMQ/Redis)",
-                "Add monitoring integration with Prometheus",
-                "Integrate with external API for data enrichment"
-            ],
-            RequirementType.OPTIMIZATION.value: [
-                "Optimize database queries to reduce response time",
-                "Implement connection pooling for database connections",
-                "Add caching strategy to reduce API calls",
-                "Optimize image processing pipeline",
-                "Implement lazy loading for heavy resources",
-                "Add background job processing for long-running tasks"
-            ]
-        }
-        
-        candidates = templates.get(requirement_type, ["Implement a new feature"])
-        return random.choice(candidates)
-    
     def _generate_solution(self, requirement: str, requirement_type: str,
                           arch_context: ArchitectureContext) -> DesignSolution:
         """Generate a design solution"""
+        code_examples, llm_args = self._prepare_solution(requirement, requirement_type, arch_context)
+        
+        try:
+            # Generate with LLM
+            llm_response = self.llm.generate_design_solution(**llm_args)
+            return self._build_solution(requirement, requirement_type, arch_context,
+                                        code_examples, llm_response)
+        
+        except Exception as e:
+            print(f"\n   ⚠️  Error generating design solution: {e}")
+            return None
+    
+    async def _agenerate_solution(self, requirement: str, requirement_type: str,
+                                  arch_context: ArchitectureContext) -> DesignSolution:
+        """Async variant of _generate_solution"""
+        code_examples, llm_args = self._prepare_solution(requirement, requirement_type, arch_context)
+        
+        try:
+            # Generate with LLM
+            llm_response = await self.llm.agenerate_design_solution(**llm_args)
+            # Model validation runs off the event loop so other requests keep flowing
+            return await asyncio.to_thread(self._build_solution, requirement, requirement_type,
+                                           arch_context, code_examples, llm_response)
+        
+        except Exception as e:
+            print(f"\n   ⚠️  Error generating design solution: {e}")
+            return None
+    
+    def _prepare_solution(self, requirement: str, requirement_type: str,
+                          arch_context: ArchitectureContext) -> Tuple[List[CodeContext], Dict[str, Any]]:
+        """Select code examples and build the LLM request for a requirement"""
         
         # Select relevant code examples
         code_examples = self._select_relevant_code_examples(requirement)
         
-        try:
-            # Prepare architecture context for LLM
+        # Architecture context for LLM (prepared once per run)
+        arch_dict, arch_summary = self._render_architecture(arch_context)
+        
+        # Prepare code examples (most relevant first, each trimmed to its token share)
+        code_ex_list = [
+            {
+                'file_path': ex.file_path,
+                'code': trim_to_tokens(ex.code_snippet, CODE_EXAMPLE_TOKENS)
+            }
+            for ex in code_examples[:MAX_CODE_EXAMPLES]
+        ]
+        
+        return code_examples, {
+            'requirement': requirement,
+            'architecture_context': arch_dict,
+            'code_examples': code_ex_list,
+            'requirement_type': requirement_type,
+            'architecture_summary': arch_summary
+        }
+    
+    def _render_architecture(self, arch_context: ArchitectureContext) -> Tuple[Dict[str, Any], str]:
+        """Prepare the architecture context for LLM prompts (compact JSON), once per architecture context"""
+        if self._arch_render is None or self._arch_render[0] is not arch_context:
             arch_dict = {
-                'components': [
-                    {
-                        'name': c.name,
-                        'type': c.type,
-                        'description': c.description,
-                        'dependencies': c.dependencies
-                    }
-                    for c in arch_context.components[:10]  # Limit for token count
-                ],
+                'components': [],
                 'design_patterns': arch_context.design_patterns,
                 'tech_stack': arch_context.tech_stack,
                 'architecture_type': arch_context.architecture_type
             }
             
-            # Prepare code examples
-            code_ex_list = [
-                {
-                    'file_path': ex.file_path,
-                    'code': ex.code_snippet[:500]  # Limit code length
+            # Add components in order while they fit in the budget left by the prompt
+            # instructions and code examples
+            budget = (self.max_prompt_tokens - PROMPT_OVERHEAD_TOKENS
+                      - MAX_CODE_EXAMPLES * CODE_EXAMPLE_TOKENS
+                      - estimate_tokens(compact_json(arch_dict)))
+            for c in arch_context.components:
+                component = {
+                    'name': c.name,
+                    'type': c.type,
+                    'description': c.description,
+                    'dependencies': c.dependencies
                 }
-                for ex in code_examples[:3]
-            ]
+                budget -= estimate_tokens(compact_json(component)) + 1
+                if budget < 0:
+                    break
+                arch_dict['components'].append(component)
             
-            # Generate with LLM
-            llm_response = self.llm.generate_design_solution(
-                requirement=requirement,
-                architecture_context=arch_dict,
-                code_examples=code_ex_list,
-                requirement_type=requirement_type
-            )
-            
-            # Check if LLM returned valid response
-            if llm_response is None:
-                return None
-            
-            # Parse affected components
-            affected_components = llm_response.get('affected_components', [])
-            
-            # Create code contexts from examples
-            code_contexts = code_examples[:3]
-            
-            # Add generated code examples
-            for gen_ex in llm_response.get('code_examples', [])[:2]:
-                if 'code' in gen_ex:
-                    code_contexts.append(
-                        CodeContext(
-                            file_path="generated_example.py",
-                            start_line=1,
-                            end_line=len(gen_ex['code'].split('\n')),
-                            code_snippet=gen_ex['code'],
-                            language=LanguageType.PYTHON
-                        )
+            self._arch_render = (arch_context, arch_dict, compact_json(arch_dict))
+        return self._arch_render[1], self._arch_render[2]
+    
+    def _build_solution(self, requirement: str, requirement_type: str,
+                        arch_context: ArchitectureContext, code_examples: List[CodeContext],
+                        llm_response: Optional[Dict[str, Any]],
+                        created_at: Optional[datetime] = None) -> DesignSolution:
+        """Create the DesignSolution from the LLM response"""
+        # Check if LLM returned valid response
+        if llm_response is None:
+            return None
+        
+        # Parse affected components
+        affected_components = llm_response.get('affected_components', [])
+        
+        # Create code contexts from examples
+        code_contexts = code_examples[:3]
+        
+        # Add generated code examples
+        for gen_ex in llm_response.get('code_examples', [])[:2]:
+            if 'code' in gen_ex:
+                code_contexts.append(
+                    CodeContext(
+                        file_path="generated_example.py",
+                        start_line=1,
+                        end_line=len(gen_ex['code'].split('\n')),
+                        code_snippet=gen_ex['code'],
+                        language=LanguageType.PYTHON
                     )
-            
-            # Create DesignSolution object
-            solution = DesignSolution(
-                id=str(uuid.uuid4()),
-                requirement=requirement,
-                requirement_type=RequirementType(requirement_type),
-                solution_overview=llm_response['solution_overview'],
-                detailed_design=llm_response['detailed_design'],
-                implementation_steps=llm_response['implementation_steps'],
-                architecture_context=arch_context,
-                affected_components=affected_components,
-                code_examples=code_contexts,
-                reasoning_trace=ReasoningTrace(
-                    steps=[
-                        ReasoningStep(**step)
-                        for step in llm_response['reasoning_trace']['steps']
-                    ],
-                    overall_confidence=llm_response['reasoning_trace']['overall_confidence'],
-                    methodology=llm_response['reasoning_trace']['methodology']
-                ),
-                complexity=llm_response.get('complexity', 'medium'),
-                estimated_effort=llm_response.get('estimated_effort', '1-2 weeks'),
-                risks=llm_response.get('risks', []),
-                tags=llm_response.get('tags', []),
-                created_at=datetime.now()
-            )
-            
-            return solution
+                )
         
-        except Exception as e:
-            print(f"\n   ⚠️  Error generating design solution: {e}")
-            return None
+        # Create DesignSolution object
+        solution = DesignSolution(
+            id=new_sample_id(),
+            requirement=requirement,
+            requirement_type=RequirementType(requirement_type),
+            solution_overview=llm_response['solution_overview'],
+            detailed_design=llm_response['detailed_design'],
+            implementation_steps=llm_response['implementation_steps'],
+            architecture_context=arch_context,
+            affected_components=affected_components,
+            code_examples=code_contexts,
+            reasoning_trace=ReasoningTrace(
+                steps=[
+                    ReasoningStep(**step)
+                    for step in llm_response['reasoning_trace']['steps']
+                ],
+                overall_confidence=llm_response['reasoning_trace']['overall_confidence'],
+                methodology=llm_response['reasoning_trace']['methodology']
+            ),
+            complexity=llm_response.get('complexity', 'medium'),
+            estimated_effort=llm_response.get('estimated_effort', '1-2 weeks'),
+            risks=llm_response.get('risks', []),
+            tags=llm_response.get('tags', []),
+            created_at=created_at or datetime.now()
+        )
+        
+        return solution
+    
+    def _generate_solutions(self, items: List[Tuple[str, str]],
+                            arch_context: ArchitectureContext) -> List[DesignSolution]:
+        """Generate solutions for (requirement, type) pairs, several per LLM call when batched"""
+        if len(items) == 1:
+            return [self._generate_solution(*items[0], arch_context)]
+        
+        prepared = [self._prepare_solution(req, req_type, arch_context) for req, req_type in items]
+        llm_responses = self.llm.generate_design_solutions_batch(**self._batch_llm_args(prepared))
+        return self._build_solutions(items, arch_context, prepared, llm_responses)
+    
+    async def _agenerate_solutions(self, items: List[Tuple[str, str]],
+                                   arch_context: ArchitectureContext) -> List[DesignSolution]:
+        """Async variant of _generate_solutions"""
+        if len(items) == 1:
+            return [await self._agenerate_solution(*items[0], arch_context)]
+        
+        prepared = [self._prepare_solution(req, req_type, arch_context) for req, req_type in items]
+        llm_responses = await self.llm.agenerate_design_solutions_batch(**self._batch_llm_args(prepared))
+        return await asyncio.to_thread(self._build_solutions, items, arch_context, prepared, llm_responses)
+    
+    @staticmethod
+    def _batch_llm_args(prepared: List[Tuple[List[CodeContext], Dict[str, Any]]]) -> Dict[str, Any]:
+        """Merge per-requirement LLM arguments into one batched request"""
+        return {
+            'requirements': [args['requirement'] for _, args in prepared],
+            # The architecture summary is the same for every requirement
+            'architecture_context': prepared[0][1]['architecture_context'],
+            'code_examples_per_req': [args['code_examples'] for _, args in prepared],
+            'requirement_types': [args['requirement_type'] for _, args in prepared],
+            'architecture_summary': prepared[0][1]['architecture_summary']
+        }
+    
+    def _build_solutions(self, items: List[Tuple[str, str]], arch_context: ArchitectureContext,
+                         prepared: List[Tuple[List[CodeContext], Dict[str, Any]]],
+                         llm_responses: List[Optional[Dict[str, Any]]]) -> List[DesignSolution]:
+        """Create DesignSolution objects from a batched LLM response"""
+        # Solutions from one response share its timestamp
+        created_at = datetime.now()
+        solutions = []
+        for (requirement, req_type), (code_examples, _), llm_response in zip(items, prepared, llm_responses):
+            try:
+                solutions.append(self._build_solution(requirement, req_type, arch_context,
+                                                      code_examples, llm_response, created_at))
+            except Exception as e:
+                print(f"\n   ⚠️  Error generating design solution: {e}")
+                solutions.append(None)
+        return solutions
     
     def _select_relevant_code_examples(self, requirement: str) -> List[CodeContext]:
         """Select code examples relevant to the requirement"""
@@ -256,40 +436,48 @@ class DesignSolutionGenerator:
         # Extract keywords from requirement
         keywords = [word.lower() for word in requirement.split() 
                    if len(word) > 4 and word.isalpha()]
+        keywords = tuple(keywords[:3])  # Limit keyword search
         
+        examples = self._examples_cache.get(keywords)
+        if examples is None:
+            examples = self._examples_cache[keywords] = self._examples_for_keywords(keywords)
+        return list(examples)
+    
+    def _examples_for_keywords(self, keywords: Tuple[str, ...]) -> List[CodeContext]:
+        """Code examples for a keyword tuple: keyword matches, else complex functions"""
         relevant_examples = []
         
-        # Search for relevant code
-        for keyword in keywords[:3]:  # Limit keyword search
-            matching_files = self.analyzer.search_code(keyword)
+        # Search for relevant code (all keywords in one pass over the repository)
+        matches = self.analyzer.search_many(keywords)
+        for keyword in keywords:
+            matching_files = matches[keyword]
             
             for code_file in matching_files[:2]:  # Limit files per keyword
-                # Take a reasonable snippet
-                snippet_lines = min(50, code_file.lines)
-                
-                context = CodeContext(
+                # Take a reasonable snippet (analyzer output is trusted: construct without
+                # validation, storing the enum value as use_enum_values would)
+                context = CodeContext.model_construct(
                     file_path=code_file.path,
                     start_line=1,
-                    end_line=snippet_lines,
-                    code_snippet=code_file.get_snippet(1, snippet_lines),
-                    language=LanguageType(code_file.language)
+                    end_line=code_file.head_lines,
+                    code_snippet=code_file.head_snippet,
+                    language=LanguageType(code_file.language).value
                 )
                 relevant_examples.append(context)
         
         # If no keyword matches, use random complex functions
         if not relevant_examples:
-            complex_funcs = self.analyzer.get_functions_by_complexity(min_complexity=3)
+            if self._complex_funcs is None:
+                self._complex_funcs = self.analyzer.get_functions_by_complexity(min_complexity=3)[:3]
             
-            for func in complex_funcs[:3]:
-                code_file = next((f for f in self.analyzer.code_files 
-                                if f.path == func.file_path), None)
+            for func in self._complex_funcs:
+                code_file = self.analyzer.get_file(func.file_path)
                 if code_file:
-                    context = CodeContext(
+                    context = CodeContext.model_construct(
                         file_path=func.file_path,
                         start_line=func.start_line,
                         end_line=func.end_line,
                         code_snippet=func.code,
-                        language=LanguageType(code_file.language)
+                        language=LanguageType(code_file.language).value
                     )
                     relevant_examples.append(context)
         
@@ -0,0 +1,41 @@
+"""
+File Walker
+Fast recursive discovery of source files using os.scandir
+"""
+import os
+from typing import FrozenSet, Iterator, Union
+
+
+def iter_code_files(root: Union[str, os.PathLike],
+                    extensions: FrozenSet[str],
+                    exclude_dirs: FrozenSet[str]) -> Iterator[str]:
+    """
+    Yield paths of files under root whose extension (e.g. '.py') is in extensions.
+
+    Visits entries in the same order as a top-down os.walk, without descending
+    into excluded or symlinked directories. Unreadable directories are skipped.
+    """
+    stack = [os.fspath(root)]
+    while stack:
+        directory = stack.pop()
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+
+                    if is_dir:
+                        if entry.name not in exclude_dirs and not entry.is_symlink():
+                            subdirs.append(entry.path)
+                    elif os.path.splitext(entry.name)[1] in extensions:
+                        files.append(entry.path)
+        except OSError:
+            continue
+
+        yield from files
+        # Reversed so the first subdirectory is popped next (pre-order, like os.walk)
+        stack.extend(reversed(subdirs))
@@ -0,0 +1,92 @@
+"""
+LLM Response Cache
+Stores completions on disk keyed by a hash of the full request, so re-runs skip finished prompts
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+
+
+_TRAILING_SPACE_RE = re.compile(r'[ \t\r]+$', re.MULTILINE)
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+
+
+def normalize_prompt(text: str) -> str:
+    """Drop trailing whitespace per line and collapse runs of blank lines.
+
+    Leading whitespace is kept: indentation is significant in code snippets,
+    so prompts that differ in it must not share a cached response.
+    """
+    return _BLANK_LINES_RE.sub('\n\n', _TRAILING_SPACE_RE.sub('', text))
+
+
+def make_cache_key(**request: Any) -> str:
+    """Build a stable SHA-256 key from the request parameters"""
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed cache of LLM completions with an in-memory LRU in front (safe to share across threads)"""
+
+    def __init__(self, db_path: str, memory_size: int = 1024):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+        # Recently used responses, so repeated lookups skip SQLite entirely
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+
+        # Autocommit so completed responses survive an interrupted run
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, "
+            "response TEXT NOT NULL)"
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response, or None on miss"""
+        with self._lock:
+            response = self._memory.get(key)
+            if response is not None:
+                self._memory.move_to_end(key)
+                return response
+
+            row = self.conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._remember(key, row[0])
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """Store a response"""
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)",
+                (key, response)
+            )
+            self._remember(key, response)
+
+    def _remember(self, key: str, response: str):
+        """Add to the in-memory LRU, evicting the least recently used entry (caller holds the lock)"""
+        if self.memory_size <= 0:
+            return
+        self._memory[key] = response
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def close(self):
+        """Close the underlying connection"""
+        with self._lock:
+            self.conn.close()
@@ -4,29 +4,193 @@ LLM Service for generating Q&A pairs and design solutions
 import os
 import json
 import time
+import asyncio
 import functools
-from typing import List, Dict, Any, Optional, Callable
-from openai import OpenAI
-from anthropic import Anthropic
+import contextlib
+from typing import List, Dict, Any, Optional, Callable, Tuple
+import openai
+import anthropic
+from openai import OpenAI, AsyncOpenAI
+from anthropic import Anthropic, AsyncAnthropic
+from pydantic import ValidationError
+from tqdm import tqdm
+
+from src.llm_cache import ResponseCache, make_cache_key, normalize_prompt
+from src.rate_limit import RateLimiter, backoff_delay
+from src.token_budget import estimate_tokens
 
 try:
     import google.generativeai as genai
 except ImportError:
     genai = None
 
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def compact_json(data: Any) -> str:
+    """Serialize data for a prompt without indentation (whitespace only costs tokens)"""
+    if orjson is not None:
+        return orjson.dumps(data, default=str).decode('utf-8')
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+# Parse LLM JSON with orjson when available (its JSONDecodeError subclasses json's)
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+
+# System prompts (identical for every request of a kind)
+_QA_SYSTEM_PROMPT = """You are an expert software engineer and educator. Your task is to generate high-quality training data for fine-tuning an LLM to understand codebases.
+
+Generate a question-answer pair about the provided code, including a detailed reasoning trace that shows your thought process."""
+
+_QA_BATCH_SYSTEM_PROMPT = """You are an expert software engineer and educator. Your task is to generate high-quality training data for fine-tuning an LLM to understand codebases.
+
+Generate one question-answer pair about each provided code snippet, each including a detailed reasoning trace that shows your thought process."""
+
+# JSON structure the model is asked to return for one Q&A pair
+_QA_PAIR_FORMAT = """{
+    "question": "A clear, specific question about the code",
+    "answer": "A comprehensive answer with explanations",
+    "reasoning_trace": {
+        "steps": [
+            {
+                "step_number": 1,
+                "description": "First reasoning step",
+                "code_reference": "Relevant code reference",
+                "confidence": 0.9
+            }
+        ],
+        "overall_confidence": 0.85,
+        "methodology": "Explanation of reasoning approach"
+    },
+    "difficulty": "easy|medium|hard",
+    "tags": ["tag1", "tag2"]
+}"""
+
+_DESIGN_SYSTEM_PROMPT = """You are a senior software architect. Your task is to generate comprehensive design solutions based on the existing codebase architecture.
+
+Provide detailed design solutions with step-by-step reasoning that shows how you arrived at the solution."""
+
+_DESIGN_BATCH_SYSTEM_PROMPT = """You are a senior software architect. Your task is to generate comprehensive design solutions based on the existing codebase architecture.
+
+Provide detailed design solutions with step-by-step reasoning that shows how you arrived at each solution."""
+
+# JSON structure the model is asked to return for one design solution
+_DESIGN_SOLUTION_FORMAT = """{
+    "solution_overview": "High-level solution summary",
+    "detailed_design": "Comprehensive design explanation",
+    "implementation_steps": [
+        "Step 1: ...",
+        "Step 2: ..."
+    ],
+    "affected_components": ["component1", "component2"],
+    "code_examples": [
+        {
+            "description": "Example description",
+            "code": "Code snippet showing implementation"
+        }
+    ],
+    "reasoning_trace": {
+        "steps": [
+            {
+                "step_number": 1,
+                "description": "Design reasoning step",
+                "code_reference": "Reference to existing code",
+                "confidence": 0.9
+            }
+        ],
+        "overall_confidence": 0.85,
+        "methodology": "Design methodology used"
+    },
+    "complexity": "low|medium|high",
+    "estimated_effort": "Time estimate",
+    "risks": ["risk1", "risk2"],
+    "tags": ["tag1", "tag2"]
+}"""
+
+
+class _JsonObjectTracker:
+    """Incrementally tracks streamed text and reports when the first top-level JSON object is complete"""
+    
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+    
+    def feed(self, text: str) -> bool:
+        """Consume a chunk; True once the outermost object has been closed"""
+        for char in text:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                if self.started:
+                    self.in_string = True
+            elif char == '{':
+                self.depth += 1
+                self.started = True
+            elif char == '}' and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
+
+# Errors that fail the same way on every attempt, so retrying only wastes time
+FATAL_ERRORS = (
+    json.JSONDecodeError, KeyError, ValidationError,
+    openai.BadRequestError, openai.AuthenticationError, openai.PermissionDeniedError,
+    openai.NotFoundError, openai.UnprocessableEntityError,
+    anthropic.BadRequestError, anthropic.AuthenticationError, anthropic.PermissionDeniedError,
+    anthropic.NotFoundError, anthropic.UnprocessableEntityError,
+)
+
 
 def retry_with_backoff(max_retries: int = 3, base_delay: float = 1.0, backoff_factor: float = 2.0):
-    """装饰器：使用指数退避策略重试函数"""
+    """装饰器：使用带抖动的指数退避策略重试函数（同时支持协程函数），不可恢复的错误直接抛出"""
     def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                for attempt in range(max_retries):
+                    try:
+                        return await func(*args, **kwargs)
+                    except FATAL_ERRORS:
+                        raise
+                    except Exception as e:
+                        if attempt == max_retries - 1:
+                            raise
+                        delay = backoff_delay(e, attempt, base_delay, backoff_factor)
+                        print(f"   ⚠️  Attempt {attempt + 1} failed: {str(e)[:100]}")
+                        print(f"   🔄 Retrying in {delay:.1f}s...")
+                        await asyncio.sleep(delay)
+                return None
+            return async_wrapper
+        
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             for attempt in range(max_retries):
                 try:
                     return func(*args, **kwargs)
+                except FATAL_ERRORS:
+                    raise
                 except Exception as e:
                     if attempt == max_retries - 1:
                         raise
-                    delay = base_delay * (backoff_factor ** attempt)
+                    delay = backoff_delay(e, attempt, base_delay, backoff_factor)
                     print(f"   ⚠️  Attempt {attempt + 1} failed: {str(e)[:100]}")
                     print(f"   🔄 Retrying in {delay:.1f}s...")
                     time.sleep(delay)
@@ -56,7 +220,7 @@ class LLMService:
                 # Try to fix common JSON issues
         try:
             # First try parsing as-is
-            json.loads(response_cleaned)
+            _json_loads(response_cleaned)
             return response_cleaned
         except json.JSONDecodeError:
             # If failed, try to extract JSON object from partial response
@@ -75,10 +239,33 @@ class LLMService:
                 response_cleaned = response_cleaned[:last_valid_pos]
                 return response_cleaned
     
-    def __init__(self, provider: str = "openai", model: str = None, temperature: float = 0.7):
+    def __init__(self, provider: str = "openai", model: str = None, temperature: float = 0.7,
+                 cache_path: Optional[str] = None, max_concurrency: int = 4,
+                 cache_seed: Optional[int] = None, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None):
         self.provider = provider.lower()
         self.temperature = temperature
         
+        # Optional on-disk response cache, so re-runs skip prompts that already completed.
+        # Sampled (temperature > 0) responses are only cached when a cache_seed opts in;
+        # the seed is part of the key, so changing it yields fresh samples.
+        self.cache_seed = cache_seed
+        use_cache = cache_path and (temperature == 0 or cache_seed is not None)
+        self.cache = ResponseCache(cache_path) if use_cache else None
+        
+        # Upper bound on in-flight requests for the async helpers
+        self.max_concurrency = max(1, max_concurrency)
+        self._semaphore = None
+        self._semaphore_loop = None
+        
+        # Pace async requests to the provider's RPM/TPM quota instead of running into 429s
+        self._rate_limiter = None
+        if requests_per_minute or tokens_per_minute:
+            self._rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        
+        # Shared keep-alive connection pool for the async SDK clients
+        self._http = None
+        
         if self.provider == "openai":
             self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
             self.model = model or os.getenv("OPENAI_MODEL", "gpt-4-turbo-preview")
@@ -93,85 +280,280 @@ class LLMService:
             self.client = genai.GenerativeModel(self.model)
         else:
             raise ValueError(f"Unsupported provider: {provider}")
+        
+        self._async_client = self._make_async_client()
     
-    @retry_with_backoff(max_retries=3, base_delay=2.0, backoff_factor=2.0)
-    def generate_completion(self, prompt: str, system_prompt: str = None, 
-                          max_tokens: int = 2048, json_mode: bool = False) -> str:
-        """Generate a completion with retry logic"""
-        # Rate limiting: small delay between requests
-        time.sleep(0.5)
+    @property
+    def async_client(self):
+        """Async SDK client; rebuilt with a fresh connection pool on first use after aclose()"""
+        if self._async_client is None:
+            self._async_client = self._make_async_client()
+        return self._async_client
+    
+    def _make_async_client(self):
+        """Create the provider's async client on top of a new shared connection pool"""
+        if self.provider == "gemini":
+            # GenerativeModel exposes generate_content_async itself
+            return self.client
+        
+        self._http = self._make_http_client()
+        http_kwargs = {'http_client': self._http} if self._http is not None else {}
+        if self.provider == "openai":
+            return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), **http_kwargs)
+        return AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), **http_kwargs)
+    
+    @staticmethod
+    def _make_http_client():
+        """Pooled async HTTP client (HTTP/2 when the h2 package is installed), or None without httpx"""
+        if httpx is None:
+            return None
         
         try:
-            if self.provider == "openai":
-                messages = []
-                if system_prompt:
-                    messages.append({"role": "system", "content": system_prompt})
-                messages.append({"role": "user", "content": prompt})
-                
-                kwargs = {
-                    "model": self.model,
-                    "messages": messages,
-                    "temperature": self.temperature,
-                    "max_tokens": max_tokens
-                }
-                
-                if json_mode:
-                    kwargs["response_format"] = {"type": "json_object"}
-                
-                response = self.client.chat.completions.create(**kwargs)
-                return response.choices[0].message.content
+            import h2  # noqa: F401
+            http2 = True
+        except ImportError:
+            http2 = False
+        
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            timeout=httpx.Timeout(600.0, connect=10.0)
+        )
+    
+    async def aclose(self):
+        """Close the async clients' connection pool (call before the event loop ends)
+
+        The async client is dropped along with it and rebuilt if the service is used again.
+        """
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+            self._async_client = None
+    
+    def generate_completion(self, prompt: str, system_prompt: str = None, 
+                          max_tokens: int = 2048, json_mode: bool = False,
+                          use_cache: bool = True) -> str:
+        """Generate a completion, served from the response cache when possible"""
+        if self.cache is None or not use_cache:
+            return self._request_completion(prompt, system_prompt, max_tokens, json_mode)
+        
+        key = self._cache_key(prompt, system_prompt, max_tokens, json_mode)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        
+        response = self._request_completion(prompt, system_prompt, max_tokens, json_mode)
+        if response:
+            self.cache.put(key, response)
+        return response
+    
+    async def agenerate_completion(self, prompt: str, system_prompt: str = None,
+                                   max_tokens: int = 2048, json_mode: bool = False,
+                                   use_cache: bool = True) -> str:
+        """Async variant of generate_completion, at most max_concurrency requests in flight"""
+        key = None
+        if self.cache is not None and use_cache:
+            key = self._cache_key(prompt, system_prompt, max_tokens, json_mode)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
+        async with self._get_semaphore():
+            response = await self._arequest_completion(prompt, system_prompt, max_tokens, json_mode)
+        
+        if key is not None and response:
+            self.cache.put(key, response)
+        return response
+    
+    def _cache_key(self, prompt: str, system_prompt: Optional[str],
+                   max_tokens: int, json_mode: bool) -> str:
+        """Cache key covering everything that affects the completion"""
+        # Trailing spaces and extra blank lines don't change the request;
+        # indentation does, so it is kept as is
+        request = dict(
+            provider=self.provider, model=self.model, temperature=self.temperature,
+            system_prompt=normalize_prompt(system_prompt) if system_prompt else system_prompt,
+            prompt=normalize_prompt(prompt),
+            max_tokens=max_tokens, json_mode=json_mode
+        )
+        if self.cache_seed is not None:
+            request['cache_seed'] = self.cache_seed
+        return make_cache_key(**request)
+    
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Concurrency limiter bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+    
+    async def run_limited(self, func: Callable, *args, **kwargs):
+        """Run a blocking LLM-bound call in a worker thread, at most max_concurrency at a time"""
+        async with self._get_semaphore():
+            return await asyncio.to_thread(func, *args, **kwargs)
+    
+    def _build_request(self, prompt: str, system_prompt: Optional[str],
+                       max_tokens: int, json_mode: bool) -> Dict[str, Any]:
+        """Provider-specific request arguments"""
+        if self.provider == "openai":
+            messages = []
+            if system_prompt:
+                messages.append({"role": "system", "content": system_prompt})
+            messages.append({"role": "user", "content": prompt})
             
-            elif self.provider == "anthropic":
-                kwargs = {
-                    "model": self.model,
-                    "max_tokens": max_tokens,
-                    "temperature": self.temperature,
-                    "messages": [{"role": "user", "content": prompt}]
-                }
-                
-                if system_prompt:
-                    kwargs["system"] = system_prompt
-                
-                response = self.client.messages.create(**kwargs)
-                return response.content[0].text
+            kwargs = {
+                "model": self.model,
+                "messages": messages,
+                "temperature": self.temperature,
+                "max_tokens": max_tokens
+            }
             
-            elif self.provider == "gemini":
-                # Combine system prompt and user prompt for Gemini
-                full_prompt = prompt
-                if system_prompt:
-                    full_prompt = f"{system_prompt}\n\n{prompt}"
-                
-                # Configure generation
-                generation_config = {
-                    "temperature": self.temperature,
-                    "max_output_tokens": max_tokens,
-                }
-                
-                if json_mode:
-                    full_prompt += "\n\nPlease respond with valid JSON only."
-                
-                response = self.client.generate_content(
-                    full_prompt,
-                    generation_config=generation_config
-                )
-                
-                # Check if response is valid
-                if response and hasattr(response, 'text'):
-                    return response.text
-                else:
-                    raise ValueError("Empty response from Gemini API")
+            if json_mode:
+                kwargs["response_format"] = {"type": "json_object"}
+            return kwargs
         
-        except Exception as e:
-            # Re-raise to trigger retry logic
-            raise Exception(f"API call failed: {str(e)[:200]}")
+        elif self.provider == "anthropic":
+            kwargs = {
+                "model": self.model,
+                "max_tokens": max_tokens,
+                "temperature": self.temperature,
+                "messages": [{"role": "user", "content": prompt}]
+            }
+            
+            if system_prompt:
+                kwargs["system"] = system_prompt
+            return kwargs
+        
+        # Gemini: combine system prompt and user prompt
+        full_prompt = prompt
+        if system_prompt:
+            full_prompt = f"{system_prompt}\n\n{prompt}"
+        
+        if json_mode:
+            full_prompt += "\n\nPlease respond with valid JSON only."
+        
+        return {
+            "contents": full_prompt,
+            "generation_config": {
+                "temperature": self.temperature,
+                "max_output_tokens": max_tokens,
+            }
+        }
+    
+    def _response_text(self, response: Any) -> str:
+        """Extract the completion text from a provider response"""
+        if self.provider == "openai":
+            return response.choices[0].message.content
+        elif self.provider == "anthropic":
+            return response.content[0].text
+        
+        # Check if Gemini response is valid
+        if response and hasattr(response, 'text'):
+            return response.text
+        raise ValueError("Empty response from Gemini API")
+    
+    @retry_with_backoff(max_retries=3, base_delay=2.0, backoff_factor=2.0)
+    def _request_completion(self, prompt: str, system_prompt: str = None,
+                            max_tokens: int = 2048, json_mode: bool = False) -> str:
+        """Call the provider API with retry logic"""
+        # Rate limiting: small delay between requests
+        time.sleep(0.5)
+        
+        kwargs = self._build_request(prompt, system_prompt, max_tokens, json_mode)
+        if self.provider == "openai":
+            response = self.client.chat.completions.create(**kwargs)
+        elif self.provider == "anthropic":
+            response = self.client.messages.create(**kwargs)
+        else:
+            response = self.client.generate_content(**kwargs)
+        return self._response_text(response)
+    
+    @retry_with_backoff(max_retries=3, base_delay=2.0, backoff_factor=2.0)
+    async def _arequest_completion(self, prompt: str, system_prompt: str = None,
+                                   max_tokens: int = 2048, json_mode: bool = False) -> str:
+        """Call the provider's async API with retry logic"""
+        # Rate limiting: wait for quota when limits are configured, otherwise a small delay
+        if self._rate_limiter is not None:
+            await self._rate_limiter.acquire(estimate_tokens(prompt + (system_prompt or '')) + max_tokens)
+        else:
+            await asyncio.sleep(0.5)
+        
+        kwargs = self._build_request(prompt, system_prompt, max_tokens, json_mode)
+        
+        # Stream the completion; in JSON mode stop as soon as the top-level object closes
+        tracker = _JsonObjectTracker() if json_mode else None
+        parts = []
+        # aclosing() ends the provider stream right away when we stop early
+        async with contextlib.aclosing(self._astream_text(kwargs)) as chunks:
+            async for text in chunks:
+                parts.append(text)
+                if tracker is not None and tracker.feed(text):
+                    break
+        
+        response = ''.join(parts)
+        if not response:
+            raise ValueError("Empty response from API")
+        return response
+    
+    async def _astream_text(self, kwargs: Dict[str, Any]):
+        """Yield completion text chunks from the provider's streaming API"""
+        if self.provider == "openai":
+            stream = await self.async_client.chat.completions.create(**kwargs, stream=True)
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                await stream.close()
+        
+        elif self.provider == "anthropic":
+            async with self.async_client.messages.stream(**kwargs) as stream:
+                async for text in stream.text_stream:
+                    yield text
+        
+        else:
+            response = await self.async_client.generate_content_async(**kwargs, stream=True)
+            async for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunk without text parts (e.g. finish metadata)
+                    continue
+                if text:
+                    yield text
     
     def generate_qa_pair(self, code_context: str, file_path: str, 
                         question_type: str, additional_context: str = "") -> Dict[str, Any]:
         """Generate a Q&A pair with reasoning trace"""
+        system_prompt, prompt = self._qa_prompts(code_context, file_path, question_type, additional_context)
         
-        system_prompt = """You are an expert software engineer and educator. Your task is to generate high-quality training data for fine-tuning an LLM to understand codebases.
-
-Generate a question-answer pair about the provided code, including a detailed reasoning trace that shows your thought process."""
+        try:
+            response = self.generate_completion(prompt, system_prompt, json_mode=True)
+            return self._parse_qa_response(response)
+            
+        except Exception as e:
+            print(f"\n⚠️  Error in generate_qa_pair: {e}")
+            return None
+    
+    async def agenerate_qa_pair(self, code_context: str, file_path: str,
+                                question_type: str, additional_context: str = "") -> Dict[str, Any]:
+        """Async variant of generate_qa_pair"""
+        system_prompt, prompt = self._qa_prompts(code_context, file_path, question_type, additional_context)
+        
+        try:
+            response = await self.agenerate_completion(prompt, system_prompt, json_mode=True)
+            return self._parse_qa_response(response)
+            
+        except Exception as e:
+            print(f"\n⚠️  Error in generate_qa_pair: {e}")
+            return None
+    
+    def _qa_prompts(self, code_context: str, file_path: str,
+                    question_type: str, additional_context: str) -> Tuple[str, str]:
+        """Build the (system prompt, prompt) pair for Q&A generation"""
+        
+        system_prompt = _QA_SYSTEM_PROMPT
         
         prompt = f"""Based on the following code snippet, generate a question-answer pair.
 
@@ -186,95 +568,162 @@ File: {file_path}
 Question Type: {question_type}
 
 Generate a JSON response with the following structure:
-{{
-    "question": "A clear, specific question about the code",
-    "answer": "A comprehensive answer with explanations",
-    "reasoning_trace": {{
-        "steps": [
-            {{
-                "step_number": 1,
-                "description": "First reasoning step",
-                "code_reference": "Relevant code reference",
-                "confidence": 0.9
-            }}
-        ],
-        "overall_confidence": 0.85,
-        "methodology": "Explanation of reasoning approach"
-    }},
-    "difficulty": "easy|medium|hard",
-    "tags": ["tag1", "tag2"]
-}}
+{_QA_PAIR_FORMAT}
 
 Ensure the question is meaningful and the answer is detailed with proper reasoning steps."""
+        return system_prompt, prompt
+    
+    def _parse_qa_response(self, response: str) -> Optional[Dict[str, Any]]:
+        """Parse and normalize an LLM Q&A response"""
+        result = self._parse_json_response(response)
+        
+        if result is None:
+            print(f"\n⚠️  Failed to parse JSON response")
+            return None
+        
+        return self._normalize_qa_result(result)
+    
+    def _normalize_qa_result(self, result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Validate a parsed Q&A object and fill in defaults"""
+        # Validate and set defaults
+        if 'question' not in result or 'answer' not in result:
+            print(f"\n⚠️  Missing required fields")
+            return None
+        
+        # Ensure reasoning_trace exists
+        if 'reasoning_trace' not in result or not isinstance(result['reasoning_trace'], dict):
+            result['reasoning_trace'] = {
+                'steps': [{'step_number': 1, 'description': 'Analysis performed', 'confidence': 0.8}],
+                'overall_confidence': 0.8,
+                'methodology': 'code_analysis'
+            }
+        
+        result.setdefault('difficulty', 'medium')
+        result.setdefault('tags', [])
+        
+        return result
+    
+    def generate_qa_pairs_batch(self, requests: List[Dict[str, str]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Generate Q&A pairs for several code snippets with one LLM call.
+        
+        Each request holds code_context, file_path, question_type and additional_context.
+        The system prompt and answer format are sent once for the whole batch.
+        Returns one entry per request, in order (None where the model's answer was unusable).
+        """
+        system_prompt, prompt = self._qa_batch_prompts(requests)
         
         try:
-            response = self.generate_completion(prompt, system_prompt, json_mode=True)
+            response = self.generate_completion(prompt, system_prompt,
+                                                max_tokens=2048 * len(requests), json_mode=True)
+            return self._parse_qa_batch_response(response, len(requests))
             
-            # Try multiple parsing strategies
-            result = None
-            
-            # Strategy 1: Direct parse
-            try:
-                result = json.loads(response)
-            except json.JSONDecodeError:
-                # Strategy 2: Clean and parse
-                try:
-                    cleaned = self._clean_json_response(response)
-                    result = json.loads(cleaned)
-                except json.JSONDecodeError:
-                    # Strategy 3: Extract first valid JSON object
-                    start = response.find('{')
-                    if start >= 0:
-                        count = 0
-                        for i in range(start, len(response)):
-                            if response[i] == '{':
-                                count += 1
-                            elif response[i] == '}':
-                                count -= 1
-                                if count == 0:
-                                    try:
-                                        result = json.loads(response[start:i+1])
-                                        break
-                                    except:
-                                        pass
-            
-            if result is None:
-                print(f"\n⚠️  Failed to parse JSON response")
-                return None
-            
-            # Validate and set defaults
-            if 'question' not in result or 'answer' not in result:
-                print(f"\n⚠️  Missing required fields")
-                return None
-            
-            # Ensure reasoning_trace exists
-            if 'reasoning_trace' not in result or not isinstance(result['reasoning_trace'], dict):
-                result['reasoning_trace'] = {
-                    'steps': [{'step_number': 1, 'description': 'Analysis performed', 'confidence': 0.8}],
-                    'overall_confidence': 0.8,
-                    'methodology': 'code_analysis'
-                }
+        except Exception as e:
+            print(f"\n⚠️  Error in generate_qa_pairs_batch: {e}")
+            return [None] * len(requests)
+    
+    async def agenerate_qa_pairs_batch(self, requests: List[Dict[str, str]]) -> List[Optional[Dict[str, Any]]]:
+        """Async variant of generate_qa_pairs_batch"""
+        system_prompt, prompt = self._qa_batch_prompts(requests)
+        
+        try:
+            response = await self.agenerate_completion(prompt, system_prompt,
+                                                       max_tokens=2048 * len(requests), json_mode=True)
+            return self._parse_qa_batch_response(response, len(requests))
             
-            result.setdefault('difficulty', 'medium')
-            result.setdefault('tags', [])
+        except Exception as e:
+            print(f"\n⚠️  Error in generate_qa_pairs_batch: {e}")
+            return [None] * len(requests)
+    
+    def _qa_batch_prompts(self, requests: List[Dict[str, str]]) -> Tuple[str, str]:
+        """Build the (system prompt, prompt) pair for a batch of Q&A requests"""
+        
+        system_prompt = _QA_BATCH_SYSTEM_PROMPT
+        
+        # One numbered block per code snippet
+        blocks = []
+        for i, request in enumerate(requests, 1):
+            blocks.append(f"""### Snippet {i}
+File: {request['file_path']}
+{request.get('additional_context', '')}
+
+```
+{request['code_context']}
+```
+
+Question Type: {request['question_type']}""")
+        snippets_str = "\n\n".join(blocks)
+        
+        prompt = f"""Based on each of the following {len(requests)} code snippets, generate a question-answer pair.
+
+{snippets_str}
+
+Generate a JSON response of the form {{"qa_pairs": [...]}} with exactly {len(requests)} entries, one per snippet in the order given. Each entry must have the following structure:
+{_QA_PAIR_FORMAT}
+
+Ensure each question is meaningful and each answer is detailed with proper reasoning steps."""
+        return system_prompt, prompt
+    
+    def _parse_qa_batch_response(self, response: str, count: int) -> List[Optional[Dict[str, Any]]]:
+        """Split a batched Q&A response into one normalized pair per request"""
+        result = self._parse_json_response(response)
+        qa_pairs = result.get('qa_pairs') if isinstance(result, dict) else None
+        
+        if not isinstance(qa_pairs, list):
+            print(f"\n⚠️  Failed to parse batched Q&A JSON")
+            return [None] * count
+        
+        return [
+            self._normalize_qa_result(qa_pairs[i])
+            if i < len(qa_pairs) and isinstance(qa_pairs[i], dict) else None
+            for i in range(count)
+        ]
+    
+    def generate_design_solution(self, requirement: str, architecture_context: Dict[str, Any],
+                                code_examples: List[Dict[str, str]], 
+                                requirement_type: str,
+                                architecture_summary: Optional[str] = None) -> Dict[str, Any]:
+        """Generate a design solution with reasoning trace (architecture_summary: pre-rendered context JSON)"""
+        system_prompt, prompt = self._design_prompts(requirement, architecture_context,
+                                                     code_examples, requirement_type,
+                                                     architecture_summary)
+        
+        try:
+            response = self.generate_completion(prompt, system_prompt, max_tokens=3000, json_mode=True)
+            return self._parse_design_response(response)
             
-            return result
+        except Exception as e:
+            print(f"\n⚠️  Error in generate_design_solution: {e}")
+            return None
+    
+    async def agenerate_design_solution(self, requirement: str, architecture_context: Dict[str, Any],
+                                        code_examples: List[Dict[str, str]],
+                                        requirement_type: str,
+                                        architecture_summary: Optional[str] = None) -> Dict[str, Any]:
+        """Async variant of generate_design_solution"""
+        system_prompt, prompt = self._design_prompts(requirement, architecture_context,
+                                                     code_examples, requirement_type,
+                                                     architecture_summary)
+        
+        try:
+            response = await self.agenerate_completion(prompt, system_prompt, max_tokens=3000, json_mode=True)
+            return self._parse_design_response(response)
             
         except Exception as e:
-            print(f"\n⚠️  Error in generate_qa_pair: {e}")
+            print(f"\n⚠️  Error in generate_design_solution: {e}")
             return None
     
-    def generate_design_solution(self, requirement: str, architecture_context: Dict[str, Any],
-                                code_examples: List[Dict[str, str]], 
-                                requirement_type: str) -> Dict[str, Any]:
-        """Generate a design solution with reasoning trace"""
+    def _design_prompts(self, requirement: str, architecture_context: Dict[str, Any],
+                        code_examples: List[Dict[str, str]], requirement_type: str,
+                        architecture_summary: Optional[str] = None) -> Tuple[str, str]:
+        """Build the (system prompt, prompt) pair for design generation"""
         
-        system_prompt = """You are a senior software architect. Your task is to generate comprehensive design solutions based on the existing codebase architecture.
-
-Provide detailed design solutions with step-by-step reasoning that shows how you arrived at the solution."""
+        system_prompt = _DESIGN_SYSTEM_PROMPT
         
-        # Format architecture context
-        arch_summary = json.dumps(architecture_context, indent=2)
+        # Format architecture context (unless the caller already rendered it)
+        arch_summary = architecture_summary
+        if arch_summary is None:
+            arch_summary = compact_json(architecture_context)
         
         # Format code examples
         code_examples_str = "\n\n".join([
@@ -294,95 +743,170 @@ Relevant Code Examples:
 {code_examples_str}
 
 Generate a JSON response with the following structure:
-{{
-    "solution_overview": "High-level solution summary",
-    "detailed_design": "Comprehensive design explanation",
-    "implementation_steps": [
-        "Step 1: ...",
-        "Step 2: ..."
-    ],
-    "affected_components": ["component1", "component2"],
-    "code_examples": [
-        {{
-            "description": "Example description",
-            "code": "Code snippet showing implementation"
-        }}
-    ],
-    "reasoning_trace": {{
-        "steps": [
-            {{
-                "step_number": 1,
-                "description": "Design reasoning step",
-                "code_reference": "Reference to existing code",
-                "confidence": 0.9
-            }}
-        ],
-        "overall_confidence": 0.85,
-        "methodology": "Design methodology used"
-    }},
-    "complexity": "low|medium|high",
-    "estimated_effort": "Time estimate",
-    "risks": ["risk1", "risk2"],
-    "tags": ["tag1", "tag2"]
-}}
+{_DESIGN_SOLUTION_FORMAT}
 
 Provide a solution that fits well with the existing architecture."""
+        return system_prompt, prompt
+    
+    def _parse_design_response(self, response: str) -> Optional[Dict[str, Any]]:
+        """Parse and normalize an LLM design solution response"""
+        result = self._parse_json_response(response)
+        
+        if result is None:
+            print(f"\n⚠️  Failed to parse design solution JSON")
+            return None
+        
+        return self._normalize_design_result(result)
+    
+    def _normalize_design_result(self, result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Check required design solution fields and fill in defaults"""
+        # Validate required fields
+        required = ['solution_overview', 'detailed_design', 'implementation_steps']
+        if not all(field in result for field in required):
+            print(f"\n⚠️  Missing required fields in design solution")
+            return None
+        
+        # Ensure reasoning_trace exists
+        if 'reasoning_trace' not in result or not isinstance(result['reasoning_trace'], dict):
+            result['reasoning_trace'] = {
+                'steps': [{'step_number': 1, 'description': 'Design analysis performed', 'confidence': 0.8}],
+                'overall_confidence': 0.8,
+                'methodology': 'design_thinking'
+            }
+        
+        result.setdefault('complexity', 'medium')
+        result.setdefault('estimated_effort', 'medium')
+        result.setdefault('risks', [])
+        result.setdefault('tags', [])
+        
+        return result
+    
+    def generate_design_solutions_batch(self, requirements: List[str], architecture_context: Dict[str, Any],
+                                        code_examples_per_req: List[List[Dict[str, str]]],
+                                        requirement_types: List[str],
+                                        architecture_summary: Optional[str] = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        Generate design solutions for several requirements with one LLM call.
+        
+        The system prompt and architecture context are sent once for the whole batch.
+        Returns one entry per requirement, in order (None where the model's answer was unusable).
+        """
+        system_prompt, prompt = self._design_batch_prompts(requirements, architecture_context,
+                                                           code_examples_per_req, requirement_types,
+                                                           architecture_summary)
         
         try:
-            response = self.generate_completion(prompt, system_prompt, max_tokens=3000, json_mode=True)
-            
-            # Try multiple parsing strategies (same as QA)
-            result = None
-            try:
-                result = json.loads(response)
-            except json.JSONDecodeError:
-                try:
-                    cleaned = self._clean_json_response(response)
-                    result = json.loads(cleaned)
-                except json.JSONDecodeError:
-                    start = response.find('{')
-                    if start >= 0:
-                        count = 0
-                        for i in range(start, len(response)):
-                            if response[i] == '{':
-                                count += 1
-                            elif response[i] == '}':
-                                count -= 1
-                                if count == 0:
-                                    try:
-                                        result = json.loads(response[start:i+1])
-                                        break
-                                    except:
-                                        pass
-            
-            if result is None:
-                print(f"\n⚠️  Failed to parse design solution JSON")
-                return None
+            response = self.generate_completion(prompt, system_prompt,
+                                                max_tokens=3000 * len(requirements), json_mode=True)
+            return self._parse_design_batch_response(response, len(requirements))
             
-            # Validate required fields
-            required = ['solution_overview', 'detailed_design', 'implementation_steps']
-            if not all(field in result for field in required):
-                print(f"\n⚠️  Missing required fields in design solution")
-                return None
-            
-            # Ensure reasoning_trace exists
-            if 'reasoning_trace' not in result or not isinstance(result['reasoning_trace'], dict):
-                result['reasoning_trace'] = {
-                    'steps': [{'step_number': 1, 'description': 'Design analysis performed', 'confidence': 0.8}],
-                    'overall_confidence': 0.8,
-                    'methodology': 'design_thinking'
-                }
-            
-            result.setdefault('complexity', 'medium')
-            result.setdefault('estimated_effort', 'medium')
-            result.setdefault('risks', [])
-            result.setdefault('tags', [])
-            
-            return result
+        except Exception as e:
+            print(f"\n⚠️  Error in generate_design_solutions_batch: {e}")
+            return [None] * len(requirements)
+    
+    async def agenerate_design_solutions_batch(self, requirements: List[str], architecture_context: Dict[str, Any],
+                                               code_examples_per_req: List[List[Dict[str, str]]],
+                                               requirement_types: List[str],
+                                               architecture_summary: Optional[str] = None) -> List[Optional[Dict[str, Any]]]:
+        """Async variant of generate_design_solutions_batch"""
+        system_prompt, prompt = self._design_batch_prompts(requirements, architecture_context,
+                                                           code_examples_per_req, requirement_types,
+                                                           architecture_summary)
+        
+        try:
+            response = await self.agenerate_completion(prompt, system_prompt,
+                                                       max_tokens=3000 * len(requirements), json_mode=True)
+            return self._parse_design_batch_response(response, len(requirements))
             
         except Exception as e:
-            print(f"\n⚠️  Error in generate_design_solution: {e}")
-            return None
+            print(f"\n⚠️  Error in generate_design_solutions_batch: {e}")
+            return [None] * len(requirements)
+    
+    def _design_batch_prompts(self, requirements: List[str], architecture_context: Dict[str, Any],
+                              code_examples_per_req: List[List[Dict[str, str]]],
+                              requirement_types: List[str],
+                              architecture_summary: Optional[str] = None) -> Tuple[str, str]:
+        """Build the (system prompt, prompt) pair for a batch of design requirements"""
+        
+        system_prompt = _DESIGN_BATCH_SYSTEM_PROMPT
+        
+        # Format architecture context (shared by every requirement in the batch)
+        arch_summary = architecture_summary
+        if arch_summary is None:
+            arch_summary = compact_json(architecture_context)
+        
+        # One numbered block per requirement
+        blocks = []
+        for i, (requirement, requirement_type, code_examples) in enumerate(
+                zip(requirements, requirement_types, code_examples_per_req), 1):
+            code_examples_str = "\n\n".join([
+                f"File: {ex['file_path']}\n```\n{ex['code']}\n```"
+                for ex in code_examples[:3]  # Limit to 3 examples
+            ])
+            blocks.append(f"""### Requirement {i}: {requirement}
+Requirement Type: {requirement_type}
+
+Relevant Code Examples:
+{code_examples_str}""")
+        requirements_str = "\n\n".join(blocks)
+        
+        prompt = f"""Based on the following codebase architecture, generate a design solution for each of the {len(requirements)} requirements below.
+
+Current Architecture:
+{arch_summary}
+
+{requirements_str}
+
+Generate a JSON response of the form {{"solutions": [...]}} with exactly {len(requirements)} entries, one per requirement in the order given. Each entry must have the following structure:
+{_DESIGN_SOLUTION_FORMAT}
+
+Provide solutions that fit well with the existing architecture."""
+        return system_prompt, prompt
+    
+    def _parse_design_batch_response(self, response: str, count: int) -> List[Optional[Dict[str, Any]]]:
+        """Split a batched design response into one normalized solution per requirement"""
+        result = self._parse_json_response(response)
+        solutions = result.get('solutions') if isinstance(result, dict) else None
+        
+        if not isinstance(solutions, list):
+            print(f"\n⚠️  Failed to parse batched design solution JSON")
+            return [None] * count
+        
+        return [
+            self._normalize_design_result(solutions[i])
+            if i < len(solutions) and isinstance(solutions[i], dict) else None
+            for i in range(count)
+        ]
+    
+    def _parse_json_response(self, response: str) -> Optional[Dict[str, Any]]:
+        """Parse a JSON object from an LLM response, tolerating fences and trailing text"""
+        # Strategy 1: Direct parse
+        try:
+            return _json_loads(response)
+        except json.JSONDecodeError:
+            pass
+        
+        # Strategy 2: Clean and parse
+        try:
+            return _json_loads(self._clean_json_response(response))
+        except (json.JSONDecodeError, TypeError):
+            pass
+        
+        # Strategy 3: Extract first valid JSON object
+        start = response.find('{')
+        if start >= 0:
+            count = 0
+            for i in range(start, len(response)):
+                if response[i] == '{':
+                    count += 1
+                elif response[i] == '}':
+                    count -= 1
+                    if count == 0:
+                        try:
+                            return _json_loads(response[start:i+1])
+                        except json.JSONDecodeError:
+                            pass
+        return None
     
     def validate_and_improve_qa(self, qa_data: Dict[str, Any]) -> Dict[str, Any]:
         """Validate and improve a Q&A pair"""
@@ -391,7 +915,7 @@ Provide a solution that fits well with the existing architecture."""
         
         prompt = f"""Review this Q&A pair and improve it if needed:
 
-{json.dumps(qa_data, indent=2)}
+{compact_json(qa_data)}
 
 Check for:
 1. Question clarity and specificity
@@ -402,27 +926,62 @@ Check for:
 Return the improved version in the same JSON format, or the original if no improvements needed."""
         
         response = self.generate_completion(prompt, system_prompt, json_mode=True)
-        return json.loads(response)
+        return _json_loads(response)
     
     def batch_generate_with_retry(self, generation_func, items: List[Any], 
                                  max_retries: int = 3, delay: float = 1.0) -> List[Dict[str, Any]]:
         """Batch generate with retry logic"""
         results = []
         
-        for i, item in enumerate(items):
-            print(f"   Generating {i+1}/{len(items)}...", end='\r')
-            
+        for item in tqdm(items, desc="   Generating", mininterval=0.5):
             for attempt in range(max_retries):
                 try:
                     result = generation_func(item)
                     results.append(result)
                     break
+                except FATAL_ERRORS as e:
+                    tqdm.write(f"   ❌ Failed (not retriable): {e}")
+                    break
                 except Exception as e:
                     if attempt < max_retries - 1:
-                        print(f"\n   ⚠️  Attempt {attempt+1} failed, retrying...")
-                        time.sleep(delay * (attempt + 1))
+                        tqdm.write(f"   ⚠️  Attempt {attempt+1} failed, retrying...")
+                        time.sleep(backoff_delay(e, attempt, delay, 2.0))
                     else:
-                        print(f"\n   ❌ Failed after {max_retries} attempts: {e}")
+                        tqdm.write(f"   ❌ Failed after {max_retries} attempts: {e}")
         
-        print(f"\n   ✅ Generated {len(results)} items")
+        print(f"   ✅ Generated {len(results)} items")
         return results
+    
+    async def abatch_generate(self, generation_func: Callable, items: List[Any],
+                              max_retries: int = 3, delay: float = 1.0,
+                              show_progress: bool = True) -> List[Any]:
+        """
+        Run an async generation function over all items concurrently.
+        
+        Request concurrency is bounded by agenerate_completion. Results keep the
+        order of items; an item that fails after max_retries attempts yields None.
+        Callers that report their own progress pass show_progress=False.
+        """
+        async def run(item):
+            for attempt in range(max_retries):
+                try:
+                    result = await generation_func(item)
+                    break
+                except FATAL_ERRORS as e:
+                    tqdm.write(f"   ❌ Failed (not retriable): {e}")
+                    result = None
+                    break
+                except Exception as e:
+                    if attempt < max_retries - 1:
+                        tqdm.write(f"   ⚠️  Attempt {attempt+1} failed, retrying...")
+                        await asyncio.sleep(backoff_delay(e, attempt, delay, 2.0))
+                    else:
+                        tqdm.write(f"   ❌ Failed after {max_retries} attempts: {e}")
+                        result = None
+            progress.update(1)
+            return result
+        
+        # The bar redraws at most twice a second instead of writing a line per item
+        with tqdm(total=len(items), desc="   Generating", mininterval=0.5,
+                  disable=not show_progress) as progress:
+            return await asyncio.gather(*[run(item) for item in items])
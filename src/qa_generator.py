@@ -3,16 +3,28 @@ Scenario 1: Q&A Pair Generator
 Generates question-answer pairs based on code analysis
 """
 import random
-import uuid
-from typing import List, Dict, Any
+import asyncio
+import itertools
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 
+from tqdm import tqdm
+
 from src.schema import (
     QAPair, CodeContext, ReasoningTrace, ReasoningStep,
-    QuestionType, LanguageType
+    QuestionType, LanguageType, new_sample_id
 )
 from src.analyzer import RepositoryAnalyzer, FunctionInfo, ClassInfo
 from src.llm_service import LLMService
+from src.semantic_dedup import JaccardIndex
+
+
+# Enum members by value, and the default question types (built once).
+# Code contexts built from analyzer output are trusted and skip validation
+# (model_construct), storing the language value as use_enum_values would.
+_QUESTION_TYPES = {qt.value: qt for qt in QuestionType}
+_LANGUAGE_TYPES = {lt.value: lt for lt in LanguageType}
+_DEFAULT_QUESTION_TYPES = tuple(_QUESTION_TYPES)
 
 
 class QAGenerator:
@@ -22,13 +34,20 @@ class QAGenerator:
         self.analyzer = analyzer
         self.llm = llm_service
         self.generated_questions = set()
+        # Word-overlap index over accepted questions (avoids comparing against each one)
+        self.question_index = JaccardIndex(threshold=0.8)
+        # Candidate functions/classes to ask about, filtered once on first use
+        self._function_candidates = None
+        self._function_cum_weights = None
+        self._class_candidates = None
     
     def generate_qa_pairs(self, num_samples: int = 50, 
-                         question_types: List[str] = None) -> List[QAPair]:
-        """Generate Q&A pairs"""
+                         question_types: List[str] = None,
+                         batch_size: int = 1) -> List[QAPair]:
+        """Generate Q&A pairs (batch_size snippets per LLM call)"""
         
         if question_types is None:
-            question_types = [qt.value for qt in QuestionType]
+            question_types = _DEFAULT_QUESTION_TYPES
         
         print(f"\n🎯 Generating {num_samples} Q&A pairs...")
         
@@ -36,44 +55,161 @@ class QAGenerator:
         attempts = 0
         max_attempts = num_samples * 3
         
-        while len(qa_pairs) < num_samples and attempts < max_attempts:
-            attempts += 1
-            
-            # Select a random question type
-            question_type = random.choice(question_types)
-            
-            # Generate based on type
-            if question_type in [QuestionType.CODE_EXPLANATION.value, 
-                                QuestionType.BUSINESS_LOGIC.value]:
-                qa = self._generate_function_qa(question_type)
-            elif question_type == QuestionType.DESIGN_PATTERN.value:
-                qa = self._generate_class_qa(question_type)
-            else:
-                qa = self._generate_general_qa(question_type)
-            
-            if qa and self._is_unique_question(qa.question):
-                qa_pairs.append(qa)
-                self.generated_questions.add(qa.question.lower())
-                print(f"   ✅ Generated {len(qa_pairs)}/{num_samples}", end='\r')
+        with tqdm(total=num_samples, desc="   ✅ Generated", mininterval=0.5) as progress:
+            while len(qa_pairs) < num_samples and attempts < max_attempts:
+                count = min(max(1, batch_size), num_samples - len(qa_pairs), max_attempts - attempts)
+                attempts += count
+                
+                # Select random question types
+                results = self._generate_qas(random.choices(question_types, k=count))
+                
+                for qa in results:
+                    if qa and self._is_unique_question(qa.question):
+                        qa_pairs.append(qa)
+                        self._remember_question(qa.question)
+                        progress.update(1)
         
-        print(f"\n   📊 Successfully generated {len(qa_pairs)} Q&A pairs")
+        print(f"   📊 Successfully generated {len(qa_pairs)} Q&A pairs")
         return qa_pairs
     
-    def _generate_function_qa(self, question_type: str) -> QAPair:
-        """Generate Q&A for a function"""
-        # Select a function with decent complexity
-        candidates = self.analyzer.get_functions_by_complexity(min_complexity=2)
+    async def generate_qa_pairs_async(self, num_samples: int = 50,
+                                      question_types: List[str] = None,
+                                      batch_size: int = 1) -> List[QAPair]:
+        """Generate Q&A pairs with concurrent LLM calls (bounded by the LLM service)"""
         
-        if not candidates:
-            candidates = self.analyzer.functions
+        if question_types is None:
+            question_types = _DEFAULT_QUESTION_TYPES
+        
+        print(f"\n🎯 Generating {num_samples} Q&A pairs (concurrent)...")
+        
+        qa_pairs = []
+        attempts = 0
+        max_attempts = num_samples * 3
+        batch_size = max(1, batch_size)
+        
+        # Launch one wave per round for the samples still missing
+        with tqdm(total=num_samples, desc="   ✅ Generated", mininterval=0.5) as progress:
+            while len(qa_pairs) < num_samples and attempts < max_attempts:
+                wave_size = min(num_samples - len(qa_pairs), max_attempts - attempts)
+                attempts += wave_size
+                
+                # One LLM call per batch, all batches in flight together; each batch is
+                # deduplicated as soon as it lands, while the rest are still generating
+                wave_types = random.choices(question_types, k=wave_size)
+                for next_batch in asyncio.as_completed([
+                    self._agenerate_qas(wave_types[i:i + batch_size])
+                    for i in range(0, wave_size, batch_size)
+                ]):
+                    for qa in await next_batch:
+                        if qa and self._is_unique_question(qa.question):
+                            qa_pairs.append(qa)
+                            self._remember_question(qa.question)
+                            progress.update(1)
+        
+        print(f"   📊 Successfully generated {len(qa_pairs)} Q&A pairs")
+        return qa_pairs
+    
+    def _generate_qa(self, question_type: str) -> QAPair:
+        """Generate a Q&A pair for the given question type"""
+        request = self._prepare_qa(question_type)
+        if request is None:
+            return None
+        
+        try:
+            # Generate with LLM
+            llm_response = self.llm.generate_qa_pair(question_type=question_type, **request['llm_args'])
+            return self._build_qa(question_type, request, llm_response)
+        except Exception as e:
+            print(f"\n   ⚠️  Error generating {request['kind']} Q&A: {e}")
+            return None
+    
+    async def _agenerate_qa(self, question_type: str) -> QAPair:
+        """Async variant of _generate_qa"""
+        request = self._prepare_qa(question_type)
+        if request is None:
+            return None
+        
+        try:
+            # Generate with LLM
+            llm_response = await self.llm.agenerate_qa_pair(question_type=question_type, **request['llm_args'])
+            return self._build_qa(question_type, request, llm_response)
+        except Exception as e:
+            print(f"\n   ⚠️  Error generating {request['kind']} Q&A: {e}")
+            return None
+    
+    def _generate_qas(self, question_types: List[str]) -> List[QAPair]:
+        """Generate one Q&A pair per question type, several per LLM call when batched"""
+        if len(question_types) == 1:
+            return [self._generate_qa(question_types[0])]
+        
+        prepared = self._prepare_qas(question_types)
+        if not prepared:
+            return []
+        llm_responses = self.llm.generate_qa_pairs_batch(self._batch_llm_args(prepared))
+        return self._build_qas(prepared, llm_responses)
+    
+    async def _agenerate_qas(self, question_types: List[str]) -> List[QAPair]:
+        """Async variant of _generate_qas"""
+        if len(question_types) == 1:
+            return [await self._agenerate_qa(question_types[0])]
+        
+        prepared = self._prepare_qas(question_types)
+        if not prepared:
+            return []
+        llm_responses = await self.llm.agenerate_qa_pairs_batch(self._batch_llm_args(prepared))
+        return self._build_qas(prepared, llm_responses)
+    
+    def _prepare_qas(self, question_types: List[str]) -> List[Tuple[str, Dict[str, Any]]]:
+        """(question type, request) pairs for the types whose code could be selected"""
+        prepared = [(question_type, self._prepare_qa(question_type)) for question_type in question_types]
+        return [(question_type, request) for question_type, request in prepared if request is not None]
+    
+    @staticmethod
+    def _batch_llm_args(prepared: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, str]]:
+        """Per-snippet arguments for a batched Q&A request"""
+        return [dict(request['llm_args'], question_type=question_type) for question_type, request in prepared]
+    
+    def _build_qas(self, prepared: List[Tuple[str, Dict[str, Any]]],
+                   llm_responses: List[Optional[Dict[str, Any]]]) -> List[QAPair]:
+        """Create QAPair objects from a batched LLM response"""
+        # Pairs from one response share its timestamp
+        created_at = datetime.now()
+        qa_pairs = []
+        for (question_type, request), llm_response in zip(prepared, llm_responses):
+            try:
+                qa_pairs.append(self._build_qa(question_type, request, llm_response, created_at))
+            except Exception as e:
+                print(f"\n   ⚠️  Error generating {request['kind']} Q&A: {e}")
+                qa_pairs.append(None)
+        return qa_pairs
+    
+    def _prepare_qa(self, question_type: str) -> Optional[Dict[str, Any]]:
+        """Pick the code to ask about and build the LLM request for it"""
+        if question_type == QuestionType.DESIGN_PATTERN.value:
+            return self._prepare_class_qa()
+        # Code explanation, business logic, error handling and optimization
+        # questions are all asked about a function
+        return self._prepare_function_qa()
+    
+    def _prepare_function_qa(self) -> Optional[Dict[str, Any]]:
+        """Select a function and build its Q&A request"""
+        # Select a function with decent complexity
+        if self._function_candidates is None:
+            self._function_candidates = (self.analyzer.get_functions_by_complexity(min_complexity=2)
+                                         or self.analyzer.functions)
+            # More complex functions give richer questions: sample proportionally to complexity
+            self._function_cum_weights = list(itertools.accumulate(
+                max(1, f.complexity) for f in self._function_candidates
+            ))
+        candidates = self._function_candidates
         
         if not candidates:
             return None
         
-        func = random.choice(candidates)
+        func = random.choices(candidates, cum_weights=self._function_cum_weights)[0]
         
         # Get code context
-        code_file = next((f for f in self.analyzer.code_files if f.path == func.file_path), None)
+        code_file = self.analyzer.get_file(func.file_path)
         if not code_file:
             return None
         
@@ -82,60 +218,29 @@ class QAGenerator:
         if func.docstring:
             additional_context += f"Docstring: {func.docstring}\n"
         
-        try:
-            # Generate with LLM
-            llm_response = self.llm.generate_qa_pair(
-                code_context=func.code,
+        code = func.code
+        return {
+            'kind': 'function',
+            'llm_args': {
+                'code_context': code,
+                'file_path': func.file_path,
+                'additional_context': additional_context
+            },
+            'context': CodeContext.model_construct(
                 file_path=func.file_path,
-                question_type=question_type,
-                additional_context=additional_context
-            )
-            
-            # Check if LLM returned valid response
-            if llm_response is None:
-                return None
-            
-            # Create QAPair object
-            qa_pair = QAPair(
-                id=str(uuid.uuid4()),
-                question=llm_response['question'],
-                answer=llm_response['answer'],
-                question_type=QuestionType(question_type),
-                code_contexts=[
-                    CodeContext(
-                        file_path=func.file_path,
-                        start_line=func.start_line,
-                        end_line=func.end_line,
-                        code_snippet=func.code,
-                        language=LanguageType(code_file.language)
-                    )
-                ],
-                reasoning_trace=ReasoningTrace(
-                    steps=[
-                        ReasoningStep(**step) 
-                        for step in llm_response['reasoning_trace']['steps']
-                    ],
-                    overall_confidence=llm_response['reasoning_trace']['overall_confidence'],
-                    methodology=llm_response['reasoning_trace']['methodology']
-                ),
-                difficulty=llm_response.get('difficulty', 'medium'),
-                tags=llm_response.get('tags', []),
-                created_at=datetime.now()
+                start_line=func.start_line,
+                end_line=func.end_line,
+                code_snippet=code,
+                language=_LANGUAGE_TYPES[code_file.language].value
             )
-            
-            return qa_pair
-        
-        except Exception as e:
-            print(f"\n   ⚠️  Error generating function Q&A: {e}")
-            return None
+        }
     
-    def _generate_class_qa(self, question_type: str) -> QAPair:
-        """Generate Q&A for a class"""
+    def _prepare_class_qa(self) -> Optional[Dict[str, Any]]:
+        """Select a class and build its Q&A request"""
         # Select a class with docstring
-        candidates = self.analyzer.get_classes_with_docstrings()
-        
-        if not candidates:
-            candidates = self.analyzer.classes
+        if self._class_candidates is None:
+            self._class_candidates = self.analyzer.get_classes_with_docstrings() or self.analyzer.classes
+        candidates = self._class_candidates
         
         if not candidates:
             return None
@@ -143,7 +248,7 @@ class QAGenerator:
         cls = random.choice(candidates)
         
         # Get code context
-        code_file = next((f for f in self.analyzer.code_files if f.path == cls.file_path), None)
+        code_file = self.analyzer.get_file(cls.file_path)
         if not code_file:
             return None
         
@@ -158,57 +263,48 @@ class QAGenerator:
             additional_context += f"Inherits from: {', '.join(cls.base_classes)}\n"
         additional_context += f"Methods: {', '.join([m.name for m in cls.methods])}\n"
         
-        try:
-            # Generate with LLM
-            llm_response = self.llm.generate_qa_pair(
-                code_context=class_code,
+        return {
+            'kind': 'class',
+            'llm_args': {
+                'code_context': class_code,
+                'file_path': cls.file_path,
+                'additional_context': additional_context
+            },
+            'context': CodeContext.model_construct(
                 file_path=cls.file_path,
-                question_type=question_type,
-                additional_context=additional_context
-            )
-            
-            # Create QAPair object
-            qa_pair = QAPair(
-                id=str(uuid.uuid4()),
-                question=llm_response['question'],
-                answer=llm_response['answer'],
-                question_type=QuestionType(question_type),
-                code_contexts=[
-                    CodeContext(
-                        file_path=cls.file_path,
-                        start_line=cls.start_line,
-                        end_line=cls.end_line,
-                        code_snippet=class_code,
-                        language=LanguageType(code_file.language)
-                    )
-                ],
-                reasoning_trace=ReasoningTrace(
-                    steps=[
-                        ReasoningStep(**step) 
-                        for step in llm_response['reasoning_trace']['steps']
-                    ],
-                    overall_confidence=llm_response['reasoning_trace']['overall_confidence'],
-                    methodology=llm_response['reasoning_trace']['methodology']
-                ),
-                difficulty=llm_response.get('difficulty', 'medium'),
-                tags=llm_response.get('tags', []),
-                created_at=datetime.now()
+                start_line=cls.start_line,
+                end_line=cls.end_line,
+                code_snippet=class_code,
+                language=_LANGUAGE_TYPES[code_file.language].value
             )
-            
-            return qa_pair
-        
-        except Exception as e:
-            print(f"\n   ⚠️  Error generating class Q&A: {e}")
-            return None
+        }
     
-    def _generate_general_qa(self, question_type: str) -> QAPair:
-        """Generate general Q&A about the codebase"""
-        # For error handling and optimization questions, select any function
-        if not self.analyzer.functions:
+    def _build_qa(self, question_type: str, request: Dict[str, Any],
+                  llm_response: Optional[Dict[str, Any]],
+                  created_at: Optional[datetime] = None) -> QAPair:
+        """Create the QAPair from the LLM response"""
+        # Check if LLM returned valid response
+        if llm_response is None:
             return None
         
-        func = random.choice(self.analyzer.functions)
-        return self._generate_function_qa(question_type)
+        return QAPair(
+            id=new_sample_id(),
+            question=llm_response['question'],
+            answer=llm_response['answer'],
+            question_type=_QUESTION_TYPES[question_type],
+            code_contexts=[request['context']],
+            reasoning_trace=ReasoningTrace(
+                steps=[
+                    ReasoningStep(**step) 
+                    for step in llm_response['reasoning_trace']['steps']
+                ],
+                overall_confidence=llm_response['reasoning_trace']['overall_confidence'],
+                methodology=llm_response['reasoning_trace']['methodology']
+            ),
+            difficulty=llm_response.get('difficulty', 'medium'),
+            tags=llm_response.get('tags', []),
+            created_at=created_at or datetime.now()
+        )
     
     def _is_unique_question(self, question: str) -> bool:
         """Check if question is sufficiently unique"""
@@ -218,44 +314,40 @@ class QAGenerator:
         if question_lower in self.generated_questions:
             return False
         
-        # Check for similar questions (simple similarity check)
-        for existing_q in self.generated_questions:
-            # If questions are very similar (>80% word overlap), consider as duplicate
-            q_words = set(question_lower.split())
-            e_words = set(existing_q.split())
-            
-            if len(q_words) > 0 and len(e_words) > 0:
-                overlap = len(q_words & e_words) / len(q_words | e_words)
-                if overlap > 0.8:
-                    return False
-        
-        return True
+        # If questions are very similar (>80% word overlap), consider as duplicate
+        return not self.question_index.is_duplicate(question_lower)
+    
+    def _remember_question(self, question: str):
+        """Record an accepted question for later uniqueness checks"""
+        question_lower = question.lower()
+        self.generated_questions.add(question_lower)
+        self.question_index.add(question_lower)
     
     def enhance_with_multi_context(self, qa_pairs: List[QAPair]) -> List[QAPair]:
         """Enhance Q&A pairs by adding related code contexts"""
         print("\n🔗 Enhancing Q&A pairs with additional contexts...")
         
-        for i, qa in enumerate(qa_pairs):
+        # Search for related imports or references of every primary file in one pass
+        primary_files = [qa.code_contexts[0].file_path if qa.code_contexts else None for qa in qa_pairs]
+        stems = {path: path.split('/')[-1].replace('.py', '') for path in primary_files if path}
+        related_by_stem = self.analyzer.search_many(list(dict.fromkeys(stems.values())))
+        
+        for qa, primary_file in zip(tqdm(qa_pairs, desc="   Enhanced", mininterval=0.5), primary_files):
             # Find related code
-            primary_file = qa.code_contexts[0].file_path if qa.code_contexts else None
-            
             if primary_file:
-                # Search for related imports or references
-                related_files = self.analyzer.search_code(primary_file.split('/')[-1].replace('.py', ''))
+                related_files = related_by_stem[stems[primary_file]]
                 
                 for related_file in related_files[:2]:  # Add up to 2 related contexts
                     if related_file.path != primary_file:
                         qa.code_contexts.append(
-                            CodeContext(
+                            CodeContext.model_construct(
                                 file_path=related_file.path,
                                 start_line=1,
-                                end_line=min(50, related_file.lines),
-                                code_snippet=related_file.get_snippet(1, min(50, related_file.lines)),
-                                language=LanguageType(related_file.language)
+                                end_line=related_file.head_lines,
+                                code_snippet=related_file.head_snippet,
+                                language=_LANGUAGE_TYPES[related_file.language].value
                             )
                         )
-            
-            print(f"   Enhanced {i+1}/{len(qa_pairs)}", end='\r')
         
-        print(f"\n   ✅ Enhanced {len(qa_pairs)} Q&A pairs")
+        print(f"   ✅ Enhanced {len(qa_pairs)} Q&A pairs")
         return qa_pairs
@@ -0,0 +1,67 @@
+"""
+Rate Limiting
+Token buckets that pace async requests to a provider's per-minute limits, and retry backoff
+"""
+import time
+import random
+import asyncio
+from typing import Optional
+
+
+# Upper bound for a single backoff wait (seconds)
+MAX_BACKOFF_DELAY = 60.0
+
+
+def backoff_delay(error: Exception, attempt: int, base_delay: float, backoff_factor: float) -> float:
+    """Exponential backoff with jitter, never shorter than the server's Retry-After"""
+    ceiling = min(MAX_BACKOFF_DELAY, base_delay * (backoff_factor ** attempt))
+    # Jitter keeps concurrent workers that failed together from retrying in lockstep
+    delay = random.uniform(ceiling / 2, ceiling)
+
+    # SDK errors carry the response; aiohttp's ClientResponseError exposes the headers itself
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or getattr(error, 'headers', None)
+    if headers:
+        try:
+            delay = max(delay, float(headers.get('retry-after') or 0))
+        except (TypeError, ValueError):
+            pass
+    return delay
+
+
+class AsyncTokenBucket:
+    """Token bucket refilled continuously at `rate_per_minute`, holding at most one minute's worth"""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = self.capacity / 60.0
+        self._level = self.capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self, amount: float = 1.0):
+        """Wait until `amount` units are available and take them"""
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+        # Reserve first (no await in between, so concurrent callers queue up in order),
+        # then sleep off any deficit; a single request larger than the bucket waits
+        # for a full bucket rather than forever
+        self._level -= min(amount, self.capacity)
+        if self._level < 0:
+            await asyncio.sleep(-self._level / self.rate)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits; either may be left unset"""
+
+    def __init__(self, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None):
+        self._requests = AsyncTokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = AsyncTokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    async def acquire(self, tokens: int):
+        """Wait for a request slot and `tokens` worth of token budget"""
+        if self._requests is not None:
+            await self._requests.acquire()
+        if self._tokens is not None:
+            await self._tokens.acquire(tokens)
@@ -1,12 +1,24 @@
 """
 Training Data Schema Definitions
 """
+import random
+import uuid
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any, Literal
 from datetime import datetime
 from enum import Enum
 
 
+# Sample ids only need to be unique, not unpredictable: draw them from a PRNG
+# seeded once from the OS instead of reading os.urandom for every sample
+_id_random = random.Random()
+
+
+def new_sample_id() -> str:
+    """Random UUID4-formatted id for a generated sample"""
+    return str(uuid.UUID(int=_id_random.getrandbits(128), version=4))
+
+
 class LanguageType(str, Enum):
     """Supported programming languages"""
     PYTHON = "python"
@@ -158,7 +170,7 @@ class TrainingDataset(BaseModel):
             "total_samples": len(self.scenario1_data) + len(self.scenario2_data),
             "qa_pairs": len(self.scenario1_data),
             "design_solutions": len(self.scenario2_data),
-            "languages": list(set([ctx.language for qa in self.scenario1_data for ctx in qa.code_contexts])),
-            "question_types": list(set([qa.question_type for qa in self.scenario1_data])),
-            "requirement_types": list(set([sol.requirement_type for sol in self.scenario2_data]))
+            "languages": list({ctx.language for qa in self.scenario1_data for ctx in qa.code_contexts}),
+            "question_types": list({qa.question_type for qa in self.scenario1_data}),
+            "requirement_types": list({sol.requirement_type for sol in self.scenario2_data})
         }
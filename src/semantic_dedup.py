@@ -0,0 +1,115 @@
+"""
+Semantic Deduplication
+Detects near-duplicate texts: paraphrases by cosine similarity of hashed bag-of-words
+vectors kept in a single NumPy matrix, and word-overlap duplicates by exact Jaccard
+similarity through an inverted index
+"""
+import math
+import re
+import zlib
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+class SemanticDeduplicator:
+    """Index of seen texts answering "is this close to something already seen?" """
+
+    def __init__(self, threshold: float = 0.92, dim: int = 1024):
+        self.threshold = threshold
+        self.dim = dim
+        # Rows are L2-normalized, so a matrix-vector product gives cosine similarities
+        self._vectors = np.empty((64, dim), dtype=np.float32)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def embed(self, text: str) -> Optional[np.ndarray]:
+        """Normalized hashed token-count vector, or None for text without words"""
+        tokens = _TOKEN_RE.findall(text.lower())
+        if not tokens:
+            return None
+
+        buckets = [zlib.crc32(token.encode('utf-8')) % self.dim for token in tokens]
+        vector = np.bincount(buckets, minlength=self.dim).astype(np.float32)
+        vector /= np.linalg.norm(vector)
+        return vector
+
+    def is_duplicate(self, text: str) -> bool:
+        """True if text is at least threshold-similar to an indexed text"""
+        vector = self.embed(text)
+        if vector is None or self._size == 0:
+            return False
+        return float((self._vectors[:self._size] @ vector).max()) >= self.threshold
+
+    def add(self, text: str):
+        """Index a text"""
+        vector = self.embed(text)
+        if vector is None:
+            return
+
+        if self._size == len(self._vectors):
+            grown = np.empty((2 * len(self._vectors), self.dim), dtype=np.float32)
+            grown[:self._size] = self._vectors
+            self._vectors = grown
+
+        self._vectors[self._size] = vector
+        self._size += 1
+
+
+class JaccardIndex:
+    """Index of seen texts answering "does this share > threshold of its words with one?" """
+
+    def __init__(self, threshold: float = 0.8):
+        self.threshold = threshold
+        self._sizes: List[int] = []
+        self._max_size = 0
+        # (word, word count) -> ids of indexed texts; only texts sharing a word and
+        # of a size that could reach the threshold are compared
+        self._postings: Dict[Tuple[str, int], List[int]] = defaultdict(list)
+
+    def __len__(self) -> int:
+        return len(self._sizes)
+
+    def is_duplicate(self, text: str) -> bool:
+        """True if the word-set Jaccard similarity to an indexed text exceeds threshold"""
+        words = set(text.lower().split())
+        if not words:
+            return False
+
+        # Jaccard <= min(|A|, |B|) / max(|A|, |B|): texts much shorter or longer can't match
+        size = len(words)
+        smallest = max(1, math.floor(size * self.threshold))
+        largest = self._max_size
+        if self.threshold > 0:
+            largest = min(largest, math.ceil(size / self.threshold))
+
+        # Intersection sizes with every similar-sized indexed text sharing a word
+        shared = Counter()
+        for word in words:
+            for other_size in range(smallest, largest + 1):
+                postings = self._postings.get((word, other_size))
+                if postings:
+                    shared.update(postings)
+
+        return any(
+            common / (size + self._sizes[text_id] - common) > self.threshold
+            for text_id, common in shared.items()
+        )
+
+    def add(self, text: str):
+        """Index a text"""
+        words = set(text.lower().split())
+        if not words:
+            return
+
+        text_id = len(self._sizes)
+        size = len(words)
+        self._sizes.append(size)
+        self._max_size = max(self._max_size, size)
+        for word in words:
+            self._postings[(word, size)].append(text_id)
@@ -3,10 +3,232 @@ import os
 import json
 import random
 import re
+import asyncio
+import contextlib
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 
+import numpy as np
+
+from src.file_walker import iter_code_files
+from src.llm_cache import ResponseCache, make_cache_key
+from src.rate_limit import AsyncTokenBucket, backoff_delay
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:
+    google_exceptions = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 解析 JSON 时优先使用 orjson（其 JSONDecodeError 继承自 json 的）
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+
+def _dumps_line(record: Dict) -> bytes:
+    """序列化为一行 JSONL"""
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+# 文件发现时不进入的目录（测试目录也跳过，只从业务代码中取样）
+EXCLUDED_DIRS = frozenset({'__pycache__', '.venv', '.git', 'test', 'tests'})
+# 剪枝之外按子串再过滤一遍路径（与最初的实现一致）
+EXCLUDED_PATH_PARTS = ('__pycache__', '.venv', 'test', '.git')
+
+# 取样的文件数上限
+MAX_DISCOVERED_FILES = 20
+
+# Gemini REST 接口（异步批量生成时绕过 SDK 直接调用）
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:{method}"
+
+# 单次异步请求的超时（秒）
+REQUEST_TIMEOUT = 120
+
+# 临时性错误（限流、超时、服务端错误）的最大尝试次数与首次退避（秒）
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 1.0
+
+# 流式输出中必须出现格式标记的字符窗口（约 125 个 token），超出仍未出现则提前中止
+STREAM_MARKER_WINDOW = 500
+
+# 响应解析用的正则（预编译，每个样本都会用到）
+_QUESTION_RE = re.compile(r'Question:\s*(.+?)(?=\n\nAnswer:|\nAnswer:)', re.DOTALL)
+_ANSWER_RE = re.compile(r'Answer:\s*(.+?)(?=\n\nReasoning|$)', re.DOTALL)
+_NUMBERED_RE = re.compile(r'\d+\.\s*(.+?)(?=\n\d+\.|\n\n|$)', re.DOTALL)
+_SOLUTION_RE = re.compile(r'Solution:\s*(.+?)(?=\n\nImplementation|\nImplementation)', re.DOTALL)
+_FILE_RE = re.compile(r'-\s*([^:]+):\s*(.+?)(?=\n-|\n\n|$)', re.DOTALL)
+_BULLET_RE = re.compile(r'-\s*(.+?)(?=\n-|\n\n|$)', re.DOTALL)
+_CODE_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$')
+
+# 问题层次映射
+_QUESTION_FOCUS = {
+    'minimal': {
+        'level': '代码实现层',
+        'topics': '算法逻辑、数据结构、API使用、代码细节',
+        'examples': '函数实现原理、变量命名规范、异常处理方式、代码优化建议'
+    },
+    'standard': {
+        'level': '模块设计层',
+        'topics': '设计模式、模块交互、职责划分、组件协作',
+        'examples': '模块间依赖关系、接口设计合理性、设计模式应用、代码重构建议'
+    },
+    'full': {
+        'level': '系统架构层',
+        'topics': '技术选型、扩展性设计、性能优化、安全考量',
+        'examples': '整体架构设计、技术栈选择、可扩展性分析、系统级优化策略'
+    }
+}
+
+# 需求模板及各自可填入的取值
+_REQUIREMENT_TEMPLATES = [
+    ("为{module}添加{value}功能", ["批量处理", "异步处理", "缓存", "数据验证", "错误处理", "监控告警", "配置管理", "插件系统"]),
+    ("优化{module}的{value}性能", ["查询效率", "内存使用", "响应时间", "并发能力", "扩展性", "可维护性"]),
+    ("重构{module}以支持{value}", ["多租户", "国际化", "版本控制", "热更新", "灰度发布", "降级熔断"]),
+    ("在{module}中实现{value}设计模式", ["工厂模式", "策略模式", "观察者模式", "责任链模式", "装饰器模式", "适配器模式"]),
+    ("为{module}添加{value}保障机制", ["单元测试", "集成测试", "日志记录", "性能监控", "安全审计", "容错恢复"]),
+    ("扩展{module}以支持{value}场景", ["高并发", "大数据量", "弱网环境", "跨平台", "微服务", "边缘计算"]),
+    ("改进{module}的{value}体验", ["用户", "开发者", "运维", "安全", "性能"]),
+    ("集成{value}到{module}中", ["Redis", "Kafka", "Elasticsearch", "GraphQL", "gRPC", "Docker"]),
+]
+
+# 展开后只差模块名的需求模式
+_REQUIREMENT_PATTERNS = [
+    template.format(module='{module}', value=value)
+    for template, values in _REQUIREMENT_TEMPLATES
+    for value in values
+]
+
+# 提示词模板（静态部分在导入时拼好，调用时只填入可变字段）
+_QA_REQUIREMENTS_TEMPLATE = f"""【问题层次要求】
+根据上下文级别生成对应层次的问题：
+- Minimal级别（代码实现层）：{_QUESTION_FOCUS['minimal']['topics']}
+  示例：{_QUESTION_FOCUS['minimal']['examples']}
+  
+- Standard级别（模块设计层）：{_QUESTION_FOCUS['standard']['topics']}
+  示例：{_QUESTION_FOCUS['standard']['examples']}
+  
+- Full级别（系统架构层）：{_QUESTION_FOCUS['full']['topics']}
+  示例：{_QUESTION_FOCUS['full']['examples']}
+
+当前要求：生成【{{level}}】的问题，聚焦于{{topics}}
+
+【内容要求】
+1. 问题要具体且有深度，严格匹配指定的问题层次
+2. 答案要详细准确，包含相应层次的技术分析
+3. 推理步骤要清晰，展示从上下文到结论的分析过程"""
+
+_QA_TEMPLATE = """
+请基于以下代码和上下文信息生成一个技术问答对。
+
+【代码】
+```python
+{code_snippet}
+```
+
+{requirements}
+
+【输出格式】（请严格遵循）
+Question: <你的问题>
+
+Answer: <详细答案>
+
+Reasoning Steps:
+1. <推理步骤1>
+2. <推理步骤2>
+3. <推理步骤3>
+"""
+
+_QA_BATCH_SNIPPET_TEMPLATE = """【代码】
+```python
+{code_snippet}
+```
+"""
+
+_QA_BATCH_FORMAT_TEMPLATE = """
+{requirements}
+
+【输出格式】（请严格遵循）
+输出一个 JSON 数组，按片段顺序每个片段对应一个对象，共 {count} 个：
+[{{"question": "<你的问题>", "answer": "<详细答案>", "reasoning_steps": ["<推理步骤1>", "<推理步骤2>", "<推理步骤3>"]}}]
+"""
+
+_DESIGN_CONTEXT_TEMPLATE = """
+## 项目信息
+- 项目名称: {project_name}
+- 文件数量: {total_files}
+- 核心模块: {core_modules}
+
+"""
+
+_DESIGN_TEMPLATE = """
+请为以下需求生成一个详细的设计方案。
+
+【需求】
+{requirement}
+
+【要求】
+1. 解决方案要结合项目现有架构
+2. 实施步骤要清晰具体
+3. 列出需要修改的文件和原因
+4. 分析可能遇到的挑战
+
+【输出格式】
+Requirement: {requirement}
+
+Solution: <解决方案概述>
+
+Implementation Steps:
+1. <步骤1>
+2. <步骤2>
+3. <步骤3>
+
+Files to Modify:
+- file1.py: <修改原因>
+- file2.py: <修改原因>
+
+Challenges:
+- <挑战1>
+- <挑战2>
+"""
+
+
+class _StreamMarkerCheck:
+    """流式输出的格式标记检查：只扫描新到达的片段（带 len(marker)-1 个字符的重叠），找到后不再扫描"""
+    
+    def __init__(self, marker: str):
+        self.marker = marker
+        self.marker_seen = False
+        self._length = 0
+        self._tail = ""
+    
+    def feed(self, chunk: str) -> bool:
+        """送入一个片段；超出 STREAM_MARKER_WINDOW 仍未出现标记时返回 True（应中止）"""
+        self._length += len(chunk)
+        if self.marker_seen:
+            return False
+        
+        window = self._tail + chunk
+        if self.marker in window:
+            self.marker_seen = True
+            return False
+        overlap = len(self.marker) - 1
+        self._tail = window[-overlap:] if overlap else ""
+        return self._length > STREAM_MARKER_WINDOW
+
 
 class SimpleGenerator:
     """简化版训练数据生成器"""
@@ -16,12 +238,32 @@ class SimpleGenerator:
         project_path: str,
         api_key: Optional[str] = None,
         model: str = "gemini-2.5-flash",
-        temperature: float = 0.3
+        temperature: float = 0.3,
+        max_concurrency: int = 4,
+        qa_batch_size: int = 4,
+        cache_path: Optional[str] = None,
+        cache_seed: Optional[int] = None,
+        requests_per_minute: Optional[float] = None
     ):
         self.project_path = Path(project_path)
         self.api_key = api_key or os.getenv('GEMINI_API_KEY')
         self.model = model
         self.temperature = temperature
+        # 批量生成时同时进行的 LLM 请求上限（受 API 速率限制约束）
+        self.max_concurrency = max(1, max_concurrency)
+        # 每次 LLM 调用打包的代码片段数（1 表示逐个生成问答对）
+        self.qa_batch_size = max(1, qa_batch_size)
+        # 批量生成期间共享的 aiohttp 会话（见 generate_batch_async）
+        self._session = None
+        # 按 API 的 RPM 配额为异步请求限速（留空则不限速）
+        self._request_bucket = AsyncTokenBucket(requests_per_minute) if requests_per_minute else None
+        # 文件内容缓存（批量生成时同一文件会被多次抽样）
+        self._file_contents: Dict[str, str] = {}
+        # LLM 响应磁盘缓存（按模型、温度与完整提示词寻址），重跑时相同提示词不再请求 API
+        # temperature > 0 的采样结果仅在指定 cache_seed 时缓存，否则重跑会重放同样的"随机"输出
+        self.cache_seed = cache_seed
+        use_cache = cache_path and (temperature == 0 or cache_seed is not None)
+        self.cache = ResponseCache(cache_path) if use_cache else None
         
         # 导入依赖
         try:
@@ -51,26 +293,61 @@ class SimpleGenerator:
     
     def discover_python_files(self) -> List[Path]:
         """发现项目中的Python文件"""
-        files = []
-        for py_file in self.project_path.rglob('*.py'):
-            if all(x not in str(py_file) for x in ['__pycache__', '.venv', 'test', '.git']):
-                files.append(py_file)
-        return files[:20]
+        # 遍历时直接剪掉排除目录，取满上限即停止
+        files = (
+            Path(path) for path in iter_code_files(self.project_path, frozenset({'.py'}), EXCLUDED_DIRS)
+            if not self._is_excluded(path)
+        )
+        return list(itertools.islice(files, MAX_DISCOVERED_FILES))
+    
+    @staticmethod
+    def _is_excluded(path: str) -> bool:
+        """是否跳过该文件：路径中任意位置含 test 即视为测试代码（conftest.py、testing/、*_tests 等均跳过）"""
+        return any(part in path for part in EXCLUDED_PATH_PARTS)
     
     def extract_code_snippet(self, file_path: Path, length: int = 800) -> str:
         """提取代码片段"""
-        try:
-            content = file_path.read_text(encoding='utf-8')
-            if len(content) <= length:
-                return content
-            max_start = len(content) - length
-            start = random.randint(0, max_start)
-            return content[start:start + length]
-        except:
-            return ""
+        content = self._read_file(file_path)
+        if len(content) <= length:
+            return content
+        max_start = len(content) - length
+        start = random.randint(0, max_start)
+        return content[start:start + length]
+    
+    @staticmethod
+    def _pick_files(files: List[Path], count: int) -> List[Path]:
+        """抽取 count 个文件：不放回抽样，文件不够时先整轮覆盖所有文件，使各文件被抽中的次数至多相差 1"""
+        if not files:
+            return []
+        rounds, remainder = divmod(count, len(files))
+        picks = []
+        for _ in range(rounds):
+            picks.extend(random.sample(files, len(files)))
+        picks.extend(random.sample(files, remainder))
+        return picks
+    
+    def _read_file(self, file_path: Path) -> str:
+        """读取文件内容（按路径缓存），读取失败时返回空字符串"""
+        key = str(file_path)
+        content = self._file_contents.get(key)
+        if content is None:
+            try:
+                content = file_path.read_text(encoding='utf-8')
+            except (OSError, UnicodeDecodeError):
+                content = ""
+            self._file_contents[key] = content
+        return content
     
     def _calculate_qa_quality_score(self, qa_data: Dict) -> float:
-        """计算问答对的质量评分
+        """计算单个问答对的质量评分（评分标准见 _score_qa_batch）"""
+        return self._score_qa_batch([qa_data])[0]
+    
+    def _calculate_design_quality_score(self, design_data: Dict) -> float:
+        """计算单个设计方案的质量评分（评分标准见 _score_design_batch）"""
+        return self._score_design_batch([design_data])[0]
+    
+    def _score_qa_batch(self, qas: List[Dict]) -> List[float]:
+        """批量计算问答对的质量评分
         
         评分标准：
         - 问题质量 (0-0.25): 长度、具体性
@@ -78,32 +355,23 @@ class SimpleGenerator:
         - 推理步骤 (0-0.25): 步骤数量和质量
         - 代码上下文 (0-0.15): 是否包含相关代码
         """
-        score = 0.0
-        
-        # 问题质量
-        question = qa_data.get('question', '')
-        q_words = len(question.split())
-        score += min(0.25, (q_words / 20) * 0.25)  # 20词为标准
-        
-        # 答案质量
-        answer = qa_data.get('answer', '')
-        a_words = len(answer.split())
-        score += min(0.35, (a_words / 100) * 0.35)  # 100词为标准
+        count = len(qas)
+        q_words = np.fromiter((len(qa.get('question', '').split()) for qa in qas), dtype=np.float64, count=count)
+        a_words = np.fromiter((len(qa.get('answer', '').split()) for qa in qas), dtype=np.float64, count=count)
+        num_steps = np.fromiter((len(qa.get('reasoning_steps') or []) for qa in qas), dtype=np.float64, count=count)
+        has_context = np.fromiter((bool(qa.get('code_context')) for qa in qas), dtype=np.float64, count=count)
         
-        # 推理步骤
-        reasoning = qa_data.get('reasoning_steps', [])
-        if reasoning:
-            num_steps = len(reasoning)
-            score += min(0.25, (num_steps / 5) * 0.25)  # 5步为标准
-        
-        # 代码上下文
-        if qa_data.get('code_context'):
-            score += 0.15
-        
-        return min(1.0, round(score, 3))
+        score = (
+            np.minimum(0.25, (q_words / 20) * 0.25)      # 20词为标准
+            + np.minimum(0.35, (a_words / 100) * 0.35)   # 100词为标准
+            + np.minimum(0.25, (num_steps / 5) * 0.25)   # 5步为标准
+            + has_context * 0.15
+        )
+        # 用内置 round 取整（np.round 在 .0005 附近的舍入结果与之不同）
+        return [min(1.0, round(value, 3)) for value in score.tolist()]
     
-    def _calculate_design_quality_score(self, design_data: Dict) -> float:
-        """计算设计方案的质量评分
+    def _score_design_batch(self, designs: List[Dict]) -> List[float]:
+        """批量计算设计方案的质量评分
         
         评分标准：
         - 方案概述 (0-0.20): 清晰度和完整性
@@ -111,30 +379,20 @@ class SimpleGenerator:
         - 文件修改 (0-0.25): 具体性和合理性
         - 挑战分析 (0-0.25): 风险识别和应对
         """
-        score = 0.0
-        
-        # 方案概述
-        solution = design_data.get('solution', '')
-        s_words = len(solution.split())
-        score += min(0.20, (s_words / 50) * 0.20)
-        
-        # 实施步骤
-        steps = design_data.get('implementation_steps', [])
-        if steps:
-            num_steps = len(steps)
-            score += min(0.30, (num_steps / 7) * 0.30)
+        count = len(designs)
+        s_words = np.fromiter((len(d.get('solution', '').split()) for d in designs), dtype=np.float64, count=count)
+        num_steps = np.fromiter((len(d.get('implementation_steps') or []) for d in designs), dtype=np.float64, count=count)
+        num_files = np.fromiter((len(d.get('files_to_modify') or []) for d in designs), dtype=np.float64, count=count)
+        num_challenges = np.fromiter((len(d.get('challenges') or []) for d in designs), dtype=np.float64, count=count)
         
-        # 文件修改
-        files = design_data.get('files_to_modify', [])
-        if files:
-            score += min(0.25, (len(files) / 5) * 0.25)
-        
-        # 挑战分析
-        challenges = design_data.get('challenges', [])
-        if challenges:
-            score += min(0.25, (len(challenges) / 3) * 0.25)
-        
-        return min(1.0, round(score, 3))
+        score = (
+            np.minimum(0.20, (s_words / 50) * 0.20)
+            + np.minimum(0.30, (num_steps / 7) * 0.30)
+            + np.minimum(0.25, (num_files / 5) * 0.25)
+            + np.minimum(0.25, (num_challenges / 3) * 0.25)
+        )
+        # 用内置 round 取整（np.round 在 .0005 附近的舍入结果与之不同）
+        return [min(1.0, round(value, 3)) for value in score.tolist()]
     
     def generate_qa_pair(self, code_snippet: str, file_path: str, use_context: bool = True, context_level: str = 'standard') -> Optional[Dict]:
         """生成单个问答对
@@ -145,84 +403,129 @@ class SimpleGenerator:
             use_context: 是否使用上下文
             context_level: 上下文级别 ('minimal', 'standard', 'full')
         """
-        # 定义问题层次映射
-        question_focus = {
-            'minimal': {
-                'level': '代码实现层',
-                'topics': '算法逻辑、数据结构、API使用、代码细节',
-                'examples': '函数实现原理、变量命名规范、异常处理方式、代码优化建议'
-            },
-            'standard': {
-                'level': '模块设计层',
-                'topics': '设计模式、模块交互、职责划分、组件协作',
-                'examples': '模块间依赖关系、接口设计合理性、设计模式应用、代码重构建议'
-            },
-            'full': {
-                'level': '系统架构层',
-                'topics': '技术选型、扩展性设计、性能优化、安全考量',
-                'examples': '整体架构设计、技术栈选择、可扩展性分析、系统级优化策略'
-            }
-        }
+        # 调用LLM（模拟模式下无需构建提示词）
+        if self.llm_available:
+            prompt = self._build_qa_prompt(code_snippet, file_path, use_context, context_level)
+            text = self._call_llm(prompt, required_marker='Question:')
+        else:
+            # 模拟模式
+            text = self._generate_mock_response(code_snippet, file_path, context_level)
         
-        focus = question_focus.get(context_level, question_focus['standard'])
+        return self._finalize_qa(text, code_snippet, file_path, use_context, context_level)
+    
+    async def generate_qa_pair_async(self, code_snippet: str, file_path: str, use_context: bool = True,
+                                     context_level: str = 'standard', score: bool = True,
+                                     timestamp: Optional[str] = None) -> Optional[Dict]:
+        """generate_qa_pair 的异步版本（使用 Gemini 异步接口）
         
-        prompt = ""
-        if use_context and self.context_enabled:
-            context = self.analyzer.build_context(code_snippet, file_path, context_level=context_level)
-            prompt += f"{context}\n"
-            prompt += f"【上下文级别】{context_level.capitalize()}（{focus['level']}）\n\n"
+        score=False 时由调用方统一评分；timestamp 为批量生成时共用的时间戳（默认取当前时间）
+        """
+        if self.llm_available:
+            prompt = self._build_qa_prompt(code_snippet, file_path, use_context, context_level)
+            text = await self._acall_llm(prompt, required_marker='Question:')
+        else:
+            text = self._generate_mock_response(code_snippet, file_path, context_level)
         
-        prompt += f"""
-请基于以下代码和上下文信息生成一个技术问答对。
-
-【代码】
-```python
-{code_snippet}
-```
-
-【问题层次要求】
-根据上下文级别生成对应层次的问题：
-- Minimal级别（代码实现层）：{question_focus['minimal']['topics']}
-  示例：{question_focus['minimal']['examples']}
-  
-- Standard级别（模块设计层）：{question_focus['standard']['topics']}
-  示例：{question_focus['standard']['examples']}
-  
-- Full级别（系统架构层）：{question_focus['full']['topics']}
-  示例：{question_focus['full']['examples']}
-
-当前要求：生成【{focus['level']}】的问题，聚焦于{focus['topics']}
-
-【内容要求】
-1. 问题要具体且有深度，严格匹配指定的问题层次
-2. 答案要详细准确，包含相应层次的技术分析
-3. 推理步骤要清晰，展示从上下文到结论的分析过程
-
-【输出格式】（请严格遵循）
-Question: <你的问题>
-
-Answer: <详细答案>
-
-Reasoning Steps:
-1. <推理步骤1>
-2. <推理步骤2>
-3. <推理步骤3>
-"""
+        return self._finalize_qa(text, code_snippet, file_path, use_context, context_level, score, timestamp)
+    
+    def generate_qa_pairs_marshaled(self, snippets: List[Tuple[str, str]], use_context: bool = True,
+                                    context_level: str = 'standard') -> List[Optional[Dict]]:
+        """一次 LLM 调用为多个代码片段各生成一个问答对
+        
+        Args:
+            snippets: (代码片段, 文件路径) 列表
+            use_context: 是否使用上下文
+            context_level: 上下文级别 ('minimal', 'standard', 'full')
         
-        # 调用LLM
+        Returns:
+            与 snippets 一一对应的问答对列表（解析失败的位置为 None）
+        """
         if self.llm_available:
-            try:
-                response = self.llm.generate_content(prompt)
-                text = response.text
-            except Exception as e:
-                print(f"❌ LLM调用失败: {e}")
-                return None
+            prompt = self._build_qa_batch_prompt(snippets, use_context, context_level)
+            text = self._call_llm(prompt, json_mode=True)
         else:
-            # 模拟模式
-            text = self._generate_mock_response(code_snippet, file_path, context_level)
+            text = self._generate_mock_batch_response(snippets, context_level)
+        
+        return self._finalize_qa_batch(text, snippets, use_context, context_level)
+    
+    async def generate_qa_pairs_marshaled_async(self, snippets: List[Tuple[str, str]], use_context: bool = True,
+                                                context_level: str = 'standard',
+                                                score: bool = True,
+                                                timestamp: Optional[str] = None) -> List[Optional[Dict]]:
+        """generate_qa_pairs_marshaled 的异步版本；score、timestamp 同 generate_qa_pair_async"""
+        if self.llm_available:
+            prompt = self._build_qa_batch_prompt(snippets, use_context, context_level)
+            text = await self._acall_llm(prompt, json_mode=True)
+        else:
+            text = self._generate_mock_batch_response(snippets, context_level)
+        
+        return self._finalize_qa_batch(text, snippets, use_context, context_level, score, timestamp)
+    
+    def _build_qa_prompt(self, code_snippet: str, file_path: str, use_context: bool, context_level: str) -> str:
+        """构建问答对生成提示词"""
+        focus = _QUESTION_FOCUS.get(context_level, _QUESTION_FOCUS['standard'])
+        
+        parts = []
+        if use_context and self.context_enabled:
+            context = self.analyzer.build_context(file_path, context_level=context_level)
+            parts.append(f"{context}\n")
+            parts.append(f"【上下文级别】{context_level.capitalize()}（{focus['level']}）\n\n")
+        
+        parts.append(_QA_TEMPLATE.format(code_snippet=code_snippet, requirements=self._qa_requirements(focus)))
+        return "".join(parts)
+    
+    def _build_qa_batch_prompt(self, snippets: List[Tuple[str, str]], use_context: bool, context_level: str) -> str:
+        """构建一次生成多个问答对的提示词（每个代码片段对应一个问答对）"""
+        focus = _QUESTION_FOCUS.get(context_level, _QUESTION_FOCUS['standard'])
+        
+        parts = [f"请基于以下 {len(snippets)} 个代码片段及其上下文信息，为每个片段各生成一个独立的技术问答对。\n"]
+        if use_context and self.context_enabled:
+            parts.append(f"【上下文级别】{context_level.capitalize()}（{focus['level']}）\n")
+        
+        for i, (code_snippet, file_path) in enumerate(snippets, 1):
+            parts.append(f"\n==================== 片段 {i}（{file_path}） ====================\n")
+            if use_context and self.context_enabled:
+                context = self.analyzer.build_context(file_path, context_level=context_level)
+                parts.append(f"{context}\n")
+            parts.append(_QA_BATCH_SNIPPET_TEMPLATE.format(code_snippet=code_snippet))
+        
+        parts.append(_QA_BATCH_FORMAT_TEMPLATE.format(requirements=self._qa_requirements(focus), count=len(snippets)))
+        return "".join(parts)
+    
+    @staticmethod
+    def _qa_requirements(focus: Dict[str, str]) -> str:
+        """问题层次与内容要求（单个与批量提示词共用）"""
+        return _QA_REQUIREMENTS_TEMPLATE.format(level=focus['level'], topics=focus['topics'])
+    
+    def _finalize_qa(self, text: Optional[str], code_snippet: str, file_path: str,
+                     use_context: bool, context_level: str, score: bool = True,
+                     timestamp: Optional[str] = None) -> Optional[Dict]:
+        """解析问答响应并补充元数据与质量评分"""
+        if text is None:
+            return None
         
         # 解析响应
-        parsed = self._parse_qa_response(text)
+        return self._complete_qa(self._parse_qa_response(text), code_snippet, file_path,
+                                 use_context, context_level, score, timestamp)
+    
+    def _finalize_qa_batch(self, text: Optional[str], snippets: List[Tuple[str, str]],
+                           use_context: bool, context_level: str, score: bool = True,
+                           timestamp: Optional[str] = None) -> List[Optional[Dict]]:
+        """解析批量问答响应，逐个补充元数据与质量评分（同一次调用的样本共用一个时间戳）"""
+        if text is None:
+            return [None] * len(snippets)
+        
+        timestamp = timestamp or datetime.now().isoformat()
+        parsed_list = self._parse_qa_batch_response(text, len(snippets))
+        return [
+            self._complete_qa(parsed, code_snippet, file_path, use_context, context_level, score, timestamp)
+            for parsed, (code_snippet, file_path) in zip(parsed_list, snippets)
+        ]
+    
+    def _complete_qa(self, parsed: Optional[Dict], code_snippet: str, file_path: str,
+                     use_context: bool, context_level: str, score: bool = True,
+                     timestamp: Optional[str] = None) -> Optional[Dict]:
+        """为解析出的问答对补充元数据与质量评分"""
         if parsed:
             # 添加元数据
             parsed['code_context'] = code_snippet
@@ -230,7 +533,7 @@ Reasoning Steps:
             parsed['metadata'] = {
                 'model': self.model,
                 'temperature': self.temperature,
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': timestamp or datetime.now().isoformat(),
                 'context_enabled': use_context and self.context_enabled,
                 'context_level': context_level,
                 'question_layer': {
@@ -240,91 +543,311 @@ Reasoning Steps:
                 }.get(context_level, '未知')
             }
             # 计算质量评分
-            parsed['quality_score'] = self._calculate_qa_quality_score(parsed)
+            if score:
+                parsed['quality_score'] = self._calculate_qa_quality_score(parsed)
         
         return parsed
     
     def generate_design_solution(self, requirement: str, use_context: bool = True) -> Optional[Dict]:
         """生成设计方案"""
-        prompt = ""
-        if use_context and self.context_enabled:
-            structure = self.analyzer.analyze_project_structure()
-            prompt += f"""
-## 项目信息
-- 项目名称: {structure['project_name']}
-- 文件数量: {structure['total_files']}
-- 核心模块: {', '.join(structure['core_modules'][:5])}
-
-"""
-        
-        prompt += f"""
-请为以下需求生成一个详细的设计方案。
-
-【需求】
-{requirement}
-
-【要求】
-1. 解决方案要结合项目现有架构
-2. 实施步骤要清晰具体
-3. 列出需要修改的文件和原因
-4. 分析可能遇到的挑战
-
-【输出格式】
-Requirement: {requirement}
-
-Solution: <解决方案概述>
-
-Implementation Steps:
-1. <步骤1>
-2. <步骤2>
-3. <步骤3>
-
-Files to Modify:
-- file1.py: <修改原因>
-- file2.py: <修改原因>
-
-Challenges:
-- <挑战1>
-- <挑战2>
-"""
-        
-        # 调用LLM
+        # 调用LLM（模拟模式下无需构建提示词）
         if self.llm_available:
-            try:
-                response = self.llm.generate_content(prompt)
-                text = response.text
-            except Exception as e:
-                print(f"❌ LLM调用失败: {e}")
-                return None
+            prompt = self._build_design_prompt(requirement, use_context)
+            text = self._call_llm(prompt)
         else:
             # 模拟模式
             text = self._generate_mock_design_response(requirement)
         
+        return self._finalize_design(text, requirement)
+    
+    async def generate_design_solution_async(self, requirement: str, use_context: bool = True,
+                                             score: bool = True, timestamp: Optional[str] = None) -> Optional[Dict]:
+        """generate_design_solution 的异步版本（使用 Gemini 异步接口）；score、timestamp 同 generate_qa_pair_async"""
+        if self.llm_available:
+            prompt = self._build_design_prompt(requirement, use_context)
+            text = await self._acall_llm(prompt)
+        else:
+            text = self._generate_mock_design_response(requirement)
+        
+        return self._finalize_design(text, requirement, score, timestamp)
+    
+    def _build_design_prompt(self, requirement: str, use_context: bool) -> str:
+        """构建设计方案生成提示词"""
+        parts = []
+        if use_context and self.context_enabled:
+            structure = self.analyzer.analyze_project_structure()
+            parts.append(_DESIGN_CONTEXT_TEMPLATE.format(
+                project_name=structure['project_name'],
+                total_files=structure['total_files'],
+                core_modules=', '.join(structure['core_modules'][:5])
+            ))
+        
+        parts.append(_DESIGN_TEMPLATE.format(requirement=requirement))
+        return "".join(parts)
+    
+    def _finalize_design(self, text: Optional[str], requirement: str, score: bool = True,
+                         timestamp: Optional[str] = None) -> Optional[Dict]:
+        """解析设计方案响应并补充元数据与质量评分"""
+        if text is None:
+            return None
+        
         # 解析响应
         parsed = self._parse_design_response(text, requirement)
         if parsed:
             parsed['metadata'] = {
                 'model': self.model,
                 'temperature': self.temperature,
-                'timestamp': datetime.now().isoformat()
+                'timestamp': timestamp or datetime.now().isoformat()
             }
             # 计算质量评分
-            parsed['quality_score'] = self._calculate_design_quality_score(parsed)
+            if score:
+                parsed['quality_score'] = self._calculate_design_quality_score(parsed)
         
         return parsed
     
-    def generate_batch(self, num_qa: int = 5, num_design: int = 3, use_context: bool = True, context_level: str = 'standard') -> Dict:
-        """批量生成训练数据"""
+    def _cache_key(self, prompt: str, json_mode: bool) -> str:
+        """响应缓存键"""
+        request = dict(model=self.model, temperature=self.temperature, prompt=prompt, json_mode=json_mode)
+        if self.cache_seed is not None:
+            request['cache_seed'] = self.cache_seed
+        return make_cache_key(**request)
+    
+    def _call_llm(self, prompt: str, json_mode: bool = False,
+                  required_marker: Optional[str] = None) -> Optional[str]:
+        """调用 LLM（优先命中响应缓存），失败时返回 None
+        
+        指定 required_marker 时以流式请求，输出开头一段内未出现该标记即视为格式错误并中止
+        """
+        if self.cache is None:
+            return self._request_llm(prompt, json_mode, required_marker)
+        
+        key = self._cache_key(prompt, json_mode)
+        text = self.cache.get(key)
+        if text is None:
+            text = self._request_llm(prompt, json_mode, required_marker)
+            if text is not None:
+                self.cache.put(key, text)
+        return text
+    
+    async def _acall_llm(self, prompt: str, json_mode: bool = False,
+                         required_marker: Optional[str] = None) -> Optional[str]:
+        """异步调用 LLM（优先命中响应缓存），失败时返回 None；required_marker 见 _call_llm"""
+        if self.cache is None:
+            return await self._arequest_llm(prompt, json_mode, required_marker)
+        
+        key = self._cache_key(prompt, json_mode)
+        text = self.cache.get(key)
+        if text is None:
+            text = await self._arequest_llm(prompt, json_mode, required_marker)
+            if text is not None:
+                self.cache.put(key, text)
+        return text
+    
+    def _request_llm(self, prompt: str, json_mode: bool = False,
+                     required_marker: Optional[str] = None) -> Optional[str]:
+        """请求 LLM，临时性错误按指数退避重试，最终失败时返回 None"""
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                return self._request_text(prompt, json_mode, required_marker)
+            except Exception as e:
+                if attempt == MAX_ATTEMPTS - 1 or not self._is_retriable(e):
+                    print(f"❌ LLM调用失败: {e}")
+                    return None
+                delay = backoff_delay(e, attempt, RETRY_BASE_DELAY, 2.0)
+                print(f"⚠️  LLM调用失败（第{attempt + 1}次），{delay:.1f}秒后重试: {str(e)[:100]}")
+                time.sleep(delay)
+        return None
+    
+    def _request_text(self, prompt: str, json_mode: bool, required_marker: Optional[str]) -> Optional[str]:
+        """通过 SDK 同步请求一次"""
+        if required_marker is not None:
+            response = self.llm.generate_content(prompt, stream=True)
+            return self._read_stream((chunk.text for chunk in response), required_marker)
+        if json_mode:
+            response = self.llm.generate_content(
+                prompt, generation_config={"response_mime_type": "application/json"}
+            )
+        else:
+            response = self.llm.generate_content(prompt)
+        return response.text
+    
+    async def _arequest_llm(self, prompt: str, json_mode: bool = False,
+                            required_marker: Optional[str] = None) -> Optional[str]:
+        """异步请求 LLM（每次尝试超时 REQUEST_TIMEOUT 秒），临时性错误按指数退避重试，最终失败时返回 None
+        
+        有共享的 aiohttp 会话时直接请求 REST 接口，否则使用 SDK 的异步接口
+        """
+        for attempt in range(MAX_ATTEMPTS):
+            if self._request_bucket is not None:
+                await self._request_bucket.acquire()
+            try:
+                return await asyncio.wait_for(
+                    self._arequest_text(prompt, json_mode, required_marker), timeout=REQUEST_TIMEOUT
+                )
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError) and not str(e):
+                    e = TimeoutError(f"超时（{REQUEST_TIMEOUT}秒）")
+                if attempt == MAX_ATTEMPTS - 1 or not self._is_retriable(e):
+                    print(f"❌ LLM调用失败: {e}")
+                    return None
+                delay = backoff_delay(e, attempt, RETRY_BASE_DELAY, 2.0)
+                print(f"⚠️  LLM调用失败（第{attempt + 1}次），{delay:.1f}秒后重试: {str(e)[:100]}")
+                await asyncio.sleep(delay)
+        return None
+    
+    @staticmethod
+    def _is_retriable(error: Exception) -> bool:
+        """是否为值得重试的临时性错误（限流、超时、连接问题、服务端 5xx）"""
+        if isinstance(error, (TimeoutError, ConnectionError)):
+            return True
+        if google_exceptions is not None and isinstance(error, (
+            google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted,
+            google_exceptions.ServiceUnavailable, google_exceptions.InternalServerError,
+            google_exceptions.DeadlineExceeded
+        )):
+            return True
+        if aiohttp is not None:
+            if isinstance(error, aiohttp.ClientResponseError):
+                return error.status == 429 or error.status >= 500
+            if isinstance(error, aiohttp.ClientConnectionError):
+                return True
+        return False
+    
+    async def _arequest_text(self, prompt: str, json_mode: bool, required_marker: Optional[str]) -> Optional[str]:
+        """按传输方式与是否流式分派请求"""
+        if self._session is not None:
+            if required_marker is not None:
+                return await self._aread_stream(self._post_stream_generate_content(prompt), required_marker)
+            return await self._post_generate_content(prompt, json_mode)
+        
+        if required_marker is not None:
+            response = await self.llm.generate_content_async(prompt, stream=True)
+            return await self._aread_stream((chunk.text async for chunk in response), required_marker)
+        if json_mode:
+            response = await self.llm.generate_content_async(
+                prompt, generation_config={"response_mime_type": "application/json"}
+            )
+        else:
+            response = await self.llm.generate_content_async(prompt)
+        return response.text
+    
+    @staticmethod
+    def _read_stream(chunks, required_marker: str) -> Optional[str]:
+        """拼接流式输出；开头 STREAM_MARKER_WINDOW 个字符内没有 required_marker 时中止并返回 None"""
+        parts = []
+        check = _StreamMarkerCheck(required_marker)
+        for chunk in chunks:
+            parts.append(chunk)
+            if check.feed(chunk):
+                print(f"⚠️  响应格式不符（未出现 {required_marker}），已提前中止")
+                return None
+        return "".join(parts)
+    
+    @staticmethod
+    async def _aread_stream(chunks, required_marker: str) -> Optional[str]:
+        """_read_stream 的异步版本（中止时关闭流）"""
+        parts = []
+        check = _StreamMarkerCheck(required_marker)
+        async with contextlib.aclosing(chunks) as stream:
+            async for chunk in stream:
+                parts.append(chunk)
+                if check.feed(chunk):
+                    print(f"⚠️  响应格式不符（未出现 {required_marker}），已提前中止")
+                    return None
+        return "".join(parts)
+    
+    async def _post_stream_generate_content(self, prompt: str):
+        """通过共享会话调用 streamGenerateContent（SSE），逐块产出文本"""
+        payload = {
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {"temperature": self.temperature}
+        }
+        async with self._session.post(
+            GEMINI_API_URL.format(model=self.model, method="streamGenerateContent"),
+            params={"alt": "sse"},
+            json=payload,
+            headers={"x-goog-api-key": self.api_key}
+        ) as response:
+            response.raise_for_status()
+            async for line in response.content:
+                if not line.startswith(b"data:"):
+                    continue
+                data = _json_loads(line[len(b"data:"):])
+                for candidate in data.get("candidates", [])[:1]:
+                    for part in candidate.get("content", {}).get("parts", []):
+                        yield part.get("text", "")
+    
+    async def _post_generate_content(self, prompt: str, json_mode: bool = False) -> str:
+        """通过共享会话调用 generateContent，返回拼接后的文本"""
+        generation_config = {"temperature": self.temperature}
+        if json_mode:
+            generation_config["responseMimeType"] = "application/json"
+        payload = {
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": generation_config
+        }
+        async with self._session.post(
+            GEMINI_API_URL.format(model=self.model, method="generateContent"),
+            json=payload,
+            headers={"x-goog-api-key": self.api_key}
+        ) as response:
+            response.raise_for_status()
+            data = await response.json()
+        
+        parts = data["candidates"][0]["content"]["parts"]
+        return "".join(part.get("text", "") for part in parts)
+    
+    def _make_session(self):
+        """创建连接池化的 aiohttp 会话；未安装 aiohttp 时返回 None"""
+        if aiohttp is None:
+            return None
+        # 所有请求都发往同一主机，连接数与并发上限一致即可；DNS 结果在整批内复用。
+        # 流式长响应单行可能超过默认的 64 KB 读缓冲，放大到 4 MB 避免反压
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.max_concurrency, limit_per_host=self.max_concurrency, ttl_dns_cache=300
+            ),
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT, sock_connect=10),
+            read_bufsize=4 * 1024 * 1024
+        )
+    
+    async def aclose(self):
+        """关闭共享的 aiohttp 会话（需在事件循环结束前调用）"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+    
+    def generate_batch(self, num_qa: int = 5, num_design: int = 3, use_context: bool = True, context_level: str = 'standard',
+                       journal_path: Optional[str] = None) -> Dict:
+        """批量生成训练数据（内部并发调用 LLM，见 generate_batch_async）"""
+        coro = self.generate_batch_async(num_qa, num_design, use_context, context_level, journal_path)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)
+        
+        # 已处于事件循环中（如 Jupyter），在独立线程中运行
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, coro).result()
+    
+    async def generate_batch_async(self, num_qa: int = 5, num_design: int = 3, use_context: bool = True,
+                                   context_level: str = 'standard', journal_path: Optional[str] = None) -> Dict:
+        """批量生成训练数据：所有问答对与设计方案请求并发发出（最多 max_concurrency 个同时进行）
+        
+        指定 journal_path 时，每个样本完成即追加一行到该 JSONL 文件，中途失败也不会丢失已生成的样本
+        """
         print("="*70)
         print("🚀 开始生成训练数据")
         print("="*70)
         
+        # 整批样本共用一个时间戳（与数据集的 generation_time 一致，可据此识别所属批次）
+        batch_timestamp = datetime.now().isoformat()
         dataset = {
             'qa_pairs': [],
             'design_solutions': [],
             'metadata': {
                 'project': str(self.project_path),
-                'generation_time': datetime.now().isoformat(),
+                'generation_time': batch_timestamp,
                 'model': self.model,
                 'context_enabled': use_context and self.context_enabled
             }
@@ -335,44 +858,118 @@ Challenges:
         files = self.discover_python_files()
         print(f"   找到 {len(files)} 个文件")
         
-        # 生成问答对
+        # 预先并发读取各文件的依赖与函数信息，后续构建上下文直接命中缓存
+        if num_qa > 0 and self.llm_available and use_context and self.context_enabled and context_level != 'minimal':
+            self.analyzer.prewarm([str(f.relative_to(self.project_path)) for f in files])
+        
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        journal = None
+        
+        async def limited(coro, kind: str):
+            async with semaphore:
+                result = await coro
+            if journal is not None:
+                self._append_journal(journal, kind, result)
+            return result
+        
+        # 准备问答对任务
+        snippets = []
+        level_name = {
+            'minimal': '代码实现层',
+            'standard': '模块设计层',
+            'full': '系统架构层'
+        }.get(context_level, context_level)
         if num_qa > 0:
-            level_name = {
-                'minimal': '代码实现层',
-                'standard': '模块设计层',
-                'full': '系统架构层'
-            }.get(context_level, context_level)
             print(f"\n📝 生成 {num_qa} 个问答对（{level_name}）...")
-            for i in range(num_qa):
-                file = random.choice(files)
+            for i, file in enumerate(self._pick_files(files, num_qa)):
                 rel_path = file.relative_to(self.project_path)
                 code = self.extract_code_snippet(file)
                 
                 print(f"   [{i+1}/{num_qa}] 处理文件: {rel_path}")
-                
-                qa = self.generate_qa_pair(code, str(rel_path), use_context, context_level)
-                if qa:
-                    dataset['qa_pairs'].append(qa)
-                    print(f"       ✅ 成功（{level_name}）")
-                else:
-                    print(f"       ❌ 失败")
-        
-        # 生成设计方案
+                snippets.append((code, str(rel_path)))
+        
+        # 每 qa_batch_size 个片段打包为一次调用
+        if self.qa_batch_size > 1:
+            qa_tasks = [
+                self.generate_qa_pairs_marshaled_async(snippets[i:i + self.qa_batch_size], use_context, context_level,
+                                                       score=False, timestamp=batch_timestamp)
+                for i in range(0, len(snippets), self.qa_batch_size)
+            ]
+        else:
+            qa_tasks = [
+                self.generate_qa_pair_async(code, path, use_context, context_level, score=False,
+                                            timestamp=batch_timestamp)
+                for code, path in snippets
+            ]
+        
+        # 准备设计方案任务
+        requirements = []
         if num_design > 0:
             print(f"\n🏗️  生成 {num_design} 个设计方案...")
             
             # 动态生成多样化需求
-            requirements = self._generate_diverse_requirements(num_design, files)
+            requirements = self._generate_diverse_requirements(num_design, files)[:num_design]
             
-            for i, req in enumerate(requirements[:num_design]):
+            for i, req in enumerate(requirements):
                 print(f"   [{i+1}/{num_design}] 需求: {req[:50]}...")
-                
-                design = self.generate_design_solution(req, use_context)
-                if design:
-                    dataset['design_solutions'].append(design)
-                    print(f"       ✅ 成功")
-                else:
-                    print(f"       ❌ 失败")
+        design_tasks = [
+            self.generate_design_solution_async(req, use_context, score=False, timestamp=batch_timestamp)
+            for req in requirements
+        ]
+        
+        # 所有请求并发发出，整个批次复用同一个连接池
+        print(f"\n⏳ 并发请求中（最多 {self.max_concurrency} 个同时进行）...")
+        if self.llm_available and self._session is None:
+            self._session = self._make_session()
+        if journal_path:
+            Path(journal_path).parent.mkdir(parents=True, exist_ok=True)
+            journal = open(journal_path, 'ab')
+        try:
+            results = await asyncio.gather(
+                *[limited(task, 'qa_pair') for task in qa_tasks],
+                *[limited(task, 'design_solution') for task in design_tasks],
+                return_exceptions=True
+            )
+        finally:
+            await self.aclose()
+            if journal is not None:
+                journal.close()
+        
+        # 展开为逐个片段的结果（打包调用返回列表）
+        qa_results = []
+        for task_index, result in enumerate(results[:len(qa_tasks)]):
+            group_size = min(self.qa_batch_size, len(snippets) - task_index * self.qa_batch_size)
+            if isinstance(result, Exception):
+                qa_results.extend([result] * group_size)
+            elif self.qa_batch_size > 1:
+                qa_results.extend(result)
+            else:
+                qa_results.append(result)
+        
+        for i, qa in enumerate(qa_results):
+            if isinstance(qa, Exception):
+                print(f"   ❌ 问答对 {i+1} 失败: {qa}")
+            elif qa:
+                dataset['qa_pairs'].append(qa)
+            else:
+                print(f"   ❌ 问答对 {i+1} 失败")
+        
+        for i, design in enumerate(results[len(qa_tasks):]):
+            if isinstance(design, Exception):
+                print(f"   ❌ 设计方案 {i+1} 失败: {design}")
+            elif design:
+                dataset['design_solutions'].append(design)
+            else:
+                print(f"   ❌ 设计方案 {i+1} 失败")
+        
+        # 整批统一计算质量评分
+        if dataset['qa_pairs']:
+            for qa, quality_score in zip(dataset['qa_pairs'], self._score_qa_batch(dataset['qa_pairs'])):
+                qa['quality_score'] = quality_score
+        if dataset['design_solutions']:
+            designs = dataset['design_solutions']
+            for design, quality_score in zip(designs, self._score_design_batch(designs)):
+                design['quality_score'] = quality_score
         
         # 统计
         print("\n" + "="*70)
@@ -384,6 +981,16 @@ Challenges:
         
         return dataset
     
+    def _append_journal(self, journal, kind: str, result):
+        """把一个任务的结果（单个样本或打包生成的样本列表）逐行写入 JSONL 并立即落盘"""
+        items = result if isinstance(result, list) else [result]
+        score = self._calculate_qa_quality_score if kind == 'qa_pair' else self._calculate_design_quality_score
+        for item in items:
+            if item:
+                record = {'type': kind, **item, 'quality_score': score(item)}
+                journal.write(_dumps_line(record))
+        journal.flush()
+    
     def save_dataset(self, dataset: Dict, output_path: str):
         """
         保存数据集
@@ -395,62 +1002,29 @@ Challenges:
         output_file = Path(output_path)
         output_file.parent.mkdir(parents=True, exist_ok=True)
         
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(dataset, f, ensure_ascii=False, indent=2)
+        # 先写临时文件再原子替换，写到一半中断不会破坏已有的输出
+        tmp_file = output_file.with_name(output_file.name + '.tmp')
+        if orjson is not None:
+            tmp_file.write_bytes(orjson.dumps(dataset, option=orjson.OPT_INDENT_2))
+        else:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(dataset, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, output_file)
         
         print(f"\n💾 数据已保存: {output_file}")
         print(f"   文件大小: {output_file.stat().st_size / 1024:.1f} KB")
     
     def _generate_diverse_requirements(self, num_requirements: int, files: List[Path]) -> List[str]:
-        """基于项目上下文动态生成多样化需求"""
-        templates = [
-            "为{module}添加{feature}功能",
-            "优化{module}的{aspect}性能",
-            "重构{module}以支持{capability}",
-            "在{module}中实现{pattern}设计模式",
-            "为{module}添加{quality}保障机制",
-            "扩展{module}以支持{scenario}场景",
-            "改进{module}的{attribute}体验",
-            "集成{technology}到{module}中"
-        ]
-        
-        features = ["批量处理", "异步处理", "缓存", "数据验证", "错误处理", "监控告警", "配置管理", "插件系统"]
-        aspects = ["查询效率", "内存使用", "响应时间", "并发能力", "扩展性", "可维护性"]
-        capabilities = ["多租户", "国际化", "版本控制", "热更新", "灰度发布", "降级熔断"]
-        patterns = ["工厂模式", "策略模式", "观察者模式", "责任链模式", "装饰器模式", "适配器模式"]
-        qualities = ["单元测试", "集成测试", "日志记录", "性能监控", "安全审计", "容错恢复"]
-        scenarios = ["高并发", "大数据量", "弱网环境", "跨平台", "微服务", "边缘计算"]
-        attributes = ["用户", "开发者", "运维", "安全", "性能"]
-        technologies = ["Redis", "Kafka", "Elasticsearch", "GraphQL", "gRPC", "Docker"]
-        
-        modules = list(set([f.stem for f in files[:10]]))
+        """基于项目上下文动态生成多样化需求（从 需求模式 × 模块 中不重复地抽样）"""
+        modules = list(dict.fromkeys(f.stem for f in files[:10]))
         if not modules:
             modules = ["核心模块", "数据层", "服务层", "API层"]
         
+        total = len(_REQUIREMENT_PATTERNS) * len(modules)
         requirements = []
-        used_combinations = set()
-        
-        for _ in range(num_requirements * 3):
-            template = random.choice(templates)
-            module = random.choice(modules)
-            
-            req = template.format(
-                module=module,
-                feature=random.choice(features),
-                aspect=random.choice(aspects),
-                capability=random.choice(capabilities),
-                pattern=random.choice(patterns),
-                quality=random.choice(qualities),
-                scenario=random.choice(scenarios),
-                attribute=random.choice(attributes),
-                technology=random.choice(technologies)
-            )
-            
-            if req not in used_combinations:
-                requirements.append(req)
-                used_combinations.add(req)
-                if len(requirements) >= num_requirements:
-                    break
+        for index in random.sample(range(total), min(num_requirements, total)):
+            pattern_index, module_index = divmod(index, len(modules))
+            requirements.append(_REQUIREMENT_PATTERNS[pattern_index].format(module=modules[module_index]))
         
         return requirements if requirements else [
             "优化系统架构，提升整体性能和可扩展性",
@@ -461,9 +1035,9 @@ Challenges:
     def _parse_qa_response(self, text: str) -> Optional[Dict]:
         """解析问答响应"""
         try:
-            question_match = re.search(r'Question:\s*(.+?)(?=\n\nAnswer:|\nAnswer:)', text, re.DOTALL)
-            answer_match = re.search(r'Answer:\s*(.+?)(?=\n\nReasoning|$)', text, re.DOTALL)
-            reasoning_match = re.findall(r'\d+\.\s*(.+?)(?=\n\d+\.|\n\n|$)', text, re.DOTALL)
+            question_match = _QUESTION_RE.search(text)
+            answer_match = _ANSWER_RE.search(text)
+            reasoning_match = _NUMBERED_RE.findall(text)
             if question_match and answer_match:
                 return {
                     'question': question_match.group(1).strip(),
@@ -474,13 +1048,34 @@ Challenges:
             pass
         return None
     
+    def _parse_qa_batch_response(self, text: str, count: int) -> List[Optional[Dict]]:
+        """解析批量问答响应（JSON 数组），返回长度为 count 的列表"""
+        parsed_list = [None] * count
+        try:
+            # 兼容被 ```json 代码块包裹的输出
+            text = _CODE_FENCE_RE.sub('', text)
+            items = _json_loads(text)
+            if isinstance(items, dict):
+                items = items.get('qa_pairs', [])
+            for i, item in enumerate(items[:count]):
+                if isinstance(item, dict) and item.get('question') and item.get('answer'):
+                    steps = item.get('reasoning_steps') or []
+                    parsed_list[i] = {
+                        'question': str(item['question']).strip(),
+                        'answer': str(item['answer']).strip(),
+                        'reasoning_steps': [str(step).strip() for step in steps] if isinstance(steps, list) else []
+                    }
+        except (ValueError, TypeError, KeyError, AttributeError):
+            pass
+        return parsed_list
+    
     def _parse_design_response(self, text: str, requirement: str) -> Optional[Dict]:
         """解析设计方案响应"""
         try:
-            solution_match = re.search(r'Solution:\s*(.+?)(?=\n\nImplementation|\nImplementation)', text, re.DOTALL)
-            steps_match = re.findall(r'\d+\.\s*(.+?)(?=\n\d+\.|\n\n|$)', text, re.DOTALL)
-            files_match = re.findall(r'-\s*([^:]+):\s*(.+?)(?=\n-|\n\n|$)', text, re.DOTALL)
-            challenges_match = re.findall(r'-\s*(.+?)(?=\n-|\n\n|$)', text.split('Challenges:')[-1] if 'Challenges:' in text else '', re.DOTALL)
+            solution_match = _SOLUTION_RE.search(text)
+            steps_match = _NUMBERED_RE.findall(text)
+            files_match = _FILE_RE.findall(text)
+            challenges_match = _BULLET_RE.findall(text.split('Challenges:')[-1] if 'Challenges:' in text else '')
             if solution_match:
                 return {
                     'requirement': requirement,
@@ -532,6 +1127,13 @@ Reasoning Steps:
         }
         return mock_templates.get(context_level, mock_templates['standard'])
     
+    def _generate_mock_batch_response(self, snippets: List[Tuple[str, str]], context_level: str = 'standard') -> str:
+        """生成模拟批量响应（JSON 数组）"""
+        return json.dumps([
+            self._parse_qa_response(self._generate_mock_response(code, file_path, context_level))
+            for code, file_path in snippets
+        ], ensure_ascii=False)
+    
     def _generate_mock_design_response(self, requirement: str) -> str:
         """生成模拟设计响应"""
         return f"""
@@ -560,7 +1162,9 @@ Challenges:
 
 def quick_generate(project_path: str, num_qa: int = 5, num_design: int = 3, 
                   output_path: str = "output/training_data.json", use_context: bool = True,
-                  context_level: str = 'standard') -> Dict:
+                  context_level: str = 'standard',
+                  cache_path: Optional[str] = "data/cache/llm_cache.sqlite",
+                  cache_seed: Optional[int] = None) -> Dict:
     """快速生成训练数据
     
     Args:
@@ -570,8 +1174,14 @@ def quick_generate(project_path: str, num_qa: int = 5, num_design: int = 3,
         output_path: 输出文件路径
         use_context: 是否使用上下文
         context_level: 上下文级别 ('minimal'/'standard'/'full')
+        cache_path: LLM 响应缓存路径（None 则禁用）
+        cache_seed: 缓存种子；temperature > 0 时仅在指定后才启用缓存（用于中断后续跑）
+    
+    生成过程中每个样本完成即追加到 <output_path>.partial.jsonl，正常保存后删除
     """
-    generator = SimpleGenerator(project_path)
-    dataset = generator.generate_batch(num_qa, num_design, use_context, context_level)
+    generator = SimpleGenerator(project_path, cache_path=cache_path, cache_seed=cache_seed)
+    journal_path = output_path + '.partial.jsonl'
+    dataset = generator.generate_batch(num_qa, num_design, use_context, context_level, journal_path)
     generator.save_dataset(dataset, output_path)
+    Path(journal_path).unlink(missing_ok=True)
     return dataset
@@ -0,0 +1,26 @@
+"""
+Token Budget
+Approximate token accounting for fitting prompt context into a fixed budget
+"""
+
+# Average characters per token for code and English prose across the supported
+# providers' tokenizers; close enough for budgeting without a provider tokenizer
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate number of tokens in text"""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens, ending on a line boundary when possible"""
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+
+    cut = text.rfind('\n', 0, limit + 1)
+    # Only back up to a newline if that keeps most of the budget
+    if cut < limit // 2:
+        cut = limit
+    return text[:cut].rstrip()
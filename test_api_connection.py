@@ -4,6 +4,7 @@ API连接测试脚本 - 验证LLM服务是否可用
 """
 import os
 import sys
+import asyncio
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -13,12 +14,13 @@ sys.path.insert(0, str(Path(__file__).parent))
 from src.llm_service import LLMService
 
 
-def test_api_connection(provider: str, model: str):
-    """测试API连接"""
+async def test_api_connection(provider: str, model: str):
+    """测试API连接（三个测试请求并发发出，共用服务的连接池）"""
     print("="*70)
     print(f"🔍 测试 {provider.upper()} API 连接")
     print("="*70)
     
+    llm_service = None
     try:
         # 初始化服务
         print(f"\n1️⃣  初始化 LLM 服务...")
@@ -30,35 +32,44 @@ def test_api_connection(provider: str, model: str):
         print(f"   ✅ 服务初始化成功")
         print(f"   📦 模型: {model}")
         
-        # 简单测试
-        print(f"\n2️⃣  测试 1: 简单文本生成...")
-        response1 = llm_service.generate_completion(
-            prompt="Return only the word 'HELLO'",
-            max_tokens=10
-        )
-        print(f"   ✅ 响应: {response1.strip()}")
-        
-        # JSON模式测试
-        print(f"\n3️⃣  测试 2: JSON响应...")
-        response2 = llm_service.generate_completion(
-            prompt='Generate a JSON object with keys "status" and "message". Set status to "ok" and message to "API working".',
-            max_tokens=100,
-            json_mode=True
-        )
-        print(f"   ✅ 响应: {response2.strip()[:100]}")
-        
-        # 代码理解测试
-        print(f"\n4️⃣  测试 3: 代码理解能力...")
         code_test = '''
 def fibonacci(n):
     if n <= 1:
         return n
     return fibonacci(n-1) + fibonacci(n-2)
 '''
-        response3 = llm_service.generate_completion(
-            prompt=f"Explain this Python function in one sentence:\n{code_test}",
-            max_tokens=100
+        print(f"\n⏳ 并发发送 3 个测试请求...")
+        responses = await asyncio.gather(
+            # 简单测试
+            llm_service.agenerate_completion(
+                prompt="Return only the word 'HELLO'",
+                max_tokens=10
+            ),
+            # JSON模式测试
+            llm_service.agenerate_completion(
+                prompt='Generate a JSON object with keys "status" and "message". Set status to "ok" and message to "API working".',
+                max_tokens=100,
+                json_mode=True
+            ),
+            # 代码理解测试
+            llm_service.agenerate_completion(
+                prompt=f"Explain this Python function in one sentence:\n{code_test}",
+                max_tokens=100
+            ),
+            return_exceptions=True
         )
+        for response in responses:
+            if isinstance(response, Exception):
+                raise response
+        response1, response2, response3 = responses
+        
+        print(f"\n2️⃣  测试 1: 简单文本生成...")
+        print(f"   ✅ 响应: {response1.strip()}")
+        
+        print(f"\n3️⃣  测试 2: JSON响应...")
+        print(f"   ✅ 响应: {response2.strip()[:100]}")
+        
+        print(f"\n4️⃣  测试 3: 代码理解能力...")
         print(f"   ✅ 响应: {response3.strip()[:150]}...")
         
         print("\n" + "="*70)
@@ -95,6 +106,10 @@ def fibonacci(n):
                 print(f"   ❌ API密钥未设置")
         
         return False
+    
+    finally:
+        if llm_service is not None:
+            await llm_service.aclose()
 
 
 def main():
@@ -116,7 +131,7 @@ def main():
     results = {}
     for provider, model in test_configs:
         print("\n")
-        success = test_api_connection(provider, model)
+        success = asyncio.run(test_api_connection(provider, model))
         results[provider] = success
         print("\n")
     